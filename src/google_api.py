@@ -1,24 +1,50 @@
+import asyncio
+import fcntl
+import json
 import logging
 import os
 import re
+import tempfile
+import threading
 import time
 import socket
+from collections import OrderedDict
+from datetime import datetime
+from zoneinfo import ZoneInfo
 
+from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from googleapiclient.discovery import build
 from googleapiclient.discovery_cache.base import Cache
 from googleapiclient.errors import HttpError
 import ssl
 
-from rest_framework.exceptions import ValidationError
+from yt_ids import parse_yt_url, get_yt_document_id
 
 api_key = os.getenv("YT_API_KEY")
 
 YOUTUBE = None
+# videos.list accepts at most 50 comma separated ids per request
+MAX_IDS_PER_REQUEST = 50
 MAX_RETRIES = 3
 TIMEOUT = 5  # seconds
 BACKOFF_FACTOR = 2
 
+# YouTube Data API quota, every videos.list call costs 1 unit regardless of the number of ids
+DAILY_QUOTA = int(os.getenv("YT_DAILY_QUOTA", 10000))
+# units kept in reserve, once only these are left the client serves cached data
+QUOTA_RESERVE = int(os.getenv("YT_QUOTA_RESERVE", 500))
+QUOTA_STATE_FILE = os.getenv("YT_QUOTA_STATE_FILE",
+                             os.path.join(tempfile.gettempdir(), "lolstreamers-yt-quota.json"))
+VIDEOS_LIST_COST = 1
+# how long cached parts are served without asking YouTube again (seconds)
+PART_CACHE_TTL = {
+    'snippet': 24 * 60 * 60,
+    'statistics': 60 * 60,
+}
+VIDEO_CACHE_SIZE = 5000
+VIDEOS_LIST_URL = "https://www.googleapis.com/youtube/v3/videos"
+
 logger = logging.getLogger(__name__)
 
 
@@ -106,12 +132,266 @@ class YoutubeVideoInformation:
             raise ValueError("No video information available")
 
         self._data = data['items'][0]
-        self.title = self._data['snippet']['title']
-        self.description = self._data['snippet']['description']
-        self.views = self._data['statistics']['viewCount']
-        self.likes = self._data['statistics']['likeCount']
-        self.published_at = self._data['snippet']['publishedAt']
-        self.channel = self._data['snippet']['channelTitle']
+        snippet = self._data.get('snippet', {})
+        statistics = self._data.get('statistics', {})
+        self.title = snippet.get('title')
+        self.description = snippet.get('description')
+        self.views = statistics.get('viewCount', '0')
+        self.likes = statistics.get('likeCount', '0')
+        self.published_at = snippet.get('publishedAt')
+        self.channel = snippet.get('channelTitle')
+
+    @classmethod
+    def unavailable(cls, reason) -> "YoutubeVideoInformation":
+        return cls({
+            'items': [{
+                'snippet': {
+                    'title': 'Unavailable',
+                    'description': f'Video information unavailable: {str(reason)}',
+                    'publishedAt': None,
+                    'channelTitle': 'Unknown'
+                },
+                'statistics': {
+                    'viewCount': '0',
+                    'likeCount': '0'
+                }
+            }]
+        })
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class QuotaTracker:
+    """
+    Tracks the YouTube quota units spent per day.
+
+    The state is kept in a small json file guarded by a file lock, so all gunicorn workers
+    and the management commands share one counter. Processes in different containers only
+    share it if YT_QUOTA_STATE_FILE is on a volume mounted in all of them (see
+    docker-compose). YouTube resets the quota at midnight Pacific time, so the day is
+    counted in that timezone.
+    """
+
+    def __init__(self, daily_quota=DAILY_QUOTA, reserve=QUOTA_RESERVE, state_file=QUOTA_STATE_FILE):
+        self.daily_quota = daily_quota
+        self.reserve = reserve
+        self.state_file = state_file
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(ZoneInfo("America/Los_Angeles")).date().isoformat()
+
+    def _update(self, units=0) -> int:
+        """add units to today's counter and return the units spent today"""
+        with open(self.state_file, "a+") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read() or "{}")
+                except ValueError:
+                    state = {}
+                if state.get("day") != self._today():
+                    state = {"day": self._today(), "units": 0}
+                if units:
+                    state["units"] += units
+                    state_file.seek(0)
+                    state_file.truncate()
+                    state_file.write(json.dumps(state))
+                    state_file.flush()
+                return state["units"]
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+
+    @property
+    def spent(self) -> int:
+        return self._update()
+
+    @property
+    def remaining(self) -> int:
+        return self.daily_quota - self.spent
+
+    def can_spend(self, units) -> bool:
+        return self.remaining - units >= self.reserve
+
+    def spend(self, units):
+        spent = self._update(units)
+        logger.debug(f"YouTube quota spent today: {spent}/{self.daily_quota}")
+
+
+class YoutubeClient:
+    """
+    Batched access to videos.list.
+
+    Ids are collected into requests of up to MAX_IDS_PER_REQUEST ids and only the requested
+    parts are fetched. Every part of a video is cached in memory for PART_CACHE_TTL seconds.
+    When the daily quota is nearly used up, no more requests are made and the cached data
+    is served even if it is outdated.
+    """
+
+    def __init__(self, quota: QuotaTracker | None = None, cache_size=VIDEO_CACHE_SIZE):
+        self.quota = quota or QuotaTracker()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (video_id, part) -> (fetched_at, data)
+        self._lock = threading.Lock()
+
+    def _get_cached(self, video_id, part, fresh_only=True):
+        with self._lock:
+            entry = self._cache.get((video_id, part))
+            if entry is None:
+                return None
+            self._cache.move_to_end((video_id, part))
+        fetched_at, data = entry
+        if fresh_only and time.monotonic() - fetched_at > PART_CACHE_TTL.get(part, 0):
+            return None
+        return data
+
+    def _set_cached(self, video_id, part, data):
+        with self._lock:
+            self._cache[(video_id, part)] = (time.monotonic(), data)
+            self._cache.move_to_end((video_id, part))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _execute(self, video_ids: list[str], parts: tuple[str, ...]) -> dict:
+        last_exception = None
+        for retry_count in range(1, MAX_RETRIES + 1):
+            self._spend_quota()
+            try:
+                # Set timeout for this request
+                socket.setdefaulttimeout(TIMEOUT)
+                request = get_yt_connection().videos().list(
+                    part=",".join(parts),
+                    id=",".join(video_ids),
+                    maxResults=MAX_IDS_PER_REQUEST
+                )
+                response = request.execute()
+                logger.debug(f"Video information response: {response}")
+                return response
+            except (ssl.SSLError, TimeoutError, HttpError) as e:
+                logger.error(f"Error fetching video information: {str(e)}")
+                last_exception = e
+                if retry_count < MAX_RETRIES:
+                    # Exponential backoff
+                    time.sleep(BACKOFF_FACTOR ** retry_count)
+        raise last_exception
+
+    def _spend_quota(self) -> None:
+        """
+        spend the units of one videos.list call
+
+        :raises QuotaExceeded: if only the reserve is left
+        """
+        if not self.quota.can_spend(VIDEOS_LIST_COST):
+            raise QuotaExceeded(f"YouTube quota nearly used up ({self.quota.remaining} units left)")
+        self.quota.spend(VIDEOS_LIST_COST)
+
+    async def _aexecute(self, video_ids: list[str], parts: tuple[str, ...]) -> dict:
+        import aiohttp
+        from lolstreamsearch.api.async_http import get_session
+
+        if api_key is None:
+            raise ValueError("YouTube API key is missing")
+        last_exception = None
+        for retry_count in range(1, MAX_RETRIES + 1):
+            # the quota state file is locked by the other workers as well, wait for it in a thread
+            await asyncio.to_thread(self._spend_quota)
+            try:
+                session = get_session("youtube", timeout=(TIMEOUT, TIMEOUT))
+                async with session.get(VIDEOS_LIST_URL, params={
+                    'part': ",".join(parts),
+                    'id': ",".join(video_ids),
+                    'maxResults': MAX_IDS_PER_REQUEST,
+                    'key': api_key,
+                }) as response:
+                    response.raise_for_status()
+                    return await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Error fetching video information: {str(e)}")
+                last_exception = e
+                if retry_count < MAX_RETRIES:
+                    await asyncio.sleep(BACKOFF_FACTOR ** retry_count)
+        raise last_exception
+
+    def _get_missing(self, unique_ids: list[str], parts: tuple[str, ...]) -> list[str]:
+        return [video_id for video_id in unique_ids
+                if any(self._get_cached(video_id, part) is None for part in parts)]
+
+    def _store_response(self, response: dict, parts: tuple[str, ...]):
+        for item in response.get('items', []):
+            for part in parts:
+                self._set_cached(item['id'], part, item.get(part, {}))
+
+    def _get_cached_videos(self, unique_ids: list[str], parts: tuple[str, ...]) -> dict[str, dict]:
+        videos = {}
+        for video_id in unique_ids:
+            cached_parts = {part: self._get_cached(video_id, part, fresh_only=False) for part in parts}
+            if any(data is None for data in cached_parts.values()):
+                continue
+            videos[video_id] = {'id': video_id, **cached_parts}
+        return videos
+
+    def get_videos(self, video_ids: list[str], parts=("snippet",)) -> dict[str, dict]:
+        """
+        get the requested parts of the given videos
+
+        :return: dict of video id -> videos.list item containing the requested parts.
+                 Videos unknown to YouTube, or not cached while the quota is used up,
+                 are missing in the result
+        """
+        parts = tuple(parts)
+        unique_ids = list(dict.fromkeys(video_ids))
+        missing = self._get_missing(unique_ids, parts)
+
+        for start in range(0, len(missing), MAX_IDS_PER_REQUEST):
+            batch = missing[start:start + MAX_IDS_PER_REQUEST]
+            logger.debug(f"Fetching {parts} for {len(batch)} videos")
+            try:
+                response = self._execute(batch, parts)
+            except QuotaExceeded as e:
+                logger.warning(f"{e}, serving cached video information")
+                break
+            except Exception as e:
+                logger.error(f"Error fetching video information: {str(e)}")
+                continue
+            self._store_response(response, parts)
+        return self._get_cached_videos(unique_ids, parts)
+
+    async def aget_videos(self, video_ids: list[str], parts=("snippet",)) -> dict[str, dict]:
+        """
+        async get_videos, calls the videos.list REST endpoint on a shared aiohttp session.
+        The cache and the quota are the same as for get_videos.
+        """
+        parts = tuple(parts)
+        unique_ids = list(dict.fromkeys(video_ids))
+        missing = self._get_missing(unique_ids, parts)
+
+        for start in range(0, len(missing), MAX_IDS_PER_REQUEST):
+            batch = missing[start:start + MAX_IDS_PER_REQUEST]
+            logger.debug(f"Fetching {parts} for {len(batch)} videos")
+            try:
+                response = await self._aexecute(batch, parts)
+            except QuotaExceeded as e:
+                logger.warning(f"{e}, serving cached video information")
+                break
+            except Exception as e:
+                logger.error(f"Error fetching video information: {str(e)}")
+                continue
+            self._store_response(response, parts)
+        return self._get_cached_videos(unique_ids, parts)
+
+
+_CLIENT = None
+
+
+def get_yt_client() -> YoutubeClient:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = YoutubeClient()
+    return _CLIENT
+
 
 def validate_youtube_url(url):
     logger.debug("Validating YouTube URL: %s", url)
@@ -147,101 +427,69 @@ def validate_youtube_url(url):
 
 def get_yt_id_and_timestamp(url, validate=False):
     """
-    handles youtube video URL and returns the YouTube ID and timestamp
-    two possible formats: https://youtu.be/Kryc40r9wOg?feature=shared&t=1737
-    or:                   https://www.youtube.com/watch?v=Kryc40r9wOg&t=1737s
+    handles youtube video URL and returns the YouTube ID and timestamp, see yt_ids.parse_yt_url
 
-    :return:
+    :param validate: validate the URL first (with Django's URLValidator)
     """
-    logger.debug("Getting YouTube ID and timestamp from url: %s", url)
-    timestamp = 0
-    video_id = None
+    if validate:
+        url = validate_youtube_url(url)
+    return parse_yt_url(url)
 
-    try:
-        if validate:
-            url = validate_youtube_url(url)
-
-        if "youtu.be" in url:
-            # Handle short format
-            path = url.split("youtu.be/")[1]
-            video_id = path
-            if "?" in path:
-                video_id = path.split("?")[0]
-                query_params = path.split("?")[1]
-                for param in query_params.split("&"):
-                    if param.startswith("t="):
-                        timestamp = param.split("=")[1].rstrip("s")
-        else:
-            # Handle long format
-            query_params = url.split("?", 1)[1]
-            for param in query_params.split("&"):
-                if param.startswith("v="):
-                    video_id = param.split("=")[1]
-                elif param.startswith("t="):
-                    timestamp = param.split("=")[1].rstrip("s")
-
-        if not video_id or len(video_id) != 11:
-            raise ValueError("Invalid YouTube video ID")
-
-        return video_id, timestamp
-    except (IndexError, KeyError):
-        raise ValueError("Invalid YouTube URL structure")
-    except ValueError as e:
-        raise ValueError(str(e))
-
-def get_yt_video_information(video_id: str) -> YoutubeVideoInformation:
-    retry_count = 0
-    last_exception = None
+
+def get_yt_video_informations(video_ids: list[str],
+                               parts=("snippet", "statistics")) -> dict[str, YoutubeVideoInformation]:
+    """
+    get the video information for many videos with as few videos.list calls as possible,
+    videos without information get the 'Unavailable' placeholder
+    """
+    videos = get_yt_client().get_videos(video_ids, parts=parts)
+    return {
+        video_id: YoutubeVideoInformation({'items': [videos[video_id]]}) if video_id in videos
+        else YoutubeVideoInformation.unavailable("no data returned by YouTube")
+        for video_id in video_ids
+    }
+
+
+def get_yt_video_information(video_id: str, parts=("snippet", "statistics")) -> YoutubeVideoInformation:
     logger.debug(f"Fetching video information for video ID: {video_id}")
-    while retry_count < MAX_RETRIES:
-        try:
-            # Set timeout for this request
-            socket.setdefaulttimeout(TIMEOUT)
-
-            request = get_yt_connection().videos().list(
-                part="snippet,statistics",
-                id=video_id
-            )
-            response = request.execute()
-            logger.debug(f"Video information response: {response}")
-            return YoutubeVideoInformation(response)
-        except (ssl.SSLError, TimeoutError, HttpError) as e:
-            logger.error(f"Error fetching video information: {str(e)}")
-            last_exception = e
-            retry_count += 1
-            if retry_count < MAX_RETRIES:
-                # Exponential backoff
-                time.sleep(BACKOFF_FACTOR ** retry_count)
-            continue
-        except Exception as e:
-            logger.error(f"Error fetching video information: {str(e)}")
-            retry_count += 1
-            last_exception = e
-            pass
-    # For any other unexpected errors, return minimal information
-    return YoutubeVideoInformation({
-        'items': [{
-            'snippet': {
-                'title': 'Unavailable',
-                'description': f'Video information unavailable: {str(last_exception)}',
-                'publishedAt': None,
-                'channelTitle': 'Unknown'
-            },
-            'statistics': {
-                'viewCount': '0',
-                'likeCount': '0'
-            }
-        }]
-    })
+    return get_yt_video_informations([video_id], parts=parts)[video_id]
 
-def extract_opgg_url_from_yt(yt_url: str) -> str:
-    yt_id = get_yt_id_and_timestamp(yt_url, validate=True)[0]
-    yt_video_information = get_yt_video_information(yt_id)
 
-    opgg_pattern = r'https://op\.gg/lol/[^\s]+'
+async def aget_yt_video_information(video_id: str, parts=("snippet", "statistics")) -> YoutubeVideoInformation:
+    logger.debug(f"Fetching video information for video ID: {video_id}")
+    videos = await get_yt_client().aget_videos([video_id], parts=parts)
+    if video_id not in videos:
+        return YoutubeVideoInformation.unavailable("no data returned by YouTube")
+    return YoutubeVideoInformation({'items': [videos[video_id]]})
+
+
+def get_yt_video_statistics(video_ids: list[str]) -> dict[str, dict]:
+    """
+    get view and like counts for many videos, batching up to MAX_IDS_PER_REQUEST ids
+    into a single videos.list call
+
+    :return: dict of video id -> {'views': int, 'likes': int}, videos unknown to YouTube
+             or failed batches are missing in the result
+    """
+    videos = get_yt_client().get_videos(video_ids, parts=("statistics",))
+    return {
+        video_id: {
+            'views': int(video['statistics'].get('viewCount', 0)),
+            'likes': int(video['statistics'].get('likeCount', 0)),
+        }
+        for video_id, video in videos.items()
+    }
+
+
+OPGG_URL_PATTERN = re.compile(r'https://op\.gg/lol/[^\s]+')
+
 
+def find_opgg_url(description: str | None) -> str:
+    """
+    :return: the first op.gg URL in a video description, "" if there is none
+    """
     try:
-        match = re.search(opgg_pattern, yt_video_information.description)
+        match = OPGG_URL_PATTERN.search(description or "")
         if match:
             return match.group(0)
         logger.debug("No op.gg URL found in video description")
@@ -251,6 +499,18 @@ def extract_opgg_url_from_yt(yt_url: str) -> str:
         return ""
 
 
+def extract_opgg_url_from_yt(yt_url: str) -> str:
+    yt_id = get_yt_id_and_timestamp(yt_url, validate=True)[0]
+    yt_video_information = get_yt_video_information(yt_id, parts=("snippet",))
+    return find_opgg_url(yt_video_information.description)
+
+
+async def aextract_opgg_url_from_yt(yt_url: str) -> str:
+    yt_id = get_yt_id_and_timestamp(yt_url, validate=True)[0]
+    yt_video_information = await aget_yt_video_information(yt_id, parts=("snippet",))
+    return find_opgg_url(yt_video_information.description)
+
+
 def main():
     yt_video_information = get_yt_video_information("l_6I6LChDNk")
     print(yt_video_information.title)
@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from lolstreamsearch.api.async_http import close_sessions_on_shutdown
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lolstreamers.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# the aiohttp sessions of the async views are closed when the worker shuts down
+application = close_sessions_on_shutdown(django_application)
@@ -98,6 +98,37 @@ REST_FRAMEWORK = {
     }
 }
 
+# Elasticsearch video index. YT_VIDEOS_INDEX is read from, writes go to the write alias and
+# public reads of active videos to the filtered public alias, once the reindex_yt_videos
+# management command created them. Without the aliases everything uses YT_VIDEOS_INDEX.
+YT_VIDEOS_INDEX = os.getenv('YT_VIDEOS_INDEX', 'lolstreamsearch_yt_videos')
+YT_VIDEOS_WRITE_ALIAS = os.getenv('YT_VIDEOS_WRITE_ALIAS')
+YT_VIDEOS_PUBLIC_ALIAS = os.getenv('YT_VIDEOS_PUBLIC_ALIAS')
+
+# Page size of the ytvideos list endpoint, can be overridden per request with ?page_size=
+YT_VIDEOS_PAGE_SIZE = 20
+YT_VIDEOS_MAX_PAGE_SIZE = 100
+# hits counted for the total of a ytvideos list page. A capped count lets Elasticsearch stop
+# early on the index sort (published_at), above the cap the count is a lower bound.
+YT_VIDEOS_TRACK_TOTAL_HITS = int(os.getenv('YT_VIDEOS_TRACK_TOTAL_HITS', 1000))
+
+# per-worker cache of ytvideos list pages, invalidated by every write. The TTL is a safety
+# net for writes that bypass the API (e.g. fill_db or the statistics refresh).
+YT_VIDEOS_RESULT_CACHE_SIZE = int(os.getenv('YT_VIDEOS_RESULT_CACHE_SIZE', 1000))
+YT_VIDEOS_RESULT_CACHE_TTL = int(os.getenv('YT_VIDEOS_RESULT_CACHE_TTL', 30))
+# seconds a worker reuses the index generation read from the database before reading it
+# again, the delay after which the other workers see a write
+YT_VIDEOS_GENERATION_TTL = float(os.getenv('YT_VIDEOS_GENERATION_TTL', 2))
+
+# serve the read endpoints with the async views of lolstreamsearch/api/async_views.py.
+# Only enable this when running lolstreamers.asgi under an ASGI server, see README.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+
+# how long the PUUID of a Riot ID is cached before it is looked up again (catches renames),
+# RIOT_ACCOUNT_TTL_DAYS=0 caches it forever. Unknown Riot IDs are looked up again sooner.
+RIOT_ACCOUNT_TTL = timedelta(days=int(os.getenv('RIOT_ACCOUNT_TTL_DAYS', 30))) or None
+RIOT_ACCOUNT_NOT_FOUND_TTL = timedelta(hours=1)
+
 # JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
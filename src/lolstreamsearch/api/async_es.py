@@ -0,0 +1,21 @@
+"""
+AsyncElasticsearch connection of the async read views.
+
+The client needs aiohttp, which is only installed for the ASGI deployment (see README),
+so everything is imported lazily. The connection is created on first use with the same
+options as the sync connection in ELASTICSEARCH_DSL.
+"""
+from django.conf import settings
+
+ASYNC_CONNECTION_ALIAS = "default"
+
+
+def get_async_connection():
+    from elasticsearch_dsl import async_connections
+
+    try:
+        return async_connections.get_connection(ASYNC_CONNECTION_ALIAS)
+    except KeyError:
+        return async_connections.create_connection(ASYNC_CONNECTION_ALIAS,
+                                                   **settings.ELASTICSEARCH_DSL["default"])
+
@@ -0,0 +1,61 @@
+"""
+Shared aiohttp sessions of the async Riot and YouTube clients.
+
+A session keeps a pool of keep-alive connections, but it belongs to the event loop it was
+created in. So there is one session per name and running loop, created on first use; under
+an ASGI server that is one pool per worker, closed on the lifespan shutdown of the worker
+(see close_sessions_on_shutdown). aiohttp is only installed for the ASGI deployment (see
+README), so it is imported lazily.
+"""
+import asyncio
+import weakref
+
+_SESSIONS = weakref.WeakKeyDictionary()  # event loop -> {name: session}
+
+
+def get_session(name: str, pool_size: int = 10, timeout: tuple[float, float] | None = None,
+                headers: dict | None = None):
+    """
+    :param name: the sessions of one client share a name
+    :param timeout: (connect, read) timeout in seconds
+    :return: the aiohttp.ClientSession of the name in the running event loop
+    """
+    import aiohttp
+
+    sessions = _SESSIONS.setdefault(asyncio.get_running_loop(), {})
+    session = sessions.get(name)
+    if session is None or session.closed:
+        client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1]) if timeout else None
+        session = sessions[name] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size, ttl_dns_cache=300),
+            timeout=client_timeout or aiohttp.ClientTimeout(),
+            headers=headers,
+        )
+    return session
+
+
+async def close_sessions() -> None:
+    """close the sessions of the running event loop"""
+    for session in _SESSIONS.pop(asyncio.get_running_loop(), {}).values():
+        await session.close()
+
+
+def close_sessions_on_shutdown(application):
+    """
+    wrap an ASGI application to close the sessions of the worker on the lifespan shutdown.
+    The Django ASGI handler only serves http, the lifespan events are answered here.
+    """
+
+    async def lifespan_application(scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_sessions()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    return lifespan_application
@@ -0,0 +1,257 @@
+"""
+Async versions of the read endpoints, enabled with the ASYNC_READ_VIEWS setting.
+
+Under an ASGI server a sync view holds a thread for its whole Elasticsearch round trip.
+These views await the searches on the AsyncElasticsearch connection instead, so one
+process serves many slow searches concurrently.
+
+GET requests of the read views are served here (AsyncGetMixin). Authentication,
+permissions and throttling still run the checks of the matching DRF view (in a thread,
+they may hit the database), and the responses have the same JSON body as the DRF views.
+All other methods of a route are handed to the sync DRF view unchanged (AsyncDRFView).
+
+The league match lookups only read as well, their POST requests await the Riot and
+YouTube APIs here, so slow upstream responses don't block the workers.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from elasticsearch import NotFoundError
+from rest_framework.renderers import JSONRenderer
+
+from google_api import aextract_opgg_url_from_yt
+from .cache import facet_cache, aget_generation
+from .league import aextract_from_opgg
+from .pagination import SearchAfterPagination
+from .query_builder import FIELDS_QUERY_PARAM, get_projection, parse_query_params
+from .views import YtVideoListViewSet, FacetsListViewSet, CheckDuplicateYtVideo, CheckDuplicateYtVideos, \
+    LeagueMatchAPIView, LeagueMatchFromYTVideoAPIView, CHECK_DUPLICATES_MAX_ITEMS, distinct_entries_search, \
+    all_distinct_entries_search, read_all_distinct_entries
+from .yt_es_documents import YtVideoDocument, YtVideoDocumentSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=200) -> HttpResponse:
+    return HttpResponse(JSONRenderer().render(data), content_type="application/json", status=status)
+
+
+def _check_request(view_class, action, request, args, kwargs):
+    """
+    run the authentication, permission and throttle checks of the DRF view for the request
+
+    :return: (DRF request, None) if the request may proceed, else (None, rendered error response)
+    """
+    view = view_class()
+    view.action_map = {request.method.lower(): action}
+    view.args, view.kwargs = args, kwargs
+    view.format_kwarg = None
+    view.headers = view.default_response_headers
+    view.request = drf_request = view.initialize_request(request, *args, **kwargs)
+    try:
+        view.initial(drf_request, *args, **kwargs)
+    except Exception as exc:
+        response = view.finalize_response(drf_request, view.handle_exception(exc), *args, **kwargs)
+        return None, response.render()
+    return drf_request, None
+
+
+def _call_drf_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, "render"):
+        response.render()
+    return response
+
+
+class AsyncDRFView(View):
+    """
+    Hands every method to the sync DRF view of the route, subclasses serve some of them async.
+
+    drf_view_class and drf_actions describe the DRF view of the route, drf_actions maps
+    the HTTP methods to viewset actions (None for APIViews).
+    """
+    drf_view_class = None
+    drf_actions = None
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # CSRF is enforced by the session authentication of the DRF views, like for APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def get_drf_view(self):
+        if self.drf_actions is None:
+            return self.drf_view_class.as_view()
+        return self.drf_view_class.as_view(self.drf_actions)
+
+    async def check_request(self, request, args, kwargs):
+        """
+        :return: (DRF request, None) if the request may proceed, else (None, rendered error response)
+        """
+        action = self.drf_actions.get(request.method.lower()) if self.drf_actions else None
+        return await sync_to_async(_check_request)(self.drf_view_class, action, request, args, kwargs)
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(_call_drf_view)(self.get_drf_view(), request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await self.delegate(request, *args, **kwargs)
+
+
+class AsyncGetMixin:
+    """
+    Serves GET with the `aget` of the view, after the checks of the DRF view.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        drf_request, error_response = await self.check_request(request, args, kwargs)
+        if error_response is not None:
+            return error_response
+        return await self.aget(drf_request, *args, **kwargs)
+
+
+class AsyncYtVideoListView(AsyncGetMixin, AsyncDRFView):
+    drf_view_class = YtVideoListViewSet
+    drf_actions = {"get": "list", "post": "create"}
+
+    async def aget(self, request, *args, **kwargs):
+        query = parse_query_params(request.query_params, default_projection="card")
+        search = YtVideoDocument.build_search(query, asynchronous=True)
+        paginator = SearchAfterPagination()
+        page = await paginator.apaginate_queryset(search, request, index=YtVideoDocument.get_search_index(query))
+        serializer = YtVideoDocumentSerializer(page, many=True, fields=query.projection)
+        return json_response(paginator.get_paginated_response(serializer.data).data)
+
+
+class AsyncYtVideoDetailView(AsyncGetMixin, AsyncDRFView):
+    drf_view_class = YtVideoListViewSet
+    drf_actions = {"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"}
+
+    async def aget(self, request, *args, **kwargs):
+        projection = get_projection(request.query_params.get(FIELDS_QUERY_PARAM), default="full")
+        get_kwargs = {"_source_includes": projection} if projection is not None else {}
+        try:
+            ytvideo = await YtVideoDocument.async_get(kwargs["pk"], **get_kwargs)
+        except NotFoundError:
+            return json_response({"detail": "Not found."}, status=404)
+        return json_response(YtVideoDocumentSerializer(ytvideo, fields=projection).data)
+
+
+class AsyncKeywordListView(AsyncGetMixin, AsyncDRFView):
+    """
+    distinct entries of one keyword field, see views.get_distinct_entries
+    """
+    drf_actions = {"get": "list"}
+    field = None
+    as_keyword = ".keyword"
+
+    async def aget(self, request, *args, **kwargs):
+        async def compute():
+            response = await distinct_entries_search(self.field, self.as_keyword, asynchronous=True).execute()
+            return [bucket.key for bucket in response.aggregations.distinct_entries.buckets]
+
+        distinct_entries = await facet_cache.aget_or_set(self.field, await aget_generation(), compute)
+        return json_response({self.field: distinct_entries})
+
+
+class AsyncFacetsListView(AsyncGetMixin, AsyncDRFView):
+    drf_view_class = FacetsListViewSet
+    drf_actions = {"get": "list"}
+
+    async def aget(self, request, *args, **kwargs):
+        async def compute():
+            return read_all_distinct_entries(await all_distinct_entries_search(asynchronous=True).execute())
+
+        return json_response(await facet_cache.aget_or_set("__all__", await aget_generation(), compute))
+
+
+class AsyncCheckDuplicateYtVideo(AsyncGetMixin, AsyncDRFView):
+    drf_view_class = CheckDuplicateYtVideo
+
+    async def aget(self, request, *args, **kwargs):
+        yt_id = kwargs.get("ytid")
+        if not yt_id:
+            return json_response({"success": False, "message": "Missing URL parameter"}, status=400)
+        try:
+            duplicates = await YtVideoDocument.afind_duplicates([yt_id], request.query_params.get("t", 0))
+        except NotFoundError:
+            duplicates = {}
+        if duplicates:
+            return json_response({"hasDuplicates": True, "message": "Duplicate found", "videos": duplicates[yt_id]})
+        return json_response({"hasDuplicates": False, "message": "Duplicate not found"})
+
+
+class AsyncCheckDuplicateYtVideos(AsyncDRFView):
+    """
+    the duplicate check of several videos only reads, so its POST is served async as well
+    """
+    drf_view_class = CheckDuplicateYtVideos
+    http_method_names = ["post", "options"]
+
+    async def post(self, request, *args, **kwargs):
+        drf_request, error_response = await self.check_request(request, args, kwargs)
+        if error_response is not None:
+            return error_response
+        ytids = drf_request.data.get("ytids")
+        if not isinstance(ytids, list) or not ytids:
+            return json_response({"detail": "Missing 'ytids' in request body."}, status=400)
+        if len(ytids) > CHECK_DUPLICATES_MAX_ITEMS:
+            return json_response({"detail": f"At most {CHECK_DUPLICATES_MAX_ITEMS} ytids per request."}, status=400)
+        try:
+            duplicates = await YtVideoDocument.afind_duplicates([str(ytid) for ytid in ytids])
+        except NotFoundError:
+            duplicates = {}
+        return json_response({"hasDuplicates": bool(duplicates), "duplicates": duplicates})
+
+
+class AsyncLeagueMatchView(AsyncDRFView):
+    """
+    league match data of an op.gg URL (url_field "opgg_url") or a youtube URL ("yt_url"),
+    see views.LeagueMatchAPIView and views.LeagueMatchFromYTVideoAPIView
+    """
+    http_method_names = ["post", "options"]
+    url_field = None
+
+    async def get_opgg_url(self, url: str) -> str:
+        return url
+
+    async def post(self, request, *args, **kwargs):
+        drf_request, error_response = await self.check_request(request, args, kwargs)
+        if error_response is not None:
+            return error_response
+        url = drf_request.data.get(self.url_field)
+        if not url:
+            return json_response({"detail": f"Missing '{self.url_field}' in request body."}, status=400)
+        try:
+            player_match_data = await aextract_from_opgg(await self.get_opgg_url(url))
+        except Exception:
+            logger.exception(f"Error while extracting data from {self.url_field}")
+            return json_response({"detail": "Failed to fetch match data."}, status=500)
+        if player_match_data is None:
+            return json_response({"detail": "No match data found for given URL."}, status=404)
+        return json_response(player_match_data)
+
+
+class AsyncLeagueMatchOpggView(AsyncLeagueMatchView):
+    drf_view_class = LeagueMatchAPIView
+    url_field = "opgg_url"
+
+
+class AsyncLeagueMatchFromYTVideoView(AsyncLeagueMatchView):
+    drf_view_class = LeagueMatchFromYTVideoAPIView
+    url_field = "yt_url"
+
+    async def get_opgg_url(self, url: str) -> str:
+        return await aextract_opgg_url_from_yt(url)
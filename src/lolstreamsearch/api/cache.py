@@ -0,0 +1,227 @@
+"""
+In-memory caches for search responses.
+
+The entries live in the memory of each worker, the index generation they were computed
+for is shared through the database. Writes bump the generation. The generation read from
+the database is kept in memory for YT_VIDEOS_GENERATION_TTL seconds, so a cache hit costs
+no database query, and the other workers stop serving outdated entries within that time.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F
+
+from lolstreamsearch.models import IndexGeneration
+
+logger = logging.getLogger(__name__)
+
+YT_VIDEOS_GENERATION = "lolstreamsearch_yt_videos"
+
+
+# generations read from the database, name -> (read at, generation)
+_generations = {}
+
+
+def _get_cached_generation(name: str) -> int | None:
+    entry = _generations.get(name)
+    if entry is None or time.monotonic() - entry[0] >= settings.YT_VIDEOS_GENERATION_TTL:
+        return None
+    return entry[1]
+
+
+def get_generation(name: str = YT_VIDEOS_GENERATION) -> int:
+    generation = _get_cached_generation(name)
+    if generation is None:
+        generation = IndexGeneration.objects.filter(name=name).values_list("generation", flat=True).first() or 0
+        _generations[name] = (time.monotonic(), generation)
+    return generation
+
+
+async def aget_generation(name: str = YT_VIDEOS_GENERATION) -> int:
+    generation = _get_cached_generation(name)
+    if generation is None:
+        generation = await IndexGeneration.objects.filter(name=name).values_list(
+            "generation", flat=True).afirst() or 0
+        _generations[name] = (time.monotonic(), generation)
+    return generation
+
+
+def bump_generation(name: str = YT_VIDEOS_GENERATION) -> None:
+    """
+    invalidate all cache entries computed for the current generation of the given index
+    """
+    updated = IndexGeneration.objects.filter(name=name).update(generation=F("generation") + 1)
+    if not updated:
+        IndexGeneration.objects.get_or_create(name=name)
+        IndexGeneration.objects.filter(name=name).update(generation=F("generation") + 1)
+    # this worker sees its own writes right away
+    _generations.pop(name, None)
+    logger.debug(f"Bumped generation of {name}")
+
+
+class VersionedCache:
+    """
+    Per-process cache whose entries are only valid for the index generation
+    they were computed for.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # key -> (generation, value)
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key, generation: int, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (generation, value)
+        return value
+
+    async def aget_or_set(self, key, generation: int, compute):
+        """
+        get_or_set for the async views, compute is a coroutine function
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = await compute()
+        with self._lock:
+            self._entries[key] = (generation, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+        }
+
+
+class ResultCache(VersionedCache):
+    """
+    Bounded VersionedCache for search results with a TTL and LRU eviction.
+
+    Concurrent misses of the same key are coalesced: the first request computes the value,
+    the others wait for it instead of sending the same search to Elasticsearch.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        super().__init__(name)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (generation, expires at, value)
+        self._computing = {}  # key -> threading.Event set when the value is stored
+        self._computing_async = {}  # key -> asyncio.Event set when the value is stored
+
+    def _get(self, key, generation: int):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != generation or entry[1] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, generation: int, value) -> None:
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, generation: int, compute):
+        while True:
+            with self._lock:
+                entry = self._get(key, generation)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[2]
+                computing = self._computing.get(key)
+                if computing is None:
+                    self.misses += 1
+                    computing = self._computing[key] = threading.Event()
+                    break
+            # another request computes the value, use it once it is stored
+            if not computing.wait(timeout=self.ttl):
+                with self._lock:
+                    self.misses += 1
+                computing = threading.Event()
+                break
+
+        try:
+            value = compute()
+            self._store(key, generation, value)
+            return value
+        finally:
+            with self._lock:
+                if self._computing.get(key) is computing:
+                    del self._computing[key]
+            computing.set()
+
+    async def aget_or_set(self, key, generation: int, compute):
+        """
+        get_or_set for the async views, compute is a coroutine function. Concurrent misses
+        within the event loop are coalesced the same way.
+        """
+        while True:
+            with self._lock:
+                entry = self._get(key, generation)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[2]
+                computing = self._computing_async.get(key)
+                if computing is None:
+                    self.misses += 1
+                    computing = self._computing_async[key] = asyncio.Event()
+                    break
+            try:
+                await asyncio.wait_for(computing.wait(), timeout=self.ttl)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.misses += 1
+                computing = asyncio.Event()
+                break
+
+        try:
+            value = await compute()
+            self._store(key, generation, value)
+            return value
+        finally:
+            with self._lock:
+                if self._computing_async.get(key) is computing:
+                    del self._computing_async[key]
+            computing.set()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "max_size": self.max_size, "ttl": self.ttl, "evictions": self.evictions}
+
+
+facet_cache = VersionedCache("facets")
+search_cache = ResultCache("ytvideos", max_size=settings.YT_VIDEOS_RESULT_CACHE_SIZE,
+                           ttl=settings.YT_VIDEOS_RESULT_CACHE_TTL)
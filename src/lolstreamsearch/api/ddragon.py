@@ -0,0 +1,303 @@
+"""
+Data Dragon lookups.
+
+The item, rune and champion payloads of Data Dragon are compiled once into flat
+id -> name indexes. Only the indexes are kept in memory, not the raw json, and every
+lookup is a dict access.
+
+The payloads are served from a versioned snapshot on disk, written by the sync_ddragon
+command:
+
+    <DDRAGON_SNAPSHOT_DIR>/<version>/{versions,item,runesReforged,champion}.json
+    <DDRAGON_SNAPSHOT_DIR>/current -> <version>
+
+so a worker loads them at startup without any network call. A new patch is installed by
+writing its directory first and then replacing the `current` symlink, and the workers
+pick it up at their next check. Without a snapshot the payloads are downloaded from
+Data Dragon.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DDRAGON_URL = 'https://ddragon.leagueoflegends.com'
+DDRAGON_TIMEOUT = 10  # seconds
+DDRAGON_SNAPSHOT_DIR = os.getenv("DDRAGON_SNAPSHOT_DIR",
+                                 os.path.join(tempfile.gettempdir(), "lolstreamers-ddragon"))
+# how often a worker checks if the current snapshot changed, in seconds
+DDRAGON_CHECK_INTERVAL = int(os.getenv("DDRAGON_CHECK_INTERVAL", 300))
+CURRENT_SNAPSHOT = "current"
+SNAPSHOT_FILES = {
+    "items": "item.json",
+    "runes": "runesReforged.json",
+    "champions": "champion.json",
+}
+VERSIONS_FILE = "versions.json"
+
+# stat shards are not part of runesReforged.json
+STAT_PERK_NAMES = {
+    5001: 'Health Scaling',
+    5002: 'Armor',
+    5003: 'Magic Resist',
+    5005: 'Attack Speed',
+    5007: 'Ability Haste',
+    5008: 'Adaptive Force',
+    5010: 'Move Speed',
+    5011: 'Health',
+    5013: 'Tenacity and Slow Resist',
+}
+
+
+def build_item_index(items_json: dict) -> dict[int, str]:
+    """
+    :param items_json: content of item.json
+    """
+    return {int(item_id): item['name'] for item_id, item in items_json['data'].items()}
+
+
+def build_rune_index(runes_json: list) -> dict[int, str]:
+    """
+    :param runes_json: content of runesReforged.json
+    :return: names of the rune trees, the runes and the stat perks by id
+    """
+    index = dict(STAT_PERK_NAMES)
+    for tree in runes_json:
+        index[tree['id']] = tree['name']
+        for slot in tree['slots']:
+            for rune in slot['runes']:
+                index[rune['id']] = rune['name']
+    return index
+
+
+# names we index under instead of the Data Dragon name ("Nunu & Willump")
+CHAMPION_NAME_OVERRIDES = {
+    'Nunu': 'Nunu Willump',
+}
+
+
+def build_champion_index(champions_json: dict) -> dict[str, str]:
+    """
+    :param champions_json: content of champion.json
+    :return: champion names by lowercase champion id. The match API doesn't always use the
+             case of the Data Dragon id (FiddleSticks, KaiSa), so the lookups ignore case.
+    """
+    index = {champion['id'].lower(): champion['name'] for champion in champions_json['data'].values()}
+    index.update((champion_id.lower(), name) for champion_id, name in CHAMPION_NAME_OVERRIDES.items())
+    return index
+
+
+class DataDragon:
+    def __init__(self, version: str, item_names: dict[int, str], rune_names: dict[int, str],
+                 champion_names: dict[str, str] | None = None):
+        self.version = version
+        self.item_names = item_names
+        self.rune_names = rune_names
+        self.champion_names = champion_names or {}
+
+    @classmethod
+    def from_payloads(cls, version: str, items_json: dict, runes_json: list,
+                      champions_json: dict | None = None) -> 'DataDragon':
+        champion_names = build_champion_index(champions_json) if champions_json else None
+        return cls(version, build_item_index(items_json), build_rune_index(runes_json), champion_names)
+
+    def get_item_name(self, item_id: int) -> str | None:
+        if item_id == 0:
+            return None
+        return self.item_names.get(int(item_id), f"Unknown Item ({item_id})")
+
+    def get_rune_name(self, rune_id: int) -> str:
+        return self.rune_names.get(int(rune_id), f"Unknown Rune ({rune_id})")
+
+    def get_champion_name(self, champion_id: str) -> str:
+        """
+        :param champion_id: championName of the match API (KSante, LeeSin, MonkeyKing)
+        :return: display name of the champion, or the id if it is unknown
+        """
+        return self.champion_names.get(champion_id.lower(), champion_id)
+
+
+def _get_json(path: str):
+    response = requests.get(f'{DDRAGON_URL}{path}', timeout=DDRAGON_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_versions() -> list[str]:
+    """all League of Legends versions, latest first"""
+    return _get_json('/api/versions.json')
+
+
+def get_latest_version() -> str:
+    """Get the latest League of Legends version"""
+    return get_versions()[0]
+
+
+def download_payloads(version: str) -> dict:
+    """
+    :return: the payloads of the version by name, see SNAPSHOT_FILES
+    """
+    return {name: _get_json(f'/cdn/{version}/data/en_US/{filename}') for name, filename in SNAPSHOT_FILES.items()}
+
+
+def fetch_ddragon(version: str | None = None) -> DataDragon:
+    version = version or get_latest_version()
+    logger.debug(f'Loading Data Dragon {version}')
+    payloads = download_payloads(version)
+    return DataDragon.from_payloads(version, payloads["items"], payloads["runes"], payloads["champions"])
+
+
+def _write_json(path: Path, data) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+def get_snapshot_version(snapshot_dir=DDRAGON_SNAPSHOT_DIR) -> str | None:
+    """
+    :return: the version the current snapshot points to, None if there is none
+    """
+    current = Path(snapshot_dir) / CURRENT_SNAPSHOT
+    try:
+        return os.readlink(current)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    except OSError as e:
+        # not a symlink, e.g. in a copied or restored volume. The next sync replaces it.
+        logger.warning(f'Data Dragon snapshot link {current} is unreadable: {e}')
+        return None
+
+
+def write_snapshot(version: str, payloads: dict, versions: list[str], snapshot_dir=DDRAGON_SNAPSHOT_DIR) -> Path:
+    """
+    write the payloads of a version to its snapshot directory. The files are written to a
+    temporary directory that is renamed when complete, so a reader never sees half of it.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    version_dir = snapshot_dir / version
+    if version_dir.is_dir():
+        return version_dir
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{version}-", dir=snapshot_dir))
+    try:
+        _write_json(tmp_dir / VERSIONS_FILE, versions)
+        for name, filename in SNAPSHOT_FILES.items():
+            _write_json(tmp_dir / filename, payloads[name])
+        os.chmod(tmp_dir, 0o755)
+        tmp_dir.rename(version_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not version_dir.is_dir():
+            raise
+    return version_dir
+
+
+def set_current_snapshot(version: str, snapshot_dir=DDRAGON_SNAPSHOT_DIR) -> None:
+    """atomically point the current snapshot to the version"""
+    snapshot_dir = Path(snapshot_dir)
+    tmp_link = snapshot_dir / f".{CURRENT_SNAPSHOT}-{os.getpid()}"
+    tmp_link.unlink(missing_ok=True)
+    os.symlink(version, tmp_link)
+    current = snapshot_dir / CURRENT_SNAPSHOT
+    if current.is_dir() and not current.is_symlink():
+        # a copied volume has a directory instead of the link, it can't be replaced atomically
+        shutil.rmtree(current)
+    os.replace(tmp_link, current)
+
+
+def prune_snapshots(snapshot_dir=DDRAGON_SNAPSHOT_DIR, keep: int = 2) -> list[str]:
+    """
+    delete all but the `keep` newest snapshots. The current snapshot is always kept.
+
+    :return: the deleted versions
+    """
+    snapshot_dir = Path(snapshot_dir)
+    current = get_snapshot_version(snapshot_dir)
+    snapshots = sorted((path for path in snapshot_dir.iterdir()
+                        if path.is_dir() and not path.is_symlink() and not path.name.startswith(".")),
+                       key=lambda path: path.stat().st_mtime, reverse=True)
+    deleted = []
+    for path in snapshots[keep:]:
+        if path.name != current:
+            shutil.rmtree(path, ignore_errors=True)
+            deleted.append(path.name)
+    return deleted
+
+
+def sync_snapshot(version: str | None = None, snapshot_dir=DDRAGON_SNAPSHOT_DIR) -> tuple[str, bool]:
+    """
+    download the version (default the latest) into the snapshot directory and make it current
+
+    :return: (version, whether the current snapshot changed)
+    """
+    versions = get_versions()
+    version = version or versions[0]
+    if version == get_snapshot_version(snapshot_dir) and (Path(snapshot_dir) / version).is_dir():
+        return version, False
+    write_snapshot(version, download_payloads(version), versions, snapshot_dir)
+    set_current_snapshot(version, snapshot_dir)
+    logger.info(f'Data Dragon snapshot {version} installed in {snapshot_dir}')
+    return version, True
+
+
+def load_snapshot(snapshot_dir=DDRAGON_SNAPSHOT_DIR) -> DataDragon | None:
+    """
+    :return: the Data Dragon of the current snapshot, None if there is none
+    """
+    version = get_snapshot_version(snapshot_dir)
+    if version is None:
+        return None
+    version_dir = Path(snapshot_dir) / version
+    payloads = {}
+    for name, filename in SNAPSHOT_FILES.items():
+        with open(version_dir / filename, encoding="utf-8") as f:
+            payloads[name] = json.load(f)
+    return DataDragon.from_payloads(version, payloads["items"], payloads["runes"], payloads["champions"])
+
+
+_DDRAGON = None
+_ddragon_checked_at = 0.0
+_ddragon_lock = threading.Lock()
+
+
+def _reload_ddragon(loaded: DataDragon | None) -> DataDragon:
+    """
+    :return: the Data Dragon of the current snapshot if it's not the loaded one,
+             Data Dragon downloaded from the CDN if nothing is loaded and there's no snapshot,
+             else the loaded one
+    """
+    version = get_snapshot_version()
+    if version is not None and (loaded is None or loaded.version != version):
+        try:
+            ddragon = load_snapshot()
+            logger.info(f'Loaded Data Dragon snapshot {version}')
+            return ddragon
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f'Error loading Data Dragon snapshot {version}: {e}')
+    if loaded is None:
+        logger.warning(f'No Data Dragon snapshot in {DDRAGON_SNAPSHOT_DIR}, run sync_ddragon. '
+                       f'Downloading Data Dragon.')
+        return fetch_ddragon()
+    return loaded
+
+
+def get_ddragon() -> DataDragon:
+    """
+    the loaded Data Dragon. Every DDRAGON_CHECK_INTERVAL seconds the current snapshot is
+    checked and a new one replaces the loaded Data Dragon, lookups in progress keep the old one.
+    """
+    global _DDRAGON, _ddragon_checked_at
+    if _DDRAGON is not None and time.monotonic() - _ddragon_checked_at < DDRAGON_CHECK_INTERVAL:
+        return _DDRAGON
+    with _ddragon_lock:
+        if _DDRAGON is None or time.monotonic() - _ddragon_checked_at >= DDRAGON_CHECK_INTERVAL:
+            _DDRAGON = _reload_ddragon(_DDRAGON)
+            _ddragon_checked_at = time.monotonic()
+    return _DDRAGON
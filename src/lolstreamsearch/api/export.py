@@ -0,0 +1,125 @@
+"""
+NDJSON export of the video index.
+
+The export reads a point-in-time of the index with several parallel slices. Every slice
+pages through its part of the documents with search_after on _shard_doc, the pages are
+handed to the consumer through a bounded queue. Memory use depends on the page size and
+the number of slices, not on the size of the index.
+"""
+import json
+import logging
+import queue
+import threading
+from typing import Iterator
+
+from .query_builder import parse_query_params
+from .yt_es_documents import YtVideoDocument
+
+logger = logging.getLogger(__name__)
+
+EXPORT_SLICES = 4
+EXPORT_PAGE_SIZE = 1000
+PIT_KEEP_ALIVE = "2m"
+# seconds a slice waits for the consumer before checking if the export was aborted
+QUEUE_PUT_TIMEOUT = 1
+
+_SLICE_DONE = object()
+
+
+def _get_export_query(query_params) -> tuple[list[str], dict, list | dict | None]:
+    """
+    :return: (indices to export from, query, _source filter)
+    """
+    query = parse_query_params(query_params, default_projection="full")
+    query.facets = []
+    body = YtVideoDocument.build_search(query).to_dict()
+    return [YtVideoDocument.get_search_index(query)], body.get("query", {"match_all": {}}), body.get("_source")
+
+
+def _iter_slice_pages(es, pit_id: str, query: dict, source: list | dict | None, page_size: int,
+                      slice_id: int, max_slices: int) -> Iterator[list]:
+    kwargs = {
+        "query": query,
+        "size": page_size,
+        "sort": ["_shard_doc"],
+        "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+        "track_total_hits": False,
+    }
+    if source is not None:
+        kwargs["source"] = source
+    if max_slices > 1:
+        kwargs["slice"] = {"id": slice_id, "max": max_slices}
+
+    while True:
+        response = es.search(**kwargs)
+        hits = response["hits"]["hits"]
+        if not hits:
+            return
+        yield hits
+        # the point-in-time id may change between requests
+        kwargs["pit"]["id"] = response.get("pit_id", pit_id)
+        kwargs["search_after"] = hits[-1]["sort"]
+
+
+def _to_ndjson(hit: dict) -> str:
+    return json.dumps({"id": hit["_id"], **hit.get("_source", {})}, default=str) + "\n"
+
+
+def iter_export(query_params, slices: int = EXPORT_SLICES,
+                page_size: int = EXPORT_PAGE_SIZE) -> Iterator[str]:
+    """
+    export all videos matching the query params (same filters as the ytvideos list)
+    as NDJSON lines
+    """
+    indices, query, source = _get_export_query(query_params)
+    es = YtVideoDocument._get_connection()
+    pit_id = es.open_point_in_time(index=indices, keep_alive=PIT_KEEP_ALIVE)["id"]
+    logger.debug(f"Exporting videos with {slices} slices, query: {query}")
+
+    pages = queue.Queue(maxsize=slices * 2)
+    aborted = threading.Event()
+
+    def put(item):
+        while not aborted.is_set():
+            try:
+                pages.put(item, timeout=QUEUE_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def read_slice(slice_id):
+        try:
+            for page in _iter_slice_pages(es, pit_id, query, source, page_size, slice_id, slices):
+                put(page)
+                if aborted.is_set():
+                    return
+        except Exception as e:
+            logger.exception(f"Error exporting slice {slice_id}")
+            put(e)
+        finally:
+            put(_SLICE_DONE)
+
+    threads = [threading.Thread(target=read_slice, args=(slice_id,), daemon=True)
+               for slice_id in range(slices)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        running = len(threads)
+        while running:
+            page = pages.get()
+            if page is _SLICE_DONE:
+                running -= 1
+                continue
+            if isinstance(page, Exception):
+                raise page
+            for hit in page:
+                yield _to_ndjson(hit)
+    finally:
+        aborted.set()
+        for thread in threads:
+            thread.join()
+        try:
+            es.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"Could not close point in time: {e}")
@@ -1,32 +1,87 @@
+import asyncio
 import re
 from email.utils import unquote
+from urllib.parse import quote
 
-from django.conf import settings
-import requests
 import logging
+from django.utils import timezone
 
-logger = logging.getLogger(__name__)
+from .ddragon import get_ddragon
+from .match_cache import get_match_cache
+from .riot_client import get_riot_client, get_async_riot_client
 
-api_key = 'RGAPI-aec50855-7d77-42fa-bbf2-a741fd863174'
+logger = logging.getLogger(__name__)
 
 europe_endpoint = 'https://europe.api.riotgames.com'
+# the match of an op.gg URL is searched in this window after the URL's timestamp, in seconds
+MATCH_SEARCH_WINDOW = 300
 
-headers = {
-    'X-Riot-Token': settings.RIOT_API_KEY
-}
+
+def fetch_summoner_puuid(game_name, tag_line) -> str | None:
+    """
+    look up the puuid of a Riot ID at the Riot API
+
+    :return: the puuid or None if Riot does not know the Riot ID
+    """
+    logger.debug(f'Getting puuid for {game_name} {tag_line}')
+    account_response = get_riot_client().get(get_account_url(game_name, tag_line), 'account-by-riot-id')
+    return read_account_response(account_response, game_name, tag_line)
 
 
-def get_summoner_puuid(game_name, tag_line):
+async def afetch_summoner_puuid(game_name, tag_line) -> str | None:
     logger.debug(f'Getting puuid for {game_name} {tag_line}')
-    account_response = requests.get(
-        f'{europe_endpoint}/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}',
-        headers=headers
-    )
+    account_response = await get_async_riot_client().get(get_account_url(game_name, tag_line),
+                                                         'account-by-riot-id')
+    return read_account_response(account_response, game_name, tag_line)
+
+
+def get_account_url(game_name, tag_line) -> str:
+    return f'{europe_endpoint}/riot/account/v1/accounts/by-riot-id/{quote(game_name)}/{quote(tag_line)}'
+
+
+def read_account_response(account_response, game_name, tag_line) -> str | None:
+    if account_response.status_code == 404:
+        logger.debug(f'Riot ID {game_name}#{tag_line} not found')
+        return None
+    account_response.raise_for_status()
     puuid = account_response.json()['puuid']
     logger.debug(f'Got puuid: {puuid}')
     return puuid
 
 
+def get_summoner_puuid(game_name, tag_line) -> str | None:
+    """
+    get the puuid of a Riot ID, cached in the database (see RiotAccount)
+
+    :return: the puuid or None if Riot does not know the Riot ID
+    """
+    # the models can only be imported once the Django apps are loaded
+    from lolstreamsearch.models import RiotAccount
+
+    riot_id = {'game_name': game_name.lower(), 'tag_line': tag_line.lower()}
+    account = RiotAccount.objects.filter(**riot_id).first()
+    if account is not None and account.is_fresh():
+        return account.puuid
+
+    puuid = fetch_summoner_puuid(game_name, tag_line)
+    RiotAccount.objects.update_or_create(**riot_id, defaults={'puuid': puuid, 'fetched_at': timezone.now()})
+    return puuid
+
+
+async def aget_summoner_puuid(game_name, tag_line) -> str | None:
+    from lolstreamsearch.models import RiotAccount
+
+    riot_id = {'game_name': game_name.lower(), 'tag_line': tag_line.lower()}
+    account = await RiotAccount.objects.filter(**riot_id).afirst()
+    if account is not None and account.is_fresh():
+        return account.puuid
+
+    puuid = await afetch_summoner_puuid(game_name, tag_line)
+    await RiotAccount.objects.aupdate_or_create(**riot_id,
+                                                defaults={'puuid': puuid, 'fetched_at': timezone.now()})
+    return puuid
+
+
 def get_match_by_id(match_id: str, region: str = 'europe') -> dict:
     """
     Get detailed match information by match ID
@@ -38,19 +93,54 @@ def get_match_by_id(match_id: str, region: str = 'europe') -> dict:
     Returns:
         Dict with complete match data
     """
-    # Ensure match_id has the region prefix
-    if not match_id.startswith(
-            ('EUW1_', 'EUN1_', 'NA1_', 'KR_', 'BR1_', 'JP1_',
-             'LA1_', 'LA2_', 'OC1_', 'TR1_', 'RU_')):
-        match_id = f'EUW1_{match_id}'
+    match_id = with_platform(match_id)
+    # a finished match never changes, it is only downloaded once
+    match_data = get_match_cache().get(match_id)
+    if match_data is not None:
+        logger.debug(f'Got match data for {match_id} from the match cache')
+        return match_data
 
     logger.debug(f'Getting match data for {match_id}')
-    response = requests.get(
+    response = get_riot_client().get(
         f'https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}',
-        headers=headers
+        'match'
     )
     response.raise_for_status()
-    return response.json()
+    match_data = response.json()
+    get_match_cache().put(match_id, match_data)
+    return match_data
+
+
+async def aget_match_by_id(match_id: str, region: str = 'europe') -> dict:
+    match_id = with_platform(match_id)
+    # the match cache writes to sqlite (last access, counters) and may wait for the lock of
+    # another worker, so it is used in a thread
+    match_cache = await asyncio.to_thread(get_match_cache)
+    match_data = await asyncio.to_thread(match_cache.get, match_id)
+    if match_data is not None:
+        logger.debug(f'Got match data for {match_id} from the match cache')
+        return match_data
+
+    logger.debug(f'Getting match data for {match_id}')
+    response = await get_async_riot_client().get(
+        f'https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}',
+        'match'
+    )
+    response.raise_for_status()
+    match_data = response.json()
+    await asyncio.to_thread(match_cache.put, match_id, match_data)
+    return match_data
+
+
+def with_platform(match_id: str) -> str:
+    """
+    Ensure match_id has the region prefix (EUW1_ if it has none)
+    """
+    if not match_id.startswith(
+            ('EUW1_', 'EUN1_', 'NA1_', 'KR_', 'BR1_', 'JP1_',
+             'LA1_', 'LA2_', 'OC1_', 'TR1_', 'RU_')):
+        return f'EUW1_{match_id}'
+    return match_id
 
 
 def parse_opgg_match_url(opgg_url: str) -> dict | None:
@@ -98,9 +188,25 @@ def get_matches_by_timestamp_range(puuid: str, start_time: int, end_time: int,
         List of match IDs
     """
     logger.debug(f'Getting matches for {puuid} between {start_time} and {end_time}')
-    response = requests.get(
+    response = get_riot_client().get(
         f'https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids',
-        headers=headers,
+        'match-ids-by-puuid',
+        params={
+            'startTime': start_time,
+            'endTime': end_time,
+            'count': count
+        }
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def aget_matches_by_timestamp_range(puuid: str, start_time: int, end_time: int,
+                                          region: str = 'europe', count: int = 100) -> list:
+    logger.debug(f'Getting matches for {puuid} between {start_time} and {end_time}')
+    response = await get_async_riot_client().get(
+        f'https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids',
+        'match-ids-by-puuid',
         params={
             'startTime': start_time,
             'endTime': end_time,
@@ -142,36 +248,12 @@ def map_individual_position(position: str) -> str|None:
 def map_individual_champion_names(champion_name: str) -> str | None:
     """
     Map Riot's champion names (KSante, KaiSa, LeeSin,etc)
-    to our human-readable names
+    to our human-readable names, from champion.json of Data Dragon
     Any unknown value is returned unchanged.
     """
     if champion_name is None:
         return champion_name
-    return CHAMPION_NAME_MAP.get(champion_name, champion_name)
-
-
-CHAMPION_NAME_MAP = {
-    'AurelionSol': 'Aurelion Sol',
-    'BelVeth': 'Bel\'Veth',
-    'ChoGath': 'Cho\'Gath',
-    'DrMundo': 'Dr. Mundo',
-    'FiddleSticks': 'Fiddlesticks',
-    'JarvanIV': 'Jarvan IV',
-    'KSante': 'K\'Sante',
-    'KaiSa': 'Kai\'Sa',
-    'KhaZix': 'Kha\'Zix',
-    'KogMaw': 'Kog\'Maw',
-    'LeeSin': 'Lee Sin',
-    'MasterYi': 'Master Yi',
-    'MissFortune': 'Miss Fortune',
-    'Nunu': 'Nunu Willump',
-    'RekSai': 'Rek\'Sai',
-    'RenataGlasc': 'Renata Glasc',
-    'TahmKench': 'Tahm Kench',
-    'TwistedFate': 'Twisted Fate',
-    'Velkoz': 'Vel\'Koz',
-    'XinZhao': 'Xin Zhao',
-}
+    return get_ddragon().get_champion_name(champion_name)
 
 
 def get_other_participants(match_data: dict, puuid: str, team_id: int,
@@ -200,9 +282,11 @@ def get_other_participants(match_data: dict, puuid: str, team_id: int,
 
 
 def get_match_info_for_player(match_data: dict, puuid: str) -> dict | None:
-    enriched_participant_data = get_participant_data(match_data, puuid)
-    if enriched_participant_data is None:
+    participant_data = get_participant_data(match_data, puuid)
+    if participant_data is None:
         return None
+    # enrich a copy, the match data is shared by all URLs of the match in a batch
+    enriched_participant_data = dict(participant_data)
 
     # add item names
     for item in ["item0", "item1", "item2", "item3", "item4", "item5"]:
@@ -259,6 +343,9 @@ def get_rune_information(participant_data) -> dict:
     secondary_selections = secondary_style.get('selections', [])
     secondary_runes = [selection['perk'] for selection in secondary_selections]
 
+    # stat shards (e.g. 5008 Adaptive Force)
+    stat_perks = perks.get('statPerks', {})
+
     return {
         'primary_style': primary_style.get('style'),  # Tree ID (e.g., 8000 for Precision)
         'primary_runes': [get_rune_name(rune_id) for rune_id in primary_runes],
@@ -266,55 +353,13 @@ def get_rune_information(participant_data) -> dict:
         'secondary_style': secondary_style.get('style'),  # Tree ID
         'secondary_runes': [get_rune_name(rune_id) for rune_id in secondary_runes],
         'stat_perks': {
-            'offense': perks.get('statPerks', {}).get('offense'),
-            'flex': perks.get('statPerks', {}).get('flex'),
-            'defense': perks.get('statPerks', {}).get('defense')
+            shard: get_rune_name(stat_perks[shard]) if stat_perks.get(shard) is not None else None
+            for shard in ('offense', 'flex', 'defense')
         }
     }
 
 
-# Cache for static data
-_items_cache = None
-_runes_cache = None
-_latest_version = None
-
-
-def get_latest_version():
-    """Get the latest League of Legends version"""
-    global _latest_version
-    if _latest_version is None:
-        response = requests.get('https://ddragon.leagueoflegends.com/api/versions.json')
-        versions = response.json()
-        _latest_version = versions[0]
-    return _latest_version
-
-
-def get_items_data():
-    """Fetch and cache items data from Data Dragon"""
-    global _items_cache
-    if _items_cache is None:
-        version = get_latest_version()
-        response = requests.get(
-            f'https://ddragon.leagueoflegends.com/cdn/{version}/data/en_US/item.json'
-        )
-        data = response.json()
-        _items_cache = data['data']
-    return _items_cache
-
-
-def get_runes_data():
-    """Fetch and cache runes data from Data Dragon"""
-    global _runes_cache
-    if _runes_cache is None:
-        version = get_latest_version()
-        response = requests.get(
-            f'https://ddragon.leagueoflegends.com/cdn/{version}/data/en_US/runesReforged.json'
-        )
-        _runes_cache = response.json()
-    return _runes_cache
-
-
-def get_item_name(item_id: int) -> str:
+def get_item_name(item_id: int) -> str | None:
     """
     Get item name from item ID
 
@@ -322,23 +367,14 @@ def get_item_name(item_id: int) -> str:
         item_id: Item ID from match data
 
     Returns:
-        Item name or "Unknown Item" if not found
+        Item name, None for an empty slot or "Unknown Item" if not found
     """
-    if item_id == 0:
-        return None
-
-    items = get_items_data()
-    item_str = str(item_id)
-
-    if item_str in items:
-        return items[item_str]['name']
-
-    return f"Unknown Item ({item_id})"
+    return get_ddragon().get_item_name(item_id)
 
 
 def get_rune_name(rune_id: int) -> str:
     """
-    Get rune name from rune ID
+    Get rune name from rune, rune tree or stat perk ID
 
     Args:
         rune_id: Rune ID from match data
@@ -346,21 +382,7 @@ def get_rune_name(rune_id: int) -> str:
     Returns:
         Rune name or "Unknown Rune" if not found
     """
-    runes_data = get_runes_data()
-
-    # Search through all rune trees and slots
-    for tree in runes_data:
-        # Check if it's a tree/style ID
-        if tree['id'] == rune_id:
-            return tree['name']
-
-        # Check slots for individual runes
-        for slot in tree['slots']:
-            for rune in slot['runes']:
-                if rune['id'] == rune_id:
-                    return rune['name']
-
-    return f"Unknown Rune ({rune_id})"
+    return get_ddragon().get_rune_name(rune_id)
 
 
 def extract_from_opgg(opgg_url: str) -> dict | None:
@@ -375,9 +397,11 @@ def extract_from_opgg(opgg_url: str) -> dict | None:
         logger.debug(f"Invalid URL {opgg_url}")
         return None
     puuid = get_summoner_puuid(parsed_url['game_name'], parsed_url['tag_line'])
+    if puuid is None:
+        logger.debug(f"Unknown Riot ID {parsed_url['game_name']}#{parsed_url['tag_line']}")
+        return None
     time_start = int(parsed_url['timestamp'] / 1000)
-    # 5 minute time window
-    matches = get_matches_by_timestamp_range(puuid, time_start, time_start + 300)
+    matches = get_matches_by_timestamp_range(puuid, time_start, time_start + MATCH_SEARCH_WINDOW)
     if len(matches) == 0:
         logger.debug("No matches found")
         return None
@@ -386,3 +410,33 @@ def extract_from_opgg(opgg_url: str) -> dict | None:
     match_data = get_match_by_id(match_id)
     player_data = get_match_info_for_player(match_data, puuid)
     return player_data
+
+
+async def aextract_from_opgg(opgg_url: str) -> dict | None:
+    """
+    async extract_from_opgg. Data Dragon is loaded in a thread while the match is looked up,
+    it may have to be read from disk or downloaded.
+    """
+    parsed_url = parse_opgg_match_url(opgg_url)
+    if parsed_url is None:
+        logger.debug(f"Invalid URL {opgg_url}")
+        return None
+
+    async def get_match() -> tuple[str, dict] | None:
+        puuid = await aget_summoner_puuid(parsed_url['game_name'], parsed_url['tag_line'])
+        if puuid is None:
+            logger.debug(f"Unknown Riot ID {parsed_url['game_name']}#{parsed_url['tag_line']}")
+            return None
+        time_start = int(parsed_url['timestamp'] / 1000)
+        matches = await aget_matches_by_timestamp_range(puuid, time_start, time_start + MATCH_SEARCH_WINDOW)
+        if len(matches) == 0:
+            logger.debug("No matches found")
+            return None
+        logger.debug(f"Found {len(matches)} matches: {matches}")
+        return puuid, await aget_match_by_id(matches[0])
+
+    match, _ = await asyncio.gather(get_match(), asyncio.to_thread(get_ddragon))
+    if match is None:
+        return None
+    puuid, match_data = match
+    return get_match_info_for_player(match_data, puuid)
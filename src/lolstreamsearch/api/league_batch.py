@@ -0,0 +1,162 @@
+"""
+League match data for many op.gg or YouTube URLs at once.
+
+Every URL needs the same chain of lookups as the single URL endpoints: the description of
+the YouTube video, the puuid of the Riot ID, the match ids around the timestamp and the
+match. The lookups of all URLs are done stage by stage: the video descriptions in as few
+videos.list calls as possible, then every distinct Riot ID, match search and match id
+once, spread over a small thread pool. The Riot calls of the threads wait for the shared
+rate limiter of the Riot client, so a large batch is slowed down instead of running into 429s.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from google_api import get_yt_id_and_timestamp, get_yt_video_informations, find_opgg_url
+from .league import parse_opgg_match_url, get_summoner_puuid, get_matches_by_timestamp_range, \
+    get_match_by_id, get_match_info_for_player, MATCH_SEARCH_WINDOW
+from .riot_client import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+LEAGUE_BATCH_MAX_URLS = 50
+LEAGUE_BATCH_WORKERS = 4
+
+
+def _error(url, status: int, detail: str) -> dict:
+    return {"url": url, "status": status, "detail": detail}
+
+
+def _failure(url, exc: Exception) -> dict:
+    if isinstance(exc, RateLimitExceeded):
+        return _error(url, 429, "Riot rate limit exhausted, retry later.")
+    return _error(url, 500, "Failed to fetch match data.")
+
+
+def _get_summoner_puuid(game_name, tag_line) -> str | None:
+    try:
+        return get_summoner_puuid(game_name, tag_line)
+    finally:
+        # the database connection belongs to the pool thread, which ends with the batch
+        connection.close()
+
+
+def _run_all(executor: ThreadPoolExecutor, func, calls: dict) -> dict:
+    """
+    call func once per key in the pool
+
+    :param calls: key -> args of the call
+    :return: key -> result of the call, or the exception it raised
+    """
+    futures = {key: executor.submit(func, *args) for key, args in calls.items()}
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            logger.error(f"Error in {func.__name__}{calls[key]}: {e}")
+            results[key] = e
+    return results
+
+
+def get_opgg_urls(urls: list, results: list) -> dict[int, str]:
+    """
+    find the op.gg URL of every URL, the op.gg URLs of YouTube URLs are read from the
+    video descriptions. URLs without op.gg URL get their error in results.
+
+    :return: position in urls -> op.gg URL
+    """
+    opgg_urls = {}
+    yt_ids = {}
+    for i, url in enumerate(urls):
+        if not isinstance(url, str) or not url.strip():
+            results[i] = _error(url, 400, "Invalid URL.")
+        elif parse_opgg_match_url(url) is not None:
+            opgg_urls[i] = url
+        else:
+            try:
+                yt_ids[i] = get_yt_id_and_timestamp(url, validate=True)[0]
+            except ValueError:
+                results[i] = _error(url, 400, "Neither an op.gg match URL nor a YouTube URL.")
+
+    if yt_ids:
+        try:
+            videos = get_yt_video_informations(list(yt_ids.values()), parts=("snippet",))
+        except Exception as e:
+            logger.exception("Error while fetching the video descriptions")
+            for i in yt_ids:
+                results[i] = _failure(urls[i], e)
+            return opgg_urls
+        for i, yt_id in yt_ids.items():
+            opgg_url = find_opgg_url(videos[yt_id].description)
+            if opgg_url:
+                opgg_urls[i] = opgg_url
+            else:
+                results[i] = _error(urls[i], 404, "No op.gg URL in the video description.")
+    return opgg_urls
+
+
+def resolve_league_matches(urls: list, max_workers: int = LEAGUE_BATCH_WORKERS) -> list[dict]:
+    """
+    get the player match data of every op.gg or YouTube URL, like extract_from_opgg
+
+    :return: one result per URL, in the order of urls:
+             {"url": url, "status": 200, "data": player match data} or
+             {"url": url, "status": 400 | 404 | 429 | 500, "detail": error message}
+    """
+    results = [None] * len(urls)
+    parsed_urls = {}
+    for i, opgg_url in get_opgg_urls(urls, results).items():
+        parsed_url = parse_opgg_match_url(opgg_url)
+        if parsed_url is None:
+            results[i] = _error(urls[i], 404, "No match data found for given URL.")
+        else:
+            parsed_urls[i] = parsed_url
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Riot IDs are case-insensitive
+        riot_ids = {i: (url['game_name'].lower(), url['tag_line'].lower()) for i, url in parsed_urls.items()}
+        puuid_calls = {riot_ids[i]: (url['game_name'], url['tag_line']) for i, url in parsed_urls.items()}
+        puuids = _run_all(executor, _get_summoner_puuid, puuid_calls)
+
+        match_searches = {}
+        for i, url in parsed_urls.items():
+            puuid = puuids[riot_ids[i]]
+            if isinstance(puuid, Exception):
+                results[i] = _failure(urls[i], puuid)
+            elif puuid is None:
+                results[i] = _error(urls[i], 404, "No match data found for given URL.")
+            else:
+                match_searches[i] = (puuid, int(url['timestamp'] / 1000))
+        search_calls = {search: (search[0], search[1], search[1] + MATCH_SEARCH_WINDOW)
+                        for search in match_searches.values()}
+        match_ids = _run_all(executor, get_matches_by_timestamp_range, search_calls)
+
+        matched = {}
+        for i, search in match_searches.items():
+            found = match_ids[search]
+            if isinstance(found, Exception):
+                results[i] = _failure(urls[i], found)
+            elif not found:
+                results[i] = _error(urls[i], 404, "No match data found for given URL.")
+            else:
+                matched[i] = found[0]
+        matches = _run_all(executor, get_match_by_id, {match_id: (match_id,) for match_id in matched.values()})
+
+    for i, match_id in matched.items():
+        match_data = matches[match_id]
+        if isinstance(match_data, Exception):
+            results[i] = _failure(urls[i], match_data)
+            continue
+        try:
+            player_data = get_match_info_for_player(match_data, match_searches[i][0])
+        except Exception as e:
+            logger.exception(f"Error while reading match {match_id}")
+            results[i] = _failure(urls[i], e)
+            continue
+        if player_data is None:
+            results[i] = _error(urls[i], 404, "No match data found for given URL.")
+        else:
+            results[i] = {"url": urls[i], "status": 200, "data": player_data}
+    return results
@@ -0,0 +1,112 @@
+"""
+On-disk cache of Riot match-v5 payloads.
+
+A finished match never changes, so a match is downloaded once and then served from a
+SQLite database on the local disk, shared by all workers. The payloads are stored as
+zlib-compressed json. The database is bounded in size, the least recently used matches
+are evicted first. The hit, miss and eviction counters live in the database as well, so
+the stats cover all workers.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MATCH_CACHE_FILE = os.getenv("RIOT_MATCH_CACHE_FILE",
+                             os.path.join(tempfile.gettempdir(), "lolstreamers-riot-matches.sqlite3"))
+MATCH_CACHE_MAX_BYTES = int(os.getenv("RIOT_MATCH_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# after an eviction the cache is filled to this share of the max size
+EVICTION_LOW_WATERMARK = 0.9
+COMPRESSION_LEVEL = 6
+
+
+class MatchCache:
+    def __init__(self, path=MATCH_CACHE_FILE, max_bytes=MATCH_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        # sqlite connections can't be shared between threads
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS matches ("
+                "match_id TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS matches_last_access ON matches (last_access)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            # readers don't block the writer of another worker
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, match_id: str) -> dict | None:
+        with self._connection() as connection:
+            row = connection.execute("SELECT data FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+            if row is None:
+                self._count(connection, "misses")
+                return None
+            connection.execute("UPDATE matches SET last_access = ? WHERE match_id = ?", (time.time(), match_id))
+            self._count(connection, "hits")
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, match_id: str, match_data: dict) -> None:
+        data = zlib.compress(json.dumps(match_data, separators=(",", ":")).encode("utf-8"), COMPRESSION_LEVEL)
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO matches (match_id, data, size, last_access) "
+                               "VALUES (?, ?, ?, ?)", (match_id, data, len(data), time.time()))
+            self._evict(connection)
+
+    @staticmethod
+    def _count(connection: sqlite3.Connection, name: str, value: int = 1) -> None:
+        connection.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                           "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (name, value))
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM matches").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_free = total - self.max_bytes * EVICTION_LOW_WATERMARK
+        evicted = []
+        for match_id, size in connection.execute("SELECT match_id, size FROM matches ORDER BY last_access"):
+            if to_free <= 0:
+                break
+            evicted.append((match_id,))
+            to_free -= size
+        connection.executemany("DELETE FROM matches WHERE match_id = ?", evicted)
+        self._count(connection, "evictions", len(evicted))
+        logger.debug(f"Evicted {len(evicted)} matches from the match cache")
+
+    def stats(self) -> dict:
+        connection = self._connection()
+        count, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM matches").fetchone()
+        counters = {"hits": 0, "misses": 0, "evictions": 0}
+        counters.update(connection.execute("SELECT name, value FROM counters"))
+        requests = counters["hits"] + counters["misses"]
+        return {
+            "name": "riot_matches",
+            "matches": count,
+            "size": size,
+            "max_size": self.max_bytes,
+            **counters,
+            "hit_ratio": counters["hits"] / requests if requests else 0.0,
+        }
+
+
+_MATCH_CACHE = None
+
+
+def get_match_cache() -> MatchCache:
+    global _MATCH_CACHE
+    if _MATCH_CACHE is None:
+        _MATCH_CACHE = MatchCache()
+    return _MATCH_CACHE
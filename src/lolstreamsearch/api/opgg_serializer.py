@@ -6,3 +6,11 @@ class OPGGLeagueMatchRequestSerializer(serializers.Serializer):
         help_text="Full op.gg game URL",
         required=True,
     )
+
+
+class LeagueMatchBatchRequestSerializer(serializers.Serializer):
+    urls = serializers.ListField(
+        child=serializers.CharField(),
+        help_text="op.gg game URLs or youtube URLs with an op.gg URL in the description",
+        required=True,
+    )
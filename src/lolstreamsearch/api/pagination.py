@@ -0,0 +1,196 @@
+import base64
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import aget_generation, get_generation, search_cache
+from .yt_es_documents import YtVideoDocument
+
+logger = logging.getLogger(__name__)
+
+
+def encode_cursor(sort_values: list) -> str:
+    """
+    encode the sort values of the last hit of a page into an opaque cursor
+    """
+    payload = json.dumps(list(sort_values), separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    decode a cursor created by encode_cursor back into the search_after values
+
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        sort_values = json.loads(payload)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(sort_values, list) or not sort_values:
+        raise ValueError("Invalid cursor")
+    return sort_values
+
+
+class SearchAfterPagination(BasePagination):
+    """
+    Cursor pagination for elasticsearch_dsl Search objects.
+
+    The Search returned by the view must be sorted on a unique combination of fields
+    (e.g. published_at + id). The sort values of the last hit are handed out as an opaque
+    cursor and passed back to Elasticsearch as `search_after`, so every page costs the same
+    as the first one. The total is taken from the same request via `track_total_hits`,
+    counted up to YT_VIDEOS_TRACK_TOTAL_HITS so Elasticsearch can stop early on the index
+    sort; above the cap "count_relation" is "gte" and the count is a lower bound.
+    Pages are served from the search_cache until the next write or the cache TTL.
+
+    Response:
+    {
+        "count": <total hits>,
+        "count_relation": "eq" | "gte",
+        "next": "<url of the next page or null>",
+        "results": [...],
+        "facets": {...}  # only if the search aggregates facets
+    }
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self):
+        self.page_size = settings.YT_VIDEOS_PAGE_SIZE
+        self.max_page_size = settings.YT_VIDEOS_MAX_PAGE_SIZE
+        self.request = None
+        self.count = 0
+        self.count_relation = "eq"
+        self.next_cursor = None
+        self.facets = None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_search_after(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_search(self, queryset, request):
+        """
+        :return: (search of the requested page, page size)
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        # one hit more than the page size tells whether there is a next page
+        search = queryset.extra(size=page_size + 1, track_total_hits=settings.YT_VIDEOS_TRACK_TOTAL_HITS)
+        search_after = self.get_search_after(request)
+        if search_after is not None:
+            search = search.extra(search_after=search_after)
+        return search, page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        :param view: its search_index is the index the queryset searches, part of the cache key
+        """
+        search, page_size = self.get_page_search(queryset, request)
+        cache_key = self.get_cache_key(getattr(view, "search_index", None), search)
+        page = search_cache.get_or_set(cache_key, get_generation(),
+                                       lambda: self.get_page(search, search.execute(), page_size))
+        return self.set_page(page)
+
+    async def apaginate_queryset(self, queryset, request, index=None):
+        """
+        paginate_queryset for an AsyncSearch, used by the async read views
+
+        :param index: the index the queryset searches, part of the cache key
+        """
+        search, page_size = self.get_page_search(queryset, request)
+
+        async def compute():
+            return self.get_page(search, await search.execute(), page_size)
+
+        page = await search_cache.aget_or_set(self.get_cache_key(index, search), await aget_generation(), compute)
+        return self.set_page(page)
+
+    def set_page(self, page: dict) -> list:
+        self.count = page["count"]
+        self.count_relation = page["count_relation"]
+        self.next_cursor = page["next_cursor"]
+        self.facets = page["facets"]
+        return page["results"]
+
+    @staticmethod
+    def get_cache_key(index: str | None, search) -> str:
+        """
+        the search body is built from the normalized query, so equivalent requests
+        result in the same key
+        """
+        payload = json.dumps({"index": index, "body": search.to_dict()},
+                             sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_page(search, response, page_size: int) -> dict:
+        logger.debug(f"Executed paginated search: {search.to_dict()}")
+        hits = list(response)
+        next_cursor = None
+        if len(hits) > page_size:
+            hits = hits[:page_size]
+            next_cursor = encode_cursor(hits[-1].meta.sort)
+        facets = None
+        if search.aggs.to_dict():
+            facets = YtVideoDocument.get_facets(response)
+        return {
+            "count": response.hits.total.value,
+            "count_relation": response.hits.total.relation,
+            "next_cursor": next_cursor,
+            "facets": facets,
+            "results": [hit.serialize() for hit in hits],
+        }
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([
+            ("count", self.count),
+            ("count_relation", self.count_relation),
+            ("next", self.get_next_link()),
+            ("results", data),
+        ])
+        if self.facets is not None:
+            payload["facets"] = self.facets
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["count", "results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "count_relation": {"type": "string", "enum": ["eq", "gte"]},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+                "facets": {"type": "object"},
+            },
+        }
@@ -0,0 +1,245 @@
+"""
+Query builder of the ytvideos list.
+
+The query params are parsed into a VideoQuery first. Only the params of the allow-list
+are kept, their values are normalized (split, stripped, deduplicated and sorted where the
+order has no meaning), so equivalent requests share one canonical form and cache key no
+matter how the params are ordered. The search is then built from the VideoQuery with one
+typed handler per filter param.
+"""
+import hashlib
+import json
+import logging
+
+from elasticsearch_dsl import Q
+
+logger = logging.getLogger(__name__)
+
+# query params handled by the paginator, never used as search filters
+PAGINATION_QUERY_PARAMS = ("cursor", "page_size")
+FACETS_QUERY_PARAM = "facets"
+FULL_TEXT_QUERY_PARAM = "q"
+# BM25 fields of the full text search and their boosts
+FULL_TEXT_FIELDS = ["title^3", "description"]
+FULL_TEXT_MAX_QUERY_LENGTH = 200
+FIELDS_QUERY_PARAM = "fields"
+
+# fields of the video documents that can be requested with ?fields=
+SOURCE_FIELDS = ("id", "ytid", "timestamp", "title", "description", "video_url", "published_at",
+                 "champion", "enemy_champion", "team_champions", "enemy_team_champions", "lane",
+                 "runes", "champion_items", "lol_version", "streamer", "is_active", "views", "likes",
+                 "stats_updated_at")
+# named field projections for ?fields=, None means all fields
+PROJECTIONS = {
+    # everything the video cards show, without the long YouTube description
+    "card": ["id", "ytid", "timestamp", "title", "video_url", "published_at", "champion",
+             "enemy_champion", "team_champions", "enemy_team_champions", "lane", "runes",
+             "champion_items", "lol_version", "streamer", "is_active", "views", "likes"],
+    "full": None,
+}
+
+# keyword lists offered to the frontend and the field they are aggregated on
+KEYWORD_FIELDS = {
+    "champion": "champion.keyword",
+    "enemy_champion": "enemy_champion.keyword",
+    "team_champions": "team_champions.keyword",
+    "enemy_team_champions": "enemy_team_champions.keyword",
+    "runes": "runes.keyword",
+    "champion_items": "champion_items.keyword",
+    "streamer": "streamer",
+}
+# fields the ytvideos list can return facet counts for
+FACET_FIELDS = {
+    **KEYWORD_FIELDS,
+    "lane": "lane",
+    "lol_version": "lol_version",
+}
+KEYWORD_LIST_SIZE = 300
+
+# filter kinds
+ALL_OF = "all_of"  # comma separated values, the video has to match every value
+ANY_OF = "any_of"  # comma separated values, the video has to match one of the values
+EXACT = "exact"  # the whole param value
+BOOLEAN = "boolean"  # true/false
+
+# allow-list of the filter params: param -> (kind, field)
+FILTER_PARAMS = {
+    "champion": (ALL_OF, KEYWORD_FIELDS["champion"]),
+    "enemy_champion": (ALL_OF, KEYWORD_FIELDS["enemy_champion"]),
+    "team_champions": (ALL_OF, KEYWORD_FIELDS["team_champions"]),
+    "enemy_team_champions": (ALL_OF, KEYWORD_FIELDS["enemy_team_champions"]),
+    "runes": (ALL_OF, KEYWORD_FIELDS["runes"]),
+    "champion_items": (ALL_OF, KEYWORD_FIELDS["champion_items"]),
+    "streamer": (ANY_OF, KEYWORD_FIELDS["streamer"]),
+    "lane": (EXACT, "lane"),
+    "lol_version": (EXACT, "lol_version"),
+    "is_active": (BOOLEAN, "is_active"),
+}
+BOOLEAN_VALUES = {"true": "true", "1": "true", "false": "false", "0": "false"}
+
+
+def get_projection(fields_param: str | None, default: str = "full") -> list[str] | None:
+    """
+    get the document fields to fetch for the ?fields= query param, either the name of one of
+    the PROJECTIONS or a comma separated list of fields. Unknown fields are ignored.
+
+    :return: list of field names or None for all fields
+    """
+    if not fields_param:
+        fields_param = default
+    if fields_param in PROJECTIONS:
+        return PROJECTIONS[fields_param]
+    fields = [field for field in fields_param.split(",") if field in SOURCE_FIELDS]
+    if not fields:
+        return PROJECTIONS[default]
+    return list(dict.fromkeys(["id"] + fields))
+
+
+def _normalize_filter(kind: str, value: str) -> list[str]:
+    if kind == EXACT:
+        value = value.strip()
+        return [value] if value else []
+    if kind == BOOLEAN:
+        value = BOOLEAN_VALUES.get(value.strip().lower())
+        return [value] if value else []
+    return sorted({item.strip() for item in value.split(",") if item.strip()})
+
+
+def _normalize_facets(facets_param: str) -> list[str]:
+    if facets_param.lower() in ("", "false", "0"):
+        return []
+    if facets_param.lower() in ("true", "1"):
+        return list(FACET_FIELDS)
+    requested = set(facets_param.split(","))
+    return [facet for facet in FACET_FIELDS if facet in requested]
+
+
+class VideoQuery:
+    """
+    Normalized ytvideos list query. Two VideoQuery are equal if they result in the same search.
+    """
+
+    def __init__(self, filters: dict[str, list[str]] = None, full_text: str = "",
+                 projection: list[str] | None = None, facets: list[str] = None):
+        self.filters = {param: values for param, values in sorted((filters or {}).items()) if values}
+        self.full_text = full_text
+        self.projection = projection
+        self.facets = facets or []
+
+    def canonical(self) -> dict:
+        return {
+            "filters": self.filters,
+            "q": self.full_text,
+            "fields": self.projection,
+            "facets": self.facets,
+        }
+
+    @property
+    def cache_key(self) -> str:
+        canonical = json.dumps(self.canonical(), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def __eq__(self, other):
+        return isinstance(other, VideoQuery) and self.canonical() == other.canonical()
+
+    def __hash__(self):
+        return hash(self.cache_key)
+
+    def __repr__(self):
+        return f"VideoQuery({self.canonical()})"
+
+
+def parse_query_params(query_params, default_projection: str = "card") -> VideoQuery:
+    """
+    parse the ytvideos list query params into a VideoQuery. Params that are not on the
+    allow-list and invalid values are dropped.
+    """
+    filters = {}
+    for param, value in query_params.items():
+        if param in FILTER_PARAMS:
+            filters[param] = _normalize_filter(FILTER_PARAMS[param][0], value)
+        elif param not in PAGINATION_QUERY_PARAMS and \
+                param not in (FACETS_QUERY_PARAM, FULL_TEXT_QUERY_PARAM, FIELDS_QUERY_PARAM):
+            logger.debug(f"Ignoring unknown query param {param}")
+
+    full_text = " ".join(query_params.get(FULL_TEXT_QUERY_PARAM, "").split())[:FULL_TEXT_MAX_QUERY_LENGTH]
+    return VideoQuery(
+        filters=filters,
+        full_text=full_text.strip(),
+        projection=get_projection(query_params.get(FIELDS_QUERY_PARAM), default=default_projection),
+        facets=_normalize_facets(query_params.get(FACETS_QUERY_PARAM, "")),
+    )
+
+
+def build_filter(param: str, values: list[str]) -> Q:
+    kind, field = FILTER_PARAMS[param]
+    if kind == ANY_OF:
+        return Q("terms", **{field: values})
+    if kind == ALL_OF:
+        return Q("bool", filter=[Q("term", **{field: value}) for value in values])
+    return Q("term", **{field: values[0]})
+
+
+def build_search(search, query: VideoQuery, active_only: bool = False):
+    """
+    build the (not yet executed) search for the query on top of the given search.
+    Results are sorted by published_at and the document id as tiebreaker, so the sort
+    values of a hit can be used as `search_after` cursor by the paginator.
+
+    With facets the search also aggregates the facet counts of the requested FACET_FIELDS,
+    see add_facets.
+
+    With a full text query the videos are searched by title and description, ordered by
+    relevance and returned with highlight fragments instead of the full description. All
+    other params stay filters, so they don't influence the score.
+
+    :param active_only: the search runs on an index that only contains active videos,
+                        an is_active=true filter is not needed
+    """
+    if query.projection is not None:
+        search = search.source(includes=query.projection)
+    sort = [
+        {"published_at": {"order": "desc"}},
+        {"id": {"order": "asc", "missing": "_last", "unmapped_type": "keyword"}},
+    ]
+    if query.full_text:
+        search = search.query("multi_match", query=query.full_text, fields=FULL_TEXT_FIELDS,
+                              type="best_fields")
+        search = search.highlight("title", "description", fragment_size=150, number_of_fragments=3)
+        search = search.source(excludes=["description"])
+        sort.insert(0, "_score")
+    search = search.sort(*sort)
+
+    field_filters = {
+        param: build_filter(param, values) for param, values in query.filters.items()
+        if not (active_only and param == "is_active" and values == ["true"])
+    }
+    if query.facets:
+        search = add_facets(search, field_filters, query.facets)
+    else:
+        for field_filter in field_filters.values():
+            search = search.filter(field_filter)
+    return search
+
+
+def add_facets(search, field_filters: dict, facets: list[str]):
+    """
+    add facet counts that take the active filters into account.
+
+    Filters on facet fields are moved to the post_filter, so they narrow down the hits
+    but not the aggregations. Every facet is a filter aggregation with all active facet
+    filters except the one on its own field, so it offers the values that still give
+    results when combined with the other filters.
+    """
+    facet_filters = {field: f for field, f in field_filters.items() if field in FACET_FIELDS}
+    for field, field_filter in field_filters.items():
+        if field not in facet_filters:
+            search = search.filter(field_filter)
+    if facet_filters:
+        search = search.post_filter(Q("bool", filter=list(facet_filters.values())))
+
+    for facet in facets:
+        other_filters = [f for field, f in facet_filters.items() if field != facet]
+        search.aggs.bucket(facet, "filter", Q("bool", filter=other_filters)) \
+            .bucket("values", "terms", field=FACET_FIELDS[facet], size=KEYWORD_LIST_SIZE)
+    return search
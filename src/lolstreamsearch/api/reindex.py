@@ -0,0 +1,173 @@
+"""
+Zero-downtime reindex of the video index.
+
+The documents live in versioned indices (<index>_v<timestamp>) behind three aliases:
+the read alias (YT_VIDEOS_INDEX), the write alias and a public alias filtered on the
+active videos. A reindex copies the current index into a new versioned index created
+from the index template, verifies the copy and swaps all aliases in one atomic
+update_aliases call, so readers and writers never see a missing or half-filled index.
+
+The first run migrates the legacy concrete index: it is replaced by the read alias of the
+same name within the same atomic call. Documents created while the copy runs are picked
+up by a second pass, updates and deletes of already copied documents during the copy
+are not, so the reindex should run while no one is editing videos.
+
+The list is sorted on `id` as tiebreaker. A legacy index created before `id` was part
+of the mapping is prepared with ensure_id_field (backfill_yt_video_ids command): `id` is
+mapped explicitly as keyword and filled for the documents without one. The reindex fills
+it the same way.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from elasticsearch import BadRequestError
+
+from .yt_es_documents import YtVideoDocument
+
+logger = logging.getLogger(__name__)
+
+INDEX_TEMPLATE_FILE = Path(__file__).resolve().parent / "lolstream_index_template.json"
+PUBLIC_ALIAS_FILTER = {"term": {"is_active": True}}
+TASK_POLL_INTERVAL = 5
+ID_FIELD_MAPPING = {"id": {"type": "keyword"}}
+# documents of the legacy index may have no id field, it is the document id
+SET_ID_SCRIPT = {"source": "if (ctx._source.id == null) { ctx._source.id = ctx._id }", "lang": "painless"}
+
+
+class ReindexError(Exception):
+    pass
+
+
+def get_alias_names(read_alias: str) -> dict:
+    return {
+        "read": read_alias,
+        "write": f"{read_alias}_write",
+        "public": f"{read_alias}_public",
+    }
+
+
+def get_source_indices(es, read_alias: str) -> tuple[list[str], bool]:
+    """
+    :return: (indices currently behind the read alias, whether read_alias is a legacy concrete index)
+    """
+    if es.indices.exists_alias(name=read_alias):
+        return sorted(es.indices.get_alias(name=read_alias).keys()), False
+    if es.indices.exists(index=read_alias):
+        return [read_alias], True
+    raise ReindexError(f"Neither an alias nor an index named {read_alias} exists")
+
+
+def _get_index_body() -> dict:
+    with open(INDEX_TEMPLATE_FILE, "r") as file:
+        template = json.load(file)["template"]
+    index_settings = {**template.get("settings", {}), **YtVideoDocument._index._settings}
+    # no refreshes while the documents are copied, the index is refreshed once at the end
+    index_settings["refresh_interval"] = "-1"
+    return {"settings": index_settings, "mappings": template["mappings"]}
+
+
+def create_versioned_index(es, read_alias: str) -> str:
+    name = f"{read_alias}_v{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+    es.indices.create(index=name, **_get_index_body())
+    logger.info(f"Created index {name}")
+    return name
+
+
+def copy_documents(es, sources: list[str], dest: str, requests_per_second: float = -1) -> dict:
+    """
+    copy the documents of the sources into dest, skipping documents dest already contains
+    """
+    task = es.reindex(source={"index": sources}, dest={"index": dest, "op_type": "create"}, script=SET_ID_SCRIPT,
+                      conflicts="proceed", requests_per_second=requests_per_second, slices="auto",
+                      wait_for_completion=False)
+    task_id = task["task"]
+    while True:
+        response = es.tasks.get(task_id=task_id)
+        if response.get("completed"):
+            break
+        status = response["task"]["status"]
+        logger.info(f"Reindex task {task_id}: {status.get('created', 0)}/{status.get('total', 0)} documents")
+        time.sleep(TASK_POLL_INTERVAL)
+
+    if response.get("error"):
+        raise ReindexError(f"Reindex task {task_id} failed: {response['error']}")
+    result = response.get("response", {})
+    if result.get("failures"):
+        raise ReindexError(f"Reindex task {task_id} had failures: {result['failures'][:5]}")
+    return result
+
+
+def ensure_id_field(es, index: str) -> int:
+    """
+    map `id` as keyword on an existing index and set it on the documents without one, so
+    the list can sort on it. Without the explicit mapping the first document written with
+    an id would map it dynamically as text, which can't be sorted on.
+
+    :return: number of documents that got an id
+    """
+    try:
+        es.indices.put_mapping(index=index, properties=ID_FIELD_MAPPING)
+    except BadRequestError as e:
+        raise ReindexError(f"id of {index} can't be mapped as keyword, run reindex_yt_videos instead: {e}")
+    response = es.update_by_query(index=index, query={"bool": {"must_not": {"exists": {"field": "id"}}}},
+                                  script=SET_ID_SCRIPT, conflicts="proceed", slices="auto", refresh=True)
+    if response.get("failures"):
+        raise ReindexError(f"Setting the ids of {index} had failures: {response['failures'][:5]}")
+    return response["updated"]
+
+
+def _count(es, indices) -> int:
+    return es.count(index=indices)["count"]
+
+
+def swap_aliases(es, read_alias: str, sources: list[str], dest: str, legacy: bool) -> None:
+    aliases = get_alias_names(read_alias)
+    actions = []
+    if legacy:
+        actions.append({"remove_index": {"index": read_alias}})
+    for alias in aliases.values():
+        if not legacy and es.indices.exists_alias(name=alias):
+            actions.append({"remove": {"index": "*", "alias": alias}})
+    actions += [
+        {"add": {"index": dest, "alias": aliases["read"]}},
+        {"add": {"index": dest, "alias": aliases["write"], "is_write_index": True}},
+        {"add": {"index": dest, "alias": aliases["public"], "filter": PUBLIC_ALIAS_FILTER}},
+    ]
+    es.indices.update_aliases(actions=actions)
+    logger.info(f"Moved aliases {', '.join(aliases.values())} from {', '.join(sources)} to {dest}")
+
+
+def reindex(read_alias: str, requests_per_second: float = -1, keep_old: bool = True) -> str:
+    """
+    copy the index behind read_alias into a new versioned index and swap the aliases
+
+    :return: name of the new index
+    """
+    es = YtVideoDocument._get_connection()
+    sources, legacy = get_source_indices(es, read_alias)
+    dest = create_versioned_index(es, read_alias)
+
+    try:
+        copy_documents(es, sources, dest, requests_per_second)
+        # catch up with the documents created during the copy, the copied ones are skipped
+        copy_documents(es, sources, dest)
+        es.indices.put_settings(index=dest, settings={"refresh_interval": None})
+        es.indices.refresh(index=dest)
+
+        source_count, dest_count = _count(es, sources), _count(es, dest)
+        if dest_count < source_count:
+            raise ReindexError(f"{dest} contains {dest_count} documents, the source {source_count}")
+    except Exception:
+        logger.exception(f"Reindex into {dest} failed, deleting it")
+        es.indices.delete(index=dest, ignore_unavailable=True)
+        raise
+
+    # removing the legacy index is part of the atomic alias update, older versioned
+    # indices are only detached from the aliases unless keep_old is False
+    swap_aliases(es, read_alias, sources, dest, legacy)
+    if not keep_old and not legacy:
+        es.indices.delete(index=sources, ignore_unavailable=True)
+    return dest
@@ -0,0 +1,339 @@
+"""
+Riot API client.
+
+All Riot API calls go through one keep-alive session with timeouts. Before every call a
+token is taken from the token buckets of the app rate limit and of the method rate limit
+of the routing host. The buckets are configured from the X-App-Rate-Limit and
+X-Method-Rate-Limit headers, resynchronized with the -Count headers of every response and
+shared by all gunicorn workers through a json state file guarded by a file lock. Calls
+wait for a free token instead of running into 429s; 429 and 5xx responses are retried
+after Retry-After or a jittered exponential backoff.
+
+AsyncRiotClient does the same on a shared aiohttp session for the async views: it waits
+for tokens with asyncio.sleep, so a slow Riot API holds no worker thread. The limiter waits
+for the file lock, so the async client calls it in a thread.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .async_http import get_session
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeout in seconds
+RIOT_TIMEOUT = (3.05, 10)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5  # seconds
+MAX_BACKOFF = 10  # seconds
+# longest time a call waits for a free token before it fails with RateLimitExceeded
+MAX_RATE_LIMIT_WAIT = float(os.getenv("RIOT_MAX_RATE_LIMIT_WAIT", 10))
+# app rate limit until Riot sent the real one, the limit of a development key
+DEFAULT_APP_RATE_LIMIT = os.getenv("RIOT_APP_RATE_LIMIT", "20:1,100:120")
+RATE_LIMIT_STATE_FILE = os.getenv("RIOT_RATE_LIMIT_STATE_FILE",
+                                  os.path.join(tempfile.gettempdir(), "lolstreamers-riot-rate-limit.json"))
+POOL_SIZE = 10
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def parse_rate_limit(header: str | None) -> list[list[int]]:
+    """
+    parse a rate limit header like "20:1,100:120" into [[20, 1], [100, 120]]
+    (requests or count, window in seconds)
+    """
+    if not header:
+        return []
+    limits = []
+    for limit in header.split(","):
+        try:
+            count, window = limit.split(":")
+            limits.append([int(count), int(window)])
+        except ValueError:
+            logger.warning(f"Invalid rate limit header {header}")
+            return []
+    return limits
+
+
+class RateLimiter:
+    """
+    Token buckets per rate limit key (app limit of a host, method limit of an endpoint).
+
+    Every limit "count:window" is a bucket of `count` tokens refilled at count/window
+    tokens per second. The state of all buckets lives in a json file guarded by a file
+    lock, so all workers on the host share it.
+    """
+
+    def __init__(self, state_file=RATE_LIMIT_STATE_FILE, default_app_limit=DEFAULT_APP_RATE_LIMIT):
+        self.state_file = state_file
+        self.default_app_limits = parse_rate_limit(default_app_limit)
+
+    @contextmanager
+    def _state(self):
+        with open(self.state_file, "a+") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read() or "{}")
+                except ValueError:
+                    state = {}
+                yield state
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(state))
+                state_file.flush()
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _refill(entry: dict, now: float) -> None:
+        for bucket, (count, window) in zip(entry["buckets"], entry["limits"]):
+            bucket[0] = min(count, bucket[0] + (now - bucket[1]) * count / window)
+            bucket[1] = now
+
+    @staticmethod
+    def _new_entry(limits: list[list[int]], now: float) -> dict:
+        return {"limits": limits, "buckets": [[count, now] for count, _ in limits], "blocked_until": 0}
+
+    def reserve(self, app_key: str, method_key: str | None = None) -> float:
+        """
+        take a token from every bucket of the app and the method limit.
+
+        :return: 0 if the tokens were taken, else the seconds to wait before trying again
+                 (no token is taken then)
+        """
+        now = time.time()
+        with self._state() as state:
+            if app_key not in state:
+                state[app_key] = self._new_entry(self.default_app_limits, now)
+            entries = [state[key] for key in (app_key, method_key) if key in state]
+
+            wait = 0.0
+            for entry in entries:
+                self._refill(entry, now)
+                wait = max(wait, entry["blocked_until"] - now)
+                for tokens, (count, window) in zip((bucket[0] for bucket in entry["buckets"]), entry["limits"]):
+                    if tokens < 1:
+                        wait = max(wait, (1 - tokens) * window / count)
+            if wait > 0:
+                return wait
+
+            for entry in entries:
+                for bucket in entry["buckets"]:
+                    bucket[0] -= 1
+            return 0.0
+
+    def update(self, key: str, limit_header: str | None, count_header: str | None) -> None:
+        """
+        configure the buckets of the key from the rate limit headers of a response and
+        take the tokens used by requests Riot counted but the buckets did not know about
+        """
+        limits = parse_rate_limit(limit_header)
+        if not limits:
+            return
+        counts = {window: count for count, window in parse_rate_limit(count_header)}
+        now = time.time()
+        with self._state() as state:
+            entry = state.get(key)
+            if entry is None or entry["limits"] != limits:
+                logger.info(f"Riot rate limit of {key}: {limit_header}")
+                entry = state[key] = self._new_entry(limits, now)
+            self._refill(entry, now)
+            for bucket, (count, window) in zip(entry["buckets"], limits):
+                bucket[0] = min(bucket[0], count - counts.get(window, 0))
+
+    def block(self, key: str, seconds: float) -> None:
+        with self._state() as state:
+            if key in state:
+                state[key]["blocked_until"] = max(state[key]["blocked_until"], time.time() + seconds)
+
+
+class RiotResponse:
+    """
+    status, headers and body of an aiohttp response, read before its connection is released
+    """
+
+    def __init__(self, url: str, status_code: int, headers, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+class BaseRiotClient:
+    def __init__(self, limiter: RateLimiter | None = None, timeout=RIOT_TIMEOUT):
+        self.limiter = limiter or RateLimiter()
+        self.timeout = timeout
+
+    @staticmethod
+    def get_rate_limit_keys(url: str, method: str) -> tuple[str, str]:
+        host = urlparse(url).netloc
+        return host, f"{host} {method}"
+
+    @staticmethod
+    def backoff(retry_count: int) -> float:
+        return min(MAX_BACKOFF, BACKOFF_BASE * 2 ** retry_count) * random.uniform(0.5, 1.5)
+
+    @staticmethod
+    def rate_limit_wait(wait: float, waited: float, method_key: str) -> float:
+        """
+        :return: the time to sleep before asking the limiter again
+        :raises RateLimitExceeded: if the total wait would exceed MAX_RATE_LIMIT_WAIT
+        """
+        if waited + wait > MAX_RATE_LIMIT_WAIT:
+            raise RateLimitExceeded(f"Riot rate limit of {method_key} exhausted for {wait:.1f}s")
+        # jitter, so the waiting workers don't all retry at the same moment
+        return wait + random.uniform(0, 0.05)
+
+    def handle_rate_limit_headers(self, response, app_key: str, method_key: str) -> float | None:
+        """
+        update the buckets from the response headers
+
+        :return: the Retry-After of a 429 response in seconds, if there is one
+        """
+        headers = response.headers
+        self.limiter.update(app_key, headers.get("X-App-Rate-Limit"), headers.get("X-App-Rate-Limit-Count"))
+        self.limiter.update(method_key, headers.get("X-Method-Rate-Limit"),
+                            headers.get("X-Method-Rate-Limit-Count"))
+        if response.status_code != 429 or "Retry-After" not in headers:
+            return None
+        retry_after = float(headers["Retry-After"])
+        limit_type = headers.get("X-Rate-Limit-Type")
+        logger.warning(f"Riot {limit_type} rate limit exceeded for {method_key}, retry after {retry_after}s")
+        self.limiter.block(method_key if limit_type == "method" else app_key, retry_after)
+        return retry_after
+
+
+class RiotClient(BaseRiotClient):
+    def __init__(self, api_key=None, limiter: RateLimiter | None = None, timeout=RIOT_TIMEOUT):
+        super().__init__(limiter, timeout)
+        self.session = requests.Session()
+        self.session.headers.update({"X-Riot-Token": api_key or settings.RIOT_API_KEY})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+
+    def acquire(self, app_key: str, method_key: str) -> None:
+        waited = 0.0
+        while (wait := self.limiter.reserve(app_key, method_key)) > 0:
+            wait = self.rate_limit_wait(wait, waited, method_key)
+            time.sleep(wait)
+            waited += wait
+
+    def get(self, url: str, method: str, params: dict | None = None) -> requests.Response:
+        """
+        GET a Riot API url, waiting for the rate limits and retrying 429 and 5xx responses
+
+        :param method: name of the API method, the key of its method rate limit
+        :raises RateLimitExceeded: if no token becomes free within MAX_RATE_LIMIT_WAIT
+        """
+        app_key, method_key = self.get_rate_limit_keys(url, method)
+        for retry_count in range(MAX_RETRIES + 1):
+            self.acquire(app_key, method_key)
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.error(f"Error calling Riot API {method}: {e}")
+                if retry_count == MAX_RETRIES:
+                    raise
+                time.sleep(self.backoff(retry_count))
+                continue
+
+            retry_after = self.handle_rate_limit_headers(response, app_key, method_key)
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if retry_count < MAX_RETRIES and retry_after is None:
+                # service rate limit or server error, the limiter does not know when to retry
+                time.sleep(self.backoff(retry_count))
+        return response
+
+
+class AsyncRiotClient(BaseRiotClient):
+    """
+    RiotClient for the event loop. The token buckets are the same file backed ones, the
+    limiter blocks on their file lock while another worker holds it, so it runs in a thread.
+    """
+
+    def __init__(self, api_key=None, limiter: RateLimiter | None = None, timeout=RIOT_TIMEOUT):
+        super().__init__(limiter, timeout)
+        self.api_key = api_key
+
+    def get_session(self):
+        return get_session("riot", pool_size=POOL_SIZE, timeout=self.timeout,
+                           headers={"X-Riot-Token": self.api_key or settings.RIOT_API_KEY})
+
+    async def acquire(self, app_key: str, method_key: str) -> None:
+        waited = 0.0
+        while (wait := await asyncio.to_thread(self.limiter.reserve, app_key, method_key)) > 0:
+            wait = self.rate_limit_wait(wait, waited, method_key)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    async def get(self, url: str, method: str, params: dict | None = None) -> RiotResponse:
+        """
+        async RiotClient.get
+
+        :raises RateLimitExceeded: if no token becomes free within MAX_RATE_LIMIT_WAIT
+        """
+        import aiohttp
+
+        app_key, method_key = self.get_rate_limit_keys(url, method)
+        for retry_count in range(MAX_RETRIES + 1):
+            await self.acquire(app_key, method_key)
+            try:
+                async with self.get_session().get(url, params=params) as aiohttp_response:
+                    response = RiotResponse(url, aiohttp_response.status, aiohttp_response.headers,
+                                            await aiohttp_response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Error calling Riot API {method}: {e}")
+                if retry_count == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(self.backoff(retry_count))
+                continue
+
+            retry_after = await asyncio.to_thread(self.handle_rate_limit_headers, response, app_key, method_key)
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if retry_count < MAX_RETRIES and retry_after is None:
+                await asyncio.sleep(self.backoff(retry_count))
+        return response
+
+
+_CLIENT = None
+
+
+def get_riot_client() -> RiotClient:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = RiotClient()
+    return _CLIENT
+
+
+_ASYNC_CLIENT = None
+
+
+def get_async_riot_client() -> AsyncRiotClient:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = AsyncRiotClient()
+    return _ASYNC_CLIENT
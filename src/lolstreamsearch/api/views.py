@@ -1,22 +1,32 @@
 import logging
-from django.http import Http404, JsonResponse
+import re
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import ensure_csrf_cookie
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from elasticsearch import NotFoundError
-from rest_framework import permissions, mixins
+from rest_framework import permissions, mixins, status
+from rest_framework.decorators import action
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
 
 from google_api import extract_opgg_url_from_yt
-from .opgg_serializer import OPGGLeagueMatchRequestSerializer
+from .export import iter_export
+from .cache import facet_cache, search_cache, get_generation, bump_generation
+from .opgg_serializer import OPGGLeagueMatchRequestSerializer, LeagueMatchBatchRequestSerializer
+from .pagination import SearchAfterPagination
+from .query_builder import KEYWORD_FIELDS, KEYWORD_LIST_SIZE, FIELDS_QUERY_PARAM, get_projection, \
+    parse_query_params
 from .yt_es_documents import YtVideoDocument, YtVideoDocumentSerializer, ChampionKeywordSerializer, \
     EnemyChampionKeywordSerializer, RunesKeywordSerializer, ItemsKeywordSerializer, \
-    TeamChampionKeywordSerializer, EnemyTeamChampionKeywordSerializer, StreamerKeywordSerializer
+    TeamChampionKeywordSerializer, EnemyTeamChampionKeywordSerializer, StreamerKeywordSerializer, \
+    FacetsSerializer
 from .league import extract_from_opgg
+from .league_batch import resolve_league_matches, LEAGUE_BATCH_MAX_URLS
+from .match_cache import get_match_cache
 from .yturl_serializer import YtURLSerializer
 
 logger = logging.getLogger(__name__)
@@ -25,6 +35,10 @@ class YtVideoThrottle(UserRateThrottle):
     rate = '20/second'
 
 
+BULK_CREATE_MAX_ITEMS = 500
+CHECK_DUPLICATES_MAX_ITEMS = 500
+
+
 @ensure_csrf_cookie
 def get_csrf_token(request):
     """
@@ -42,17 +56,70 @@ class YtVideoListViewSet(mixins.CreateModelMixin,
     serializer_class = YtVideoDocumentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     throttle_classes = [AnonRateThrottle, YtVideoThrottle]
+    pagination_class = SearchAfterPagination
 
     def get_queryset(self):
-        return YtVideoDocument.get_queryset(self.request.query_params)
+        query = parse_query_params(self.request.query_params)
+        # the paginator caches the pages per searched index
+        self.search_index = YtVideoDocument.get_search_index(query)
+        return YtVideoDocument.build_search(query)
+
+    def get_projection(self):
+        default = "card" if self.action == "list" else "full"
+        return get_projection(self.request.query_params.get(FIELDS_QUERY_PARAM), default=default)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ("list", "retrieve"):
+            kwargs.setdefault("fields", self.get_projection())
+        return super().get_serializer(*args, **kwargs)
 
     def get_object(self):
+        kwargs = {}
+        if self.action == "retrieve" and self.get_projection() is not None:
+            kwargs["_source_includes"] = self.get_projection()
         try:
-            doc = YtVideoDocument.get(id=self.kwargs.get("pk"))
+            doc = YtVideoDocument.get(id=self.kwargs.get("pk"), **kwargs)
             return doc
         except NotFoundError:
             raise Http404
 
+    @action(detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated])
+    def export(self, request, *args, **kwargs):
+        """
+        stream all videos matching the list filters as NDJSON
+        """
+        response = StreamingHttpResponse(iter_export(request.query_params),
+                                         content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="ytvideos.ndjson"'
+        return response
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request, *args, **kwargs):
+        """
+        POST body: list of video payloads, as accepted by the create endpoint
+
+        Response:
+          201: all videos created
+          207: some videos could not be created, see the per item status
+          400: body is not a list or too long
+        """
+        payloads = request.data
+        if not isinstance(payloads, list) or not payloads:
+            return Response({"detail": "Expected a non-empty list of videos."}, status=400)
+        if len(payloads) > BULK_CREATE_MAX_ITEMS:
+            return Response({"detail": f"At most {BULK_CREATE_MAX_ITEMS} videos per request."}, status=400)
+
+        results = YtVideoDocumentSerializer.bulk_create(payloads)
+        created = sum(1 for result in results if result["status"] == 201)
+        return Response(
+            {"created": created, "errors": len(results) - created, "items": results},
+            status=status.HTTP_201_CREATED if created == len(results) else status.HTTP_207_MULTI_STATUS,
+        )
+
+    def perform_destroy(self, instance):
+        instance.delete(index=YtVideoDocument.get_write_index(), refresh=True)
+        bump_generation()
+
 
 class ChampionKeywordListViewSet(GenericViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -105,15 +172,144 @@ class StreamerKeywordListViewSet(GenericViewSet):
         return get_distinct_entries("streamer", as_keyword="")
 
 
+class FacetsListViewSet(GenericViewSet):
+    """
+    all keyword lists of the active videos, loaded with a single search
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    serializer_class = FacetsSerializer
+
+    def list(self, request, *args, **kwargs):
+        return Response(get_all_distinct_entries())
+
+
+def _distinct_entries_search(asynchronous=False):
+    # size=0 searches on the active videos are served from the shard request cache
+    search = YtVideoDocument.public_search(asynchronous=asynchronous)
+    return search.extra(size=0).params(request_cache=True)
+
+
+def distinct_entries_search(field: str, as_keyword=".keyword", asynchronous=False):
+    search = _distinct_entries_search(asynchronous)
+    search.aggs.bucket("distinct_entries", "terms", field=field+as_keyword, size=KEYWORD_LIST_SIZE)
+    logger.debug(f"Executing search: {search.to_dict()}")
+    return search
+
+
 def get_distinct_entries(field: str, as_keyword=".keyword"):
-    search = YtVideoDocument.search()
-    search = search.filter("term", **{"is_active": "true"})
-    search.aggs.bucket("distinct_entries", "terms", field=field+as_keyword, size=300)
+    def compute():
+        response = distinct_entries_search(field, as_keyword).execute()
+        return [bucket.key for bucket in response.aggregations.distinct_entries.buckets]
+
+    distinct_entries = facet_cache.get_or_set(field, get_generation(), compute)
+    return Response({field: distinct_entries})
+
+
+def all_distinct_entries_search(asynchronous=False):
+    search = _distinct_entries_search(asynchronous)
+    for field, es_field in KEYWORD_FIELDS.items():
+        search.aggs.bucket(field, "terms", field=es_field, size=KEYWORD_LIST_SIZE)
+    logger.debug(f"Executing search: {search.to_dict()}")
+    return search
+
+
+def read_all_distinct_entries(response) -> dict:
+    return {
+        field: [bucket.key for bucket in response.aggregations[field].buckets]
+        for field in KEYWORD_FIELDS
+    }
+
+
+def get_all_distinct_entries() -> dict:
+    """
+    get the distinct entries of all KEYWORD_FIELDS with one search and one aggregation per field
+    """
+    def compute():
+        return read_all_distinct_entries(all_distinct_entries_search().execute())
+
+    return facet_cache.get_or_set("__all__", get_generation(), compute)
+
+
+# fields mapped as search_as_you_type in lolstream_index_template.json
+SUGGEST_FIELDS = ("champion", "enemy_champion", "team_champions", "enemy_team_champions",
+                  "runes", "champion_items")
+SUGGEST_SIZE = 10
+SUGGEST_MAX_QUERY_LENGTH = 50
+
+
+class SuggestApiView(APIView):
+    """
+    GET ?field=champion&q=ka
+
+    Response:
+      200: {"champion": ["Kai'Sa", "Karma", ...]}
+      400: unknown field
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [AnonRateThrottle, YtVideoThrottle]
+
+    def get(self, request, *args, **kwargs):
+        field = request.query_params.get("field")
+        query = request.query_params.get("q", "").strip()[:SUGGEST_MAX_QUERY_LENGTH]
+        if field not in SUGGEST_FIELDS:
+            return Response(
+                {"detail": f"'field' must be one of {', '.join(SUGGEST_FIELDS)}."},
+                status=400,
+            )
+        if not query:
+            return Response({field: []})
+        return Response({field: get_suggestions(field, query)})
+
+
+def _matches_prefix(value: str, query_tokens: list[str]) -> bool:
+    words = re.findall(r"[\w']+", value.lower())
+    return all(any(word.startswith(token) for word in words) for token in query_tokens)
+
+
+def get_suggestions(field: str, query: str, size: int = SUGGEST_SIZE) -> list[str]:
+    """
+    suggest values of a search_as_you_type field for the typed query.
+
+    A bool_prefix multi_match over the field and its shingle subfields finds the matching
+    videos, only the field itself is fetched from _source. Multi-valued fields return all
+    values of a hit, so the values are filtered by the query tokens and deduplicated.
+    """
+    search = YtVideoDocument.public_search()
+    search = search.query("multi_match", query=query, type="bool_prefix",
+                          fields=[field, f"{field}._2gram", f"{field}._3gram"])
+    # a hit of a multi-valued field may not contribute a new value, fetch some more
+    search = search.source([field]).extra(size=size * 5)
     logger.debug(f"Executing search: {search.to_dict()}")
     response = search.execute()
-    distinct_entries = [bucket.key for bucket in response.aggregations.distinct_entries.buckets]
-    return Response({field: distinct_entries})
 
+    query_tokens = re.findall(r"[\w']+", query.lower())
+    suggestions = []
+    for hit in response:
+        values = getattr(hit, field, None)
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        for value in values:
+            if value not in suggestions and _matches_prefix(value, query_tokens):
+                suggestions.append(value)
+                if len(suggestions) == size:
+                    return suggestions
+    return suggestions
+
+
+class CacheStatsApiView(APIView):
+    """
+    hit/miss counters of the caches. The in-memory caches count for the worker serving the
+    request, the match cache for all workers.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            "generation": get_generation(),
+            "caches": [facet_cache.stats(), search_cache.stats(), get_match_cache().stats()],
+        })
 
 
 class ActivationApiView(APIView):
@@ -130,6 +326,7 @@ class ActivationApiView(APIView):
     def post(self, request, pk):
         ytvideo = self.get_object()
         ytvideo.set_active_and_serialize(is_active=self.is_active)
+        bump_generation()
         return Response({"success": True})
 
 class ActivateYtVideo(ActivationApiView):
@@ -146,17 +343,41 @@ class CheckDuplicateYtVideo(APIView):
         if not yt_id:
             return Response({"success": False, "message": "Missing URL parameter"}, status=400)
         try:
-            search = YtVideoDocument.search()
-            search = search.filter("term", **{"ytid.keyword": yt_id})
-            response = search.execute()
-            if response.hits:
-                videos = [vid['_source'] for vid in response.to_dict()["hits"]["hits"]]
-                return Response({"hasDuplicates": True, "message": "Duplicate found", "videos": videos}, status=200)
+            duplicates = YtVideoDocument.find_duplicates([yt_id], request.query_params.get("t", 0))
+            if duplicates:
+                return Response({"hasDuplicates": True, "message": "Duplicate found", "videos": duplicates[yt_id]},
+                                status=200)
             return Response({"hasDuplicates": False, "message": "Duplicate not found"}, status=200)
         except NotFoundError:
             return Response({"hasDuplicates": False, "message": "Duplicate not found"}, status=200)
 
 
+class CheckDuplicateYtVideos(APIView):
+    """
+    POST body:
+    {
+        "ytids": ["<youtube id>", ...]
+    }
+
+    Response:
+      200: {"hasDuplicates": true, "duplicates": {"<youtube id>": [<video>, ...]}}
+      400: missing or too many ytids
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def post(self, request, *args, **kwargs):
+        ytids = request.data.get("ytids")
+        if not isinstance(ytids, list) or not ytids:
+            return Response({"detail": "Missing 'ytids' in request body."}, status=400)
+        if len(ytids) > CHECK_DUPLICATES_MAX_ITEMS:
+            return Response({"detail": f"At most {CHECK_DUPLICATES_MAX_ITEMS} ytids per request."}, status=400)
+        try:
+            duplicates = YtVideoDocument.find_duplicates([str(ytid) for ytid in ytids])
+        except NotFoundError:
+            duplicates = {}
+        return Response({"hasDuplicates": bool(duplicates), "duplicates": duplicates}, status=200)
+
+
 class LeagueMatchAPIView(APIView):
     """
     POST body:
@@ -259,3 +480,38 @@ class LeagueMatchFromYTVideoAPIView(APIView):
             )
 
         return Response(player_match_data, status=200)
+
+
+class LeagueMatchBatchAPIView(APIView):
+    """
+    POST body:
+    {
+        "urls": ["<op.gg game url or youtube video url>", ...]
+    }
+
+    Response:
+      200: {"results": [{"url": ..., "status": 200, "data": <league match data>} or
+                        {"url": ..., "status": 400 | 404 | 429 | 500, "detail": ...}, ...]}
+           one result per URL, in the order of the request
+      400: missing or too many urls
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    @swagger_auto_schema(
+        request_body=LeagueMatchBatchRequestSerializer,
+        responses={
+            200: openapi.Response("Match data (player) or error per URL",
+                                  schema=openapi.Schema(type=openapi.TYPE_OBJECT)),
+            400: "Missing or too many urls",
+        },
+        operation_summary="Get League match data for many op.gg or youtube URLs",
+        operation_description="Resolves every distinct Riot ID and match once, concurrently, "
+                              "and returns the enriched player match data per URL.",
+    )
+    def post(self, request, *args, **kwargs):
+        urls = request.data.get("urls")
+        if not isinstance(urls, list) or not urls:
+            return Response({"detail": "Missing 'urls' in request body."}, status=400)
+        if len(urls) > LEAGUE_BATCH_MAX_URLS:
+            return Response({"detail": f"At most {LEAGUE_BATCH_MAX_URLS} urls per request."}, status=400)
+        return Response({"results": resolve_league_matches(urls)}, status=200)
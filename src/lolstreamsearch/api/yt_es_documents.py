@@ -26,49 +26,106 @@ POST:
 
 
 """
+import asyncio
+import itertools
 import logging
+from datetime import datetime, timezone
 
 import urllib3
-from elasticsearch_dsl import Text, Date, Keyword, Document, Boolean
+from elasticsearch import ConflictError
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl import Text, Date, Keyword, Document, Boolean, Long, Q
 from rest_framework import serializers
 
-from google_api import get_yt_video_information, get_yt_id_and_timestamp
+from google_api import get_yt_video_information, get_yt_video_informations, get_yt_id_and_timestamp, \
+    get_yt_document_id
 from lolstreamers import settings
+from .cache import bump_generation
+from .query_builder import build_search, parse_query_params
 
 if settings.DEBUG:
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 logger = logging.getLogger(__name__)
 
+# max number of videos returned per ytid by the duplicate check
+DUPLICATES_PER_YTID = 10
+
 
 class YtVideoDocument(Document):
     id = Keyword()
-    ytid = Text()
-    timestamp = Text()
+    ytid = Keyword()
+    timestamp = Keyword()
     title = Text()
     description = Text()
     video_url = Text()
     published_at = Date()
-    champion = Keyword()
-    enemy_champion = Keyword()
-    team_champions = Keyword(multi=True)
-    enemy_team_champions = Keyword(multi=True)
+    # the keyword lists aggregate on these fields, build their global ordinals at refresh
+    # time instead of on the first aggregation after every refresh
+    champion = Keyword(eager_global_ordinals=True)
+    enemy_champion = Keyword(eager_global_ordinals=True)
+    team_champions = Keyword(multi=True, eager_global_ordinals=True)
+    enemy_team_champions = Keyword(multi=True, eager_global_ordinals=True)
     lane = Keyword()
-    runes = Keyword(multi=True)
-    champion_items = Keyword(multi=True)
+    runes = Keyword(multi=True, eager_global_ordinals=True)
+    champion_items = Keyword(multi=True, eager_global_ordinals=True)
     lol_version = Keyword()
-    streamer = Keyword()
+    streamer = Keyword(eager_global_ordinals=True)
     is_active = Boolean()
+    views = Long()
+    likes = Long()
+    stats_updated_at = Date()
 
     class Index:
-        name = 'lolstreamsearch_yt_videos'
+        name = settings.YT_VIDEOS_INDEX
         settings = {
             'number_of_shards': 1,
-            'auto_expand_replicas': '0-1'
+            'auto_expand_replicas': '0-1',
+            # matches the default sort of the list, so sorted top-N queries can stop early
+            'sort.field': ['published_at', 'id'],
+            'sort.order': ['desc', 'asc'],
         }
 
+    @staticmethod
+    def get_write_index() -> str:
+        return settings.YT_VIDEOS_WRITE_ALIAS or settings.YT_VIDEOS_INDEX
+
+    @classmethod
+    def async_search(cls, index=None):
+        """
+        AsyncSearch over the video index on the async connection, for the async read views
+        """
+        from elasticsearch_dsl import AsyncSearch
+        from .async_es import get_async_connection
+
+        return AsyncSearch(using=get_async_connection(), index=index or cls._index._name, doc_type=[cls])
+
+    @classmethod
+    def public_search(cls, asynchronous=False):
+        """
+        search over the active videos only, through the filtered public alias if there is one
+        """
+        if settings.YT_VIDEOS_PUBLIC_ALIAS:
+            if asynchronous:
+                return cls.async_search(index=settings.YT_VIDEOS_PUBLIC_ALIAS)
+            return cls.search(index=settings.YT_VIDEOS_PUBLIC_ALIAS)
+        search = cls.async_search() if asynchronous else cls.search()
+        return search.filter("term", **{"is_active": "true"})
+
+    @classmethod
+    async def async_get(cls, id, **kwargs):
+        """
+        async version of Document.get
+
+        :raises NotFoundError: if there is no video with this id
+        """
+        from .async_es import get_async_connection
+
+        response = await get_async_connection().get(index=cls._index._name, id=id, **kwargs)
+        return cls.from_es(response)
+
     def serialize(self):
-        return {
+        serialized = {
             'id': self.meta.id,
             'ytid': self.ytid,
             'timestamp': self.timestamp,
@@ -85,44 +142,131 @@ class YtVideoDocument(Document):
             'champion_items': self.champion_items,
             'lol_version': self.lol_version,
             'streamer': self.streamer,
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'views': getattr(self, "views", None) or 0,
+            'likes': getattr(self, "likes", None) or 0,
+            'stats_updated_at': getattr(self, "stats_updated_at", None),
         }
+        if "highlight" in self.meta:
+            serialized['highlight'] = self.meta.highlight.to_dict()
+        return serialized
 
     # simple example request
-    # ...ytvideos/?champion=Volibear&lane=&opponent_champion=&runes=Press%20the%20Attack&team_champions=Neeko%2CEzreal%2CPoppy%2CVayne
+    # ...ytvideos/?champion=Volibear&lane=&runes=Press%20the%20Attack&team_champions=Neeko%2CEzreal%2CPoppy%2CVayne
     @staticmethod
     def get_queryset(query_params):
+        """
+        build the (not yet executed) search for the given query params, see query_builder
+        """
         logger.debug("Querying Youtube videos with query params: %s", query_params)
-        videos = YtVideoDocument.search()
-        videos = videos.sort("-published_at")
-        for key, values in query_params.items():
-            if values == "":
-                continue
-            values_list = values.split(",")
-            if key == "streamer":
-                # Create a bool query with should clauses for multiple streamers
-                should_clauses = []
-                for value in values_list:
-                    should_clauses.append({"term": {"streamer": value}})
-                videos = videos.query("bool", should=should_clauses)
-            elif key in ["lane", "is_active", "lol_version"]:
-                videos = videos.filter("term", **{key: values})
-            else:
-                for value in values_list:
-                    videos = videos.filter("term", **{key + ".keyword": value})
+        return YtVideoDocument.build_search(parse_query_params(query_params))
 
+    @staticmethod
+    def get_search_index(query) -> str:
+        """
+        the index or alias build_search searches for the query: the public alias for
+        is_active=true if there is one, else the read alias
+        """
+        if query.filters.get("is_active") == ["true"] and settings.YT_VIDEOS_PUBLIC_ALIAS:
+            return settings.YT_VIDEOS_PUBLIC_ALIAS
+        return settings.YT_VIDEOS_INDEX
+
+    @staticmethod
+    def build_search(query, asynchronous=False):
+        """
+        :param asynchronous: build an AsyncSearch instead of a Search
+        """
+        index = YtVideoDocument.get_search_index(query)
+        # the public alias only contains active videos, no need to filter on every query
+        active_only = bool(settings.YT_VIDEOS_PUBLIC_ALIAS) and index == settings.YT_VIDEOS_PUBLIC_ALIAS
+        videos = YtVideoDocument.async_search(index) if asynchronous else YtVideoDocument.search(index=index)
+        videos = build_search(videos, query, active_only=active_only)
         logger.debug(f"videos.to_dict(): {videos.to_dict()}")
-        logger.debug("Found %s videos", videos.count())
-        video_list = [hit.serialize() for hit in videos]
-        return video_list
+        return videos
+
+    @staticmethod
+    def get_facets(response) -> dict:
+        """
+        read the facet buckets of a search built with query_builder.add_facets
+        """
+        aggregations = response.to_dict().get("aggregations", {})
+        return {
+            facet: [{"key": bucket["key"], "doc_count": bucket["doc_count"]}
+                    for bucket in aggregation["values"]["buckets"]]
+            for facet, aggregation in aggregations.items()
+        }
 
     def set_active_and_serialize(self, is_active=True):
         logger.debug("Setting Youtube video %s to active: %s", self.meta.id, is_active)
-        self.update(is_active=is_active, refresh=True)
+        self.update(index=self.get_write_index(), is_active=is_active, refresh=True)
         return self.serialize()
 
+    @staticmethod
+    def find_duplicates(ytids: list[str], timestamp=0) -> dict[str, list[dict]]:
+        """
+        find the indexed videos of the given YouTube ids.
+
+        The videos at any timestamp are found with one terms search. The deterministic ids
+        of the videos at the given timestamp are fetched with a realtime mget as well, so
+        they are found even if they are not refreshed yet.
+
+        :return: dict of ytid -> list of the _source of the indexed videos, ytids without
+                 duplicates are missing
+        """
+        ytids = list(dict.fromkeys(ytids))
+        documents = YtVideoDocument.mget([get_yt_document_id(ytid, timestamp) for ytid in ytids],
+                                         missing="skip")
+        response = YtVideoDocument._duplicates_search(YtVideoDocument.search(), ytids).execute()
+        return YtVideoDocument._merge_duplicates(
+            [(document.meta.id, document.to_dict()) for document in documents],
+            [(hit["_id"], hit["_source"]) for hit in response.to_dict()["hits"]["hits"]],
+        )
+
+    @staticmethod
+    async def afind_duplicates(ytids: list[str], timestamp=0) -> dict[str, list[dict]]:
+        """
+        async version of find_duplicates, the mget and the search run concurrently
+        """
+        from .async_es import get_async_connection
+
+        ytids = list(dict.fromkeys(ytids))
+        mget_response, response = await asyncio.gather(
+            get_async_connection().mget(index=YtVideoDocument._index._name,
+                                        ids=[get_yt_document_id(ytid, timestamp) for ytid in ytids]),
+            YtVideoDocument._duplicates_search(YtVideoDocument.async_search(), ytids).execute(),
+        )
+        return YtVideoDocument._merge_duplicates(
+            [(document["_id"], document["_source"]) for document in mget_response["docs"] if document.get("found")],
+            [(hit["_id"], hit["_source"]) for hit in response.to_dict()["hits"]["hits"]],
+        )
+
+    @staticmethod
+    def _duplicates_search(search, ytids: list[str]):
+        # ytid is a keyword field in the indices created by reindex_yt_videos, the legacy
+        # index maps it as text with a .keyword sub-field. Until the aliases point to a
+        # reindexed index both are searched, the missing field matches nothing.
+        search = search.filter(Q("terms", ytid=ytids) | Q("terms", **{"ytid.keyword": ytids}))
+        return search.extra(size=len(ytids) * DUPLICATES_PER_YTID)
+
+    @staticmethod
+    def _merge_duplicates(*documents: list[tuple[str, dict]]) -> dict[str, list[dict]]:
+        """
+        :param documents: lists of (document id, _source), a document found twice is only listed once
+        :return: dict of ytid -> list of _source
+        """
+        duplicates = {}
+        seen = set()
+        for doc_id, source in itertools.chain(*documents):
+            if doc_id not in seen:
+                seen.add(doc_id)
+                duplicates.setdefault(source["ytid"], []).append(source)
+        return duplicates
+
 
 class YtVideoDocumentSerializer(serializers.Serializer):
+    """
+    pass `fields` to only serialize a subset of the fields, see query_builder.get_projection
+    """
     id = serializers.CharField(required=False)
     ytid = serializers.CharField(required=False)
     timestamp = serializers.CharField(required=False)
@@ -140,50 +284,155 @@ class YtVideoDocumentSerializer(serializers.Serializer):
     lol_version = serializers.CharField()
     streamer = serializers.CharField(required=False)
     is_active = serializers.BooleanField(required=False)
-    views = serializers.IntegerField(required=False)
-    likes = serializers.IntegerField(required=False)
-
+    views = serializers.IntegerField(required=False, read_only=True)
+    likes = serializers.IntegerField(required=False, read_only=True)
+    stats_updated_at = serializers.DateTimeField(required=False, read_only=True)
+    highlight = serializers.DictField(child=serializers.ListField(child=serializers.CharField()),
+                                      required=False, read_only=True)
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            # highlight fragments are not a document field, they are kept whenever present
+            for field_name in set(self.fields) - set(fields) - {'highlight'}:
+                self.fields.pop(field_name)
 
     def to_representation(self, instance):
+        # views and likes are served from the index, they are kept fresh by the
+        # refresh_yt_stats management command instead of asking YouTube per hit
         representation = super().to_representation(instance)
         if isinstance(instance, YtVideoDocument):
             representation['id'] = instance.meta.id
 
-        representation['ytid'], representation['timestamp'] = get_yt_id_and_timestamp(instance['video_url'])
-        yt_info = get_yt_video_information(representation['ytid'])
-        representation['views'] = yt_info.views
-        representation['likes'] = yt_info.likes
+        if 'ytid' in self.fields or 'timestamp' in self.fields:
+            if not representation.get('ytid') and instance.get('video_url'):
+                ytid, timestamp = get_yt_id_and_timestamp(instance.get('video_url'))
+                representation.update({'ytid': ytid, 'timestamp': timestamp})
+            for field_name in ('ytid', 'timestamp'):
+                if field_name not in self.fields:
+                    representation.pop(field_name, None)
+        for field_name in ('views', 'likes'):
+            if field_name in self.fields:
+                representation[field_name] = representation.get(field_name) or 0
         return representation
 
-    def _set_validated_data(self, validated_data):
+    def _set_validated_data(self, validated_data, yt_video_info=None):
         ytid, timestamp = get_yt_id_and_timestamp(validated_data['video_url'], validate=True)
-        yt_video_info = get_yt_video_information(ytid)
+        if yt_video_info is None:
+            yt_video_info = get_yt_video_information(ytid)
         validated_data['ytid'] = ytid
         validated_data['timestamp'] = timestamp
         validated_data['title'] = yt_video_info.title
         validated_data['description'] = yt_video_info.description
         validated_data['published_at'] = yt_video_info.published_at
         validated_data['streamer'] = yt_video_info.channel
+        validated_data['views'] = int(yt_video_info.views)
+        validated_data['likes'] = int(yt_video_info.likes)
+        validated_data['stats_updated_at'] = datetime.now(timezone.utc)
 
-    def _save(self, validated_data):
-        ytvideo = YtVideoDocument(**validated_data)
-        result = ytvideo.save(return_doc_meta=True, refresh=True)
+    @staticmethod
+    def _build_document(validated_data) -> YtVideoDocument:
+        # new videos get a deterministic id, so the same video and timestamp can't be added twice.
+        # The id is stored in the document as well, it is the tiebreaker for cursor pagination
+        validated_data.setdefault('_id', get_yt_document_id(validated_data['ytid'], validated_data['timestamp']))
+        validated_data['id'] = validated_data['_id']
+        return YtVideoDocument(**validated_data)
+
+    def _save(self, validated_data, op_type='index'):
+        ytvideo = self._build_document(validated_data)
+        try:
+            result = ytvideo.save(index=YtVideoDocument.get_write_index(), return_doc_meta=True, refresh=True,
+                                  op_type=op_type)
+        except ConflictError:
+            raise serializers.ValidationError({'video_url': ['This video with this timestamp already exists.']})
         meta_id = result.body.get("_id")
         ytvideo.meta.id = meta_id
         ytvideo.id = meta_id
         return ytvideo
 
-    def create(self, validated_data):
+    def _prepare_create(self, validated_data, yt_video_info=None):
         if 'id' in validated_data:
             del validated_data['id']
-        self._set_validated_data(validated_data)
+        self._set_validated_data(validated_data, yt_video_info)
         validated_data['is_active'] = False
-        return self._save(validated_data)
+
+    def create(self, validated_data):
+        self._prepare_create(validated_data)
+        ytvideo = self._save(validated_data, op_type='create')
+        bump_generation()
+        return ytvideo
 
     def update(self, instance, validated_data):
         self._set_validated_data(validated_data)
-        validated_data['_id'] = instance.meta.id
-        return self._save(validated_data)
+        validated_data['_id'] = get_yt_document_id(validated_data['ytid'], validated_data['timestamp'])
+        if validated_data['_id'] == instance.meta.id:
+            ytvideo = self._save(validated_data)
+        else:
+            # the video or the timestamp changed (or it's a video indexed before the ids were
+            # deterministic), it moves to the id of its new video and timestamp
+            ytvideo = self._save(validated_data, op_type='create')
+            instance.delete(index=YtVideoDocument.get_write_index(), refresh=True)
+        bump_generation()
+        return ytvideo
+
+    @classmethod
+    def bulk_create(cls, payloads: list) -> list[dict]:
+        """
+        validate and index many videos at once.
+
+        The YouTube metadata of all videos is fetched with batched videos.list calls, the
+        documents are written with one _bulk request per chunk and the index is refreshed
+        once at the end.
+
+        :return: one result per payload, in the same order:
+                 {"index": i, "status": 201, "id": "<doc id>"} or
+                 {"index": i, "status": 400, "errors": {...}}
+        """
+        results = [None] * len(payloads)
+        valid = {}
+        for index, payload in enumerate(payloads):
+            serializer = cls(data=payload)
+            if not serializer.is_valid():
+                results[index] = {"index": index, "status": 400, "errors": serializer.errors}
+                continue
+            try:
+                ytid, _ = get_yt_id_and_timestamp(serializer.validated_data['video_url'], validate=True)
+            except ValueError as e:
+                results[index] = {"index": index, "status": 400, "errors": {"video_url": [str(e)]}}
+                continue
+            valid[index] = (serializer, ytid)
+
+        yt_video_infos = get_yt_video_informations([ytid for _, ytid in valid.values()])
+        documents = {}
+        indexes_by_id = {}
+        for index, (serializer, ytid) in valid.items():
+            validated_data = dict(serializer.validated_data)
+            serializer._prepare_create(validated_data, yt_video_infos[ytid])
+            document = cls._build_document(validated_data)
+            if document.meta.id in indexes_by_id:
+                results[index] = {"index": index, "status": 409,
+                                  "errors": {"video_url": ["Duplicate video in this request."]}}
+                continue
+            indexes_by_id[document.meta.id] = index
+            documents[index] = document
+
+        if documents:
+            connection = YtVideoDocument._get_connection()
+            actions = ({**document.to_dict(include_meta=True), "_op_type": "create",
+                        "_index": YtVideoDocument.get_write_index()}
+                       for document in documents.values())
+            for ok, item in streaming_bulk(connection, actions,
+                                           raise_on_error=False, raise_on_exception=False):
+                operation = next(iter(item.values()))
+                index = indexes_by_id[operation["_id"]]
+                if ok:
+                    results[index] = {"index": index, "status": 201, "id": operation["_id"]}
+                else:
+                    results[index] = {"index": index, "status": operation.get("status", 500),
+                                      "errors": {"non_field_errors": [str(operation.get("error"))]}}
+            connection.indices.refresh(index=YtVideoDocument.get_write_index())
+            bump_generation()
+        return results
 
 
 class ChampionKeywordSerializer(serializers.Serializer):
@@ -211,3 +460,13 @@ class EnemyTeamChampionKeywordSerializer(serializers.Serializer):
 
 class StreamerKeywordSerializer(serializers.Serializer):
     streamer = serializers.ListSerializer(child=serializers.CharField())
+
+
+class FacetsSerializer(serializers.Serializer):
+    champion = serializers.ListSerializer(child=serializers.CharField())
+    enemy_champion = serializers.ListSerializer(child=serializers.CharField())
+    team_champions = serializers.ListSerializer(child=serializers.CharField())
+    enemy_team_champions = serializers.ListSerializer(child=serializers.CharField())
+    runes = serializers.ListSerializer(child=serializers.CharField())
+    champion_items = serializers.ListSerializer(child=serializers.CharField())
+    streamer = serializers.ListSerializer(child=serializers.CharField())
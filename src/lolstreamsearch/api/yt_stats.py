@@ -0,0 +1,86 @@
+"""
+Background refresh of the YouTube view and like counts stored in the index.
+
+The list endpoints serve `views` and `likes` straight from Elasticsearch, this module keeps
+them up to date by scanning the index and asking YouTube for the statistics of up to
+MAX_IDS_PER_REQUEST videos per videos.list call.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl import Q
+
+from google_api import get_yt_video_statistics, get_yt_id_and_timestamp, MAX_IDS_PER_REQUEST
+from .yt_es_documents import YtVideoDocument
+
+logger = logging.getLogger(__name__)
+
+
+def _get_ytid(hit) -> str | None:
+    if getattr(hit, "ytid", None):
+        return hit.ytid
+    try:
+        return get_yt_id_and_timestamp(hit.video_url)[0]
+    except (ValueError, AttributeError):
+        logger.warning(f"Could not determine YouTube id of document {hit.meta.id}")
+        return None
+
+
+def _refresh_batch(hits: list) -> int:
+    ytids = {hit.meta.id: _get_ytid(hit) for hit in hits}
+    statistics = get_yt_video_statistics([ytid for ytid in ytids.values() if ytid])
+    now = datetime.now(timezone.utc).isoformat()
+    actions = []
+    unavailable = 0
+    for hit in hits:
+        doc = {"stats_updated_at": now}
+        if ytids[hit.meta.id] in statistics:
+            doc.update(statistics[ytids[hit.meta.id]])
+        elif statistics:
+            # YouTube answered but doesn't return deleted or private videos, stamp them so
+            # they aren't scanned again before max_age
+            unavailable += 1
+        else:
+            # nothing came back, the request failed or the quota is used up
+            continue
+        actions.append({"_op_type": "update", "_index": hit.meta.index, "_id": hit.meta.id, "doc": doc})
+    if unavailable:
+        logger.info(f"{unavailable} videos have no statistics on YouTube")
+    if not actions:
+        return 0
+    updated, errors = bulk(YtVideoDocument._get_connection(), actions, raise_on_error=False)
+    for error in errors:
+        logger.error(f"Error updating video statistics: {error}")
+    return updated
+
+
+def refresh_video_statistics(max_age: timedelta | None = None,
+                             batch_size: int = MAX_IDS_PER_REQUEST) -> int:
+    """
+    refresh views and likes of all indexed videos
+
+    :param max_age: only refresh documents whose statistics are older than this
+    :param batch_size: number of videos per YouTube request (max MAX_IDS_PER_REQUEST)
+    :return: number of updated documents
+    """
+    batch_size = min(batch_size, MAX_IDS_PER_REQUEST)
+    search = YtVideoDocument.search().source(["ytid", "video_url"])
+    if max_age is not None:
+        updated_before = datetime.now(timezone.utc) - max_age
+        search = search.filter(
+            Q("range", stats_updated_at={"lt": updated_before.isoformat()})
+            | ~Q("exists", field="stats_updated_at")
+        )
+
+    updated = 0
+    batch = []
+    for hit in search.scan():
+        batch.append(hit)
+        if len(batch) == batch_size:
+            updated += _refresh_batch(batch)
+            batch = []
+    if batch:
+        updated += _refresh_batch(batch)
+    logger.info(f"Refreshed statistics of {updated} videos")
+    return updated
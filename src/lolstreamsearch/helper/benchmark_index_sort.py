@@ -0,0 +1,178 @@
+"""
+Compare the latency of the list and keyword-list queries on a sorted and an unsorted index.
+
+Two indices are filled with the same synthetic videos: one with the mappings and settings
+of lolstream_index_template.json (index sorting on published_at, eager global ordinals),
+one with the sorting and eager global ordinals removed. Every query shape is run against
+both indices and the latency percentiles are printed. The indices are deleted afterwards.
+
+usage (with src/ on the PYTHONPATH, as in the docker image):
+    python benchmark_index_sort.py [--documents 100000] [--runs 200]
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator
+
+import requests
+
+from fill_db import index_documents
+
+TEMPLATE_FILE = Path(__file__).resolve().parent.parent / "api" / "lolstream_index_template.json"
+SORTED_INDEX = "benchmark_yt_videos_sorted"
+UNSORTED_INDEX = "benchmark_yt_videos_unsorted"
+
+CHAMPIONS = [f"Champion{i}" for i in range(170)]
+ITEMS = [f"Item{i}" for i in range(200)]
+RUNES = [f"Rune{i}" for i in range(60)]
+STREAMERS = [f"streamer{i}" for i in range(80)]
+LANES = ["top", "jungle", "mid", "adc", "support"]
+
+QUERIES = {
+    # first page of the list, the shape the frontend sends most
+    "top 20 by published_at": {
+        "size": 20,
+        "sort": [{"published_at": "desc"}, {"id": "asc"}],
+        "track_total_hits": False,
+    },
+    # the page of the paginator: one extra hit for the next link, total counted up to 1000
+    # (YT_VIDEOS_TRACK_TOTAL_HITS)
+    "top 20 by published_at, count capped at 1000": {
+        "size": 21,
+        "sort": [{"published_at": "desc"}, {"id": "asc"}],
+        "track_total_hits": 1000,
+    },
+    # same page with an exact total, which makes every query visit all matching documents
+    "top 20 by published_at, exact count": {
+        "size": 20,
+        "sort": [{"published_at": "desc"}, {"id": "asc"}],
+        "track_total_hits": True,
+    },
+    "top 20 of a champion by published_at": {
+        "size": 20,
+        "sort": [{"published_at": "desc"}, {"id": "asc"}],
+        "track_total_hits": False,
+        "query": {"bool": {"filter": [{"term": {"champion.keyword": "Champion7"}}]}},
+    },
+    # keyword lists, run right after a refresh so global ordinals have to be (re)built
+    "keyword lists after refresh": {
+        "size": 0,
+        "aggs": {
+            field: {"terms": {"field": f"{field}.keyword", "size": 300}}
+            for field in ["champion", "enemy_champion", "team_champions", "runes", "champion_items"]
+        },
+    },
+}
+
+
+def synthetic_documents(count: int, seed: int = 42) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        team = rng.sample(CHAMPIONS, 5)
+        enemy_team = rng.sample(CHAMPIONS, 5)
+        yield {
+            "video_url": f"https://www.youtube.com/watch?v=b{i:010d}",
+            "title": f"Synthetic video {i}",
+            "description": "synthetic benchmark document",
+            "published_at": (start + timedelta(minutes=rng.randrange(5 * 365 * 24 * 60))).isoformat(),
+            "champion": team[0],
+            "enemy_champion": enemy_team[0],
+            "team_champions": team,
+            "enemy_team_champions": enemy_team,
+            "lane": rng.choice(LANES),
+            "runes": rng.sample(RUNES, 6),
+            "champion_items": rng.sample(ITEMS, 6),
+            "lol_version": f"14.{rng.randrange(1, 25)}",
+            "streamer": rng.choice(STREAMERS),
+            "is_active": True,
+        }
+
+
+def get_index_bodies() -> tuple[dict, dict]:
+    """
+    :return: (body of the sorted index, body of the unsorted index)
+    """
+    with open(TEMPLATE_FILE, "r") as file:
+        template = json.load(file)["template"]
+    sorted_body = {"settings": {**template["settings"], "number_of_shards": 1},
+                   "mappings": template["mappings"]}
+
+    unsorted_body = copy.deepcopy(sorted_body)
+    unsorted_body["settings"].pop("sort.field")
+    unsorted_body["settings"].pop("sort.order")
+    for mapping in unsorted_body["mappings"]["properties"].values():
+        mapping.pop("eager_global_ordinals", None)
+        for sub_field in mapping.get("fields", {}).values():
+            sub_field.pop("eager_global_ordinals", None)
+    return sorted_body, unsorted_body
+
+
+def run_query(session: requests.Session, es_host: str, index: str, body: dict,
+              refresh: bool) -> tuple[float, int]:
+    """
+    :return: (wall clock latency in ms, took reported by elasticsearch in ms)
+    """
+    if refresh:
+        # a refresh without new documents does not invalidate global ordinals, index one first
+        session.post(f"{es_host}/{index}/_doc?refresh=true", json={"published_at": "2019-01-01"}, timeout=60)
+    start = time.perf_counter()
+    response = session.post(f"{es_host}/{index}/_search?request_cache=false", json=body, timeout=60)
+    elapsed = (time.perf_counter() - start) * 1000
+    response.raise_for_status()
+    return elapsed, response.json()["took"]
+
+
+def percentiles(values: list[float]) -> str:
+    quantiles = statistics.quantiles(values, n=100)
+    return f"p50 {quantiles[49]:7.1f}  p95 {quantiles[94]:7.1f}  p99 {quantiles[98]:7.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index sorting and eager global ordinals")
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="do not delete the benchmark indices")
+    args = parser.parse_args()
+
+    es_host = os.getenv("ELASTIC_HOST")
+    api_key = os.getenv("ELASTIC_BULK_API_KEY")
+    session = requests.Session()
+    session.headers.update({"Authorization": f"ApiKey {api_key}"})
+    session.verify = False
+
+    sorted_body, unsorted_body = get_index_bodies()
+    try:
+        for index, body in ((SORTED_INDEX, sorted_body), (UNSORTED_INDEX, unsorted_body)):
+            session.delete(f"{es_host}/{index}", timeout=60)
+            session.put(f"{es_host}/{index}", json=body, timeout=60).raise_for_status()
+            start = time.monotonic()
+            indexed, failed = index_documents(synthetic_documents(args.documents), es_host, index, api_key)
+            print(f"{index}: indexed {indexed} documents ({failed} failed) in {time.monotonic() - start:.1f}s")
+            session.post(f"{es_host}/{index}/_forcemerge?max_num_segments=1", timeout=600)
+
+        for name, body in QUERIES.items():
+            refresh = "aggs" in body
+            runs = args.runs // 10 if refresh else args.runs
+            print(f"\n{name} ({runs} runs, ms)")
+            for index in (SORTED_INDEX, UNSORTED_INDEX):
+                # warm up the caches and the connection
+                for _ in range(5):
+                    run_query(session, es_host, index, body, refresh=False)
+                results = [run_query(session, es_host, index, body, refresh) for _ in range(runs)]
+                print(f"  {index:32} wall {percentiles([r[0] for r in results])}   "
+                      f"took {percentiles([r[1] for r in results])}")
+    finally:
+        if not args.keep:
+            for index in (SORTED_INDEX, UNSORTED_INDEX):
+                session.delete(f"{es_host}/{index}", timeout=60)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,184 @@
+"""
+Seed the video index with documents from a json array or NDJSON file.
+
+The documents are streamed from the file and sent as sized _bulk requests over one pooled
+session by several concurrent workers. Every document is indexed with a deterministic id
+derived from its YouTube id and timestamp, so running the loader again overwrites the
+documents instead of creating duplicates.
+
+usage (with src/ on the PYTHONPATH, as in the docker image):
+    python fill_db.py [--file ../api/initial_data.json] [--workers 4] [--batch-size 500]
+"""
+import argparse
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Dict, Iterator, List
 
 import requests
-from typing import List, Dict
+from requests.adapters import HTTPAdapter
 
+from yt_ids import parse_yt_url, get_yt_document_id
 
-def load_initial_data() -> List[Dict]:
-    with open('../api/initial_data.json', 'r') as file:
-        return json.load(file)
+DEFAULT_FILE = Path(__file__).resolve().parent.parent / "api" / "initial_data.json"
+DEFAULT_INDEX = "lolstreamsearch_yt_videos"
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
 
 
-def index_documents(documents: List[Dict], es_host: str, index_name: str, api_key) -> None:
+def iter_documents(path: Path) -> Iterator[Dict]:
     """
-    Index documents into Elasticsearch
+    stream the documents of a json array or NDJSON file without loading the whole file
     """
-    headers = {'Content-Type': 'application/json',
-               'Authorization': f'ApiKey {api_key}'}
+    decoder = json.JSONDecoder()
+    with open(path, "r") as file:
+        buffer = file.read(READ_CHUNK_SIZE).lstrip()
+        if not buffer.startswith("["):
+            # NDJSON, one document per line
+            for line in _iter_lines(buffer, file):
+                if line.strip():
+                    yield json.loads(line)
+            return
 
-    for doc in documents:
-        doc_id = doc['video_url'].split('watch?v=')[1].split('&')[0]  # Extract YouTube video ID
-        url = f"{es_host}/{index_name}/_doc/"
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                document, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield document
+            buffer = buffer[end:]
 
+
+def _iter_lines(buffer: str, file) -> Iterator[str]:
+    while True:
+        *lines, buffer = buffer.split("\n")
+        yield from lines
+        chunk = file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            yield buffer
+            return
+        buffer += chunk
+
+
+def prepare_document(doc: Dict) -> tuple[str, Dict]:
+    """
+    :raises ValueError: if the document has no valid video_url
+    """
+    if not isinstance(doc, dict) or "video_url" not in doc:
+        raise ValueError("Missing video_url")
+    ytid, timestamp = parse_yt_url(doc["video_url"])
+    doc_id = get_yt_document_id(ytid, timestamp)
+    return doc_id, {**doc, "id": doc_id, "ytid": ytid, "timestamp": timestamp}
+
+
+def iter_batches(documents: Iterator[Dict], index_name: str, batch_size: int,
+                 skipped: List | None = None) -> Iterator[List[str]]:
+    """
+    group the documents into _bulk bodies of at most batch_size documents and MAX_BATCH_BYTES
+
+    :param skipped: the documents without valid video_url are skipped and appended to it
+    """
+    batch, batch_bytes = [], 0
+    for doc in documents:
         try:
-            response = requests.post(url, headers=headers, json=doc, verify=False)
-            if response.status_code in (200, 201):
-                print(f"Successfully indexed document with ID: {doc_id}")
-            else:
-                print(f"Failed to index document {doc_id}. Status: {response.status_code}")
-                print(f"Error: {response.text}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error indexing document {doc_id}: {str(e)}")
+            doc_id, source = prepare_document(doc)
+        except ValueError as e:
+            print(f"Skipped document {doc.get('video_url') if isinstance(doc, dict) else doc!r}: {e}")
+            if skipped is not None:
+                skipped.append(doc)
+            continue
+        lines = json.dumps({"index": {"_index": index_name, "_id": doc_id}}) + "\n" + json.dumps(source) + "\n"
+        if batch and (len(batch) == batch_size or batch_bytes + len(lines) > MAX_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(lines)
+        batch_bytes += len(lines)
+    if batch:
+        yield batch
+
+
+def send_batch(session: requests.Session, es_host: str, batch: List[str]) -> tuple[int, int]:
+    """
+    :return: (indexed documents, failed documents)
+    """
+    try:
+        response = session.post(f"{es_host}/_bulk", data="".join(batch).encode("utf-8"), timeout=60)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error sending batch of {len(batch)} documents: {str(e)}")
+        return 0, len(batch)
+
+    result = response.json()
+    failed = 0
+    for item in result["items"]:
+        operation = item["index"]
+        if operation.get("error"):
+            failed += 1
+            print(f"Failed to index document {operation['_id']}: {operation['error']}")
+    return len(batch) - failed, failed
+
+
+def index_documents(documents: Iterator[Dict], es_host: str, index_name: str, api_key,
+                    workers: int = 4, batch_size: int = 500, verify_certs: bool = False) -> tuple[int, int]:
+    """
+    Index documents into Elasticsearch
+
+    :return: (indexed documents, failed documents), failed includes the skipped documents
+    """
+    session = requests.Session()
+    session.headers.update({'Content-Type': 'application/x-ndjson',
+                            'Authorization': f'ApiKey {api_key}'})
+    session.verify = verify_certs
+    session.mount(es_host, HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+
+    indexed, failed = 0, 0
+    skipped = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for batch in iter_batches(documents, index_name, batch_size, skipped):
+            # keep at most two batches per worker in memory
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_indexed, batch_failed = future.result()
+                    indexed, failed = indexed + batch_indexed, failed + batch_failed
+            pending.add(executor.submit(send_batch, session, es_host, batch))
+        for future in pending:
+            batch_indexed, batch_failed = future.result()
+            indexed, failed = indexed + batch_indexed, failed + batch_failed
+
+    session.post(f"{es_host}/{index_name}/_refresh", timeout=60)
+    return indexed, failed + len(skipped)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Seed the video index")
+    parser.add_argument("--file", type=Path, default=DEFAULT_FILE)
+    parser.add_argument("--index", default=DEFAULT_INDEX)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
     # Configuration
     es_host = os.getenv("ELASTIC_HOST")
     api_key = os.getenv("ELASTIC_BULK_API_KEY")
-    verify_certs = False,
-    index_name = "lolstreamsearch_yt_videos"
-
-    # Load documents
-    documents = load_initial_data()
 
-    # Index documents
-    index_documents(documents, es_host, index_name, api_key)
+    start = time.monotonic()
+    indexed, failed = index_documents(iter_documents(args.file), es_host, args.index, api_key,
+                                      workers=args.workers, batch_size=args.batch_size)
+    elapsed = time.monotonic() - start
+    print(f"Indexed {indexed} documents ({failed} failed) in {elapsed:.2f}s, "
+          f"{indexed / elapsed if elapsed else 0:.0f} docs/s")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lolstreamsearch.api.reindex import ReindexError, ensure_id_field
+from lolstreamsearch.api.yt_es_documents import YtVideoDocument
+
+
+class Command(BaseCommand):
+    help = "Map the id field of the video index as keyword and set it on the documents without one"
+
+    def handle(self, *args, **options):
+        index = settings.YT_VIDEOS_INDEX
+        try:
+            updated = ensure_id_field(YtVideoDocument._get_connection(), index)
+        except ReindexError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Mapped id of {index} as keyword, set the id of {updated} documents"))
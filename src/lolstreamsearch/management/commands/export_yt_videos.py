@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lolstreamsearch.api.export import iter_export, EXPORT_SLICES, EXPORT_PAGE_SIZE
+
+
+class Command(BaseCommand):
+    help = "Export the video index as NDJSON, with the same filters as the ytvideos list"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", "-o", default="-",
+            help="file to write to, defaults to stdout",
+        )
+        parser.add_argument(
+            "--filter", "-f", action="append", default=[], metavar="PARAM=VALUE",
+            help="ytvideos list query param, e.g. --filter champion=Yorick --filter is_active=true",
+        )
+        parser.add_argument("--slices", type=int, default=EXPORT_SLICES)
+        parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+
+    def handle(self, *args, **options):
+        query_params = {}
+        for query_filter in options["filter"]:
+            if "=" not in query_filter:
+                raise CommandError(f"Invalid filter '{query_filter}', expected PARAM=VALUE")
+            key, value = query_filter.split("=", 1)
+            query_params[key] = value
+
+        output = sys.stdout if options["output"] == "-" else open(options["output"], "w")
+        exported = 0
+        try:
+            for line in iter_export(query_params, slices=options["slices"], page_size=options["page_size"]):
+                output.write(line)
+                exported += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(self.style.SUCCESS(f"Exported {exported} videos"))
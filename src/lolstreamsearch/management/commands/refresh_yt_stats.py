@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from lolstreamsearch.api.yt_stats import refresh_video_statistics
+
+
+class Command(BaseCommand):
+    help = "Refresh the YouTube view and like counts stored in the video index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age-hours", type=float, default=None,
+            help="only refresh videos whose statistics are older than this many hours",
+        )
+        parser.add_argument(
+            "--interval", type=int, default=None,
+            help="keep running and refresh every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **options):
+        max_age = None
+        if options["max_age_hours"] is not None:
+            max_age = timedelta(hours=options["max_age_hours"])
+
+        while True:
+            updated = refresh_video_statistics(max_age=max_age)
+            self.stdout.write(self.style.SUCCESS(f"Refreshed statistics of {updated} videos"))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
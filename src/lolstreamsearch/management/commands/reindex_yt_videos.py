@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lolstreamsearch.api.reindex import ReindexError, get_alias_names, reindex
+
+
+class Command(BaseCommand):
+    help = "Copy the video index into a new versioned index and atomically move the aliases to it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests-per-second", type=float, default=-1,
+            help="throttle the copy to this many documents per second (default: unthrottled)",
+        )
+        parser.add_argument(
+            "--delete-old", action="store_true",
+            help="delete the previous versioned indices after the aliases were moved",
+        )
+
+    def handle(self, *args, **options):
+        read_alias = settings.YT_VIDEOS_INDEX
+        try:
+            index = reindex(read_alias, requests_per_second=options["requests_per_second"],
+                            keep_old=not options["delete_old"])
+        except ReindexError as e:
+            raise CommandError(str(e))
+
+        aliases = get_alias_names(read_alias)
+        self.stdout.write(self.style.SUCCESS(f"Aliases now point to {index}"))
+        self.stdout.write("Route writes and public reads through the aliases with:\n"
+                          f"  YT_VIDEOS_WRITE_ALIAS={aliases['write']}\n"
+                          f"  YT_VIDEOS_PUBLIC_ALIAS={aliases['public']}")
@@ -0,0 +1,41 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from lolstreamsearch.api.ddragon import DDRAGON_SNAPSHOT_DIR, sync_snapshot, prune_snapshots
+
+
+class Command(BaseCommand):
+    help = "Download the Data Dragon payloads of the latest patch into the local snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--version", help="patch to install instead of the latest, e.g. 15.22.1")
+        parser.add_argument("--snapshot-dir", default=DDRAGON_SNAPSHOT_DIR)
+        parser.add_argument(
+            "--keep", type=int, default=2,
+            help="number of snapshots kept on disk, older ones are deleted",
+        )
+        parser.add_argument(
+            "--interval", type=int, default=None,
+            help="keep running and check for a new patch every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                version, changed = sync_snapshot(options["version"], options["snapshot_dir"])
+                if changed:
+                    self.stdout.write(self.style.SUCCESS(f"Installed Data Dragon snapshot {version}"))
+                    for deleted in prune_snapshots(options["snapshot_dir"], options["keep"]):
+                        self.stdout.write(f"Deleted Data Dragon snapshot {deleted}")
+                else:
+                    self.stdout.write(f"Data Dragon snapshot {version} is up to date")
+            except (requests.RequestException, OSError) as e:
+                # download errors and a snapshot dir that can't be written (full disk, permissions)
+                if not options["interval"]:
+                    raise CommandError(f"Error syncing Data Dragon: {e}")
+                self.stderr.write(f"Error syncing Data Dragon: {e}")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
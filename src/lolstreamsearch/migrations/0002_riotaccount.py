@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lolstreamsearch', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiotAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_name', models.CharField(max_length=64)),
+                ('tag_line', models.CharField(max_length=16)),
+                ('puuid', models.CharField(blank=True, max_length=78, null=True)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('game_name', 'tag_line'), name='unique_riot_id')],
+            },
+        ),
+    ]
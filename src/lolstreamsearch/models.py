@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class IndexGeneration(models.Model):
+    """
+    Write generation of an Elasticsearch index.
+
+    Every write to the index bumps the generation. Caches key their entries on it, so
+    the gunicorn workers invalidate them without talking to each other. Each worker reuses
+    the generation it read for YT_VIDEOS_GENERATION_TTL seconds, the other workers may
+    serve outdated entries for that long after a write.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.generation})"
+
+
+class RiotAccount(models.Model):
+    """
+    PUUID of a Riot ID, cached because it never changes for an account.
+
+    game_name and tag_line are stored lowercased, Riot IDs are case-insensitive. A puuid of
+    None records that Riot does not know the Riot ID. Entries are refreshed after
+    RIOT_ACCOUNT_TTL (RIOT_ACCOUNT_NOT_FOUND_TTL for unknown Riot IDs) to catch renames.
+    """
+    game_name = models.CharField(max_length=64)
+    tag_line = models.CharField(max_length=16)
+    puuid = models.CharField(max_length=78, null=True, blank=True)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["game_name", "tag_line"], name="unique_riot_id"),
+        ]
+
+    def is_fresh(self) -> bool:
+        ttl = settings.RIOT_ACCOUNT_TTL if self.puuid else settings.RIOT_ACCOUNT_NOT_FOUND_TTL
+        return ttl is None or self.fetched_at + ttl > timezone.now()
+
+    def __str__(self):
+        return f"{self.game_name}#{self.tag_line} ({self.puuid or 'unknown'})"
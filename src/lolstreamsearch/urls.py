@@ -1,6 +1,7 @@
 from rest_framework.routers import DefaultRouter
 
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 
 from .api import views
 
@@ -41,11 +42,59 @@ router.register(
     basename='streamers'
 )
 
+router.register(
+    'facets',
+    views.FacetsListViewSet,
+    basename='facets'
+)
+
+# has to come before the router, the ytvideos detail route would match it otherwise
+urlpatterns = [
+    path('ytvideos/check-duplicates/', views.CheckDuplicateYtVideos.as_view(), name='check-duplicates-ytvideos'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    from .api import async_views
+
+    # the detail route must not capture the extra actions of the viewset (export, bulk)
+    ytvideo_actions = "|".join(extra_action.url_path
+                               for extra_action in views.YtVideoListViewSet.get_extra_actions())
+    keyword_lists = [
+        ('champions/', views.ChampionKeywordListViewSet, 'champion', '.keyword'),
+        ('enemy-champions/', views.EnemyChampionKeywordListViewSet, 'enemy_champion', '.keyword'),
+        ('team-champions/', views.TeamChampionKeywordListViewSet, 'team_champions', '.keyword'),
+        ('enemy-team-champions/', views.EnemyTeamChampionKeywordListViewSet, 'enemy_team_champions', '.keyword'),
+        ('runes/', views.RunesKeywordListViewSet, 'runes', '.keyword'),
+        ('champion-items/', views.ItemsKeywordListViewSet, 'champion_items', '.keyword'),
+        ('streamers/', views.StreamerKeywordListViewSet, 'streamer', ''),
+    ]
+    # replace the read routes of the router and the duplicate checks, so they come first
+    urlpatterns = [
+        path('ytvideos/check-duplicates/', async_views.AsyncCheckDuplicateYtVideos.as_view(),
+             name='check-duplicates-ytvideos'),
+        path('ytvideos/', async_views.AsyncYtVideoListView.as_view(), name='yt_video-list'),
+        re_path(rf'^ytvideos/(?P<pk>(?!(?:{ytvideo_actions})/)[^/.]+)/$',
+                async_views.AsyncYtVideoDetailView.as_view(), name='yt_video-detail'),
+        path('ytvideos/check-duplicate/<str:ytid>/', async_views.AsyncCheckDuplicateYtVideo.as_view(),
+             name='check-duplicate-ytvideo'),
+        path('facets/', async_views.AsyncFacetsListView.as_view(), name='facets-list'),
+        path('ytvideos/league-match/opgg/', async_views.AsyncLeagueMatchOpggView.as_view(),
+             name='league-opgg-match'),
+        path('ytvideos/league-match/yt/', async_views.AsyncLeagueMatchFromYTVideoView.as_view(),
+             name='league-yt-match'),
+    ] + [
+        path(route, async_views.AsyncKeywordListView.as_view(drf_view_class=view_class, field=field,
+                                                             as_keyword=as_keyword))
+        for route, view_class, field, as_keyword in keyword_lists
+    ]
 
-urlpatterns = router.urls + [
+urlpatterns += router.urls + [
     path('ytvideos/activate/<str:pk>/', views.ActivateYtVideo.as_view(), name='activate-ytvideo'),
     path('ytvideos/deactivate/<str:pk>/', views.DeactivateYtVideo.as_view(), name='deactivate-ytvideo'),
     path('ytvideos/check-duplicate/<str:ytid>/', views.CheckDuplicateYtVideo.as_view(), name='check-duplicate-ytvideo'),
     path('ytvideos/league-match/opgg/', views.LeagueMatchAPIView.as_view(), name='league-opgg-match'),
-    path('ytvideos/league-match/yt/', views.LeagueMatchFromYTVideoAPIView.as_view(), name='league-yt-match')
+    path('ytvideos/league-match/yt/', views.LeagueMatchFromYTVideoAPIView.as_view(), name='league-yt-match'),
+    path('ytvideos/league-match/batch/', views.LeagueMatchBatchAPIView.as_view(), name='league-batch-match'),
+    path('suggest/', views.SuggestApiView.as_view(), name='suggest'),
+    path('cache-stats/', views.CacheStatsApiView.as_view(), name='cache-stats')
 ]
@@ -244,3 +244,20 @@ match_data = {
                                                      'nJUY1cgYFnr7ByIzZPnwU1qgBvvDh-dBH2v_0SyYWgJ8z_gzupD68uax4AFqzWb95MBQvoVeAdlcGA',
                                                      'fCEo9gEZvzpJ1GiNwsrMVBIW47qrqji2w1z9IiPFP5pTJ6zHLCwT_soJ_wX3TNOhi35BUZDXXlqkzg',
                                                      'Fhlzw__4uKF2NfEITuCaeAs3RpwGzrmlV6y5iSIQ6cUjxvR9rabLRxrQBux8VJUUL4ZIlWDRHQkDjQ']}}
+
+# the parts of the Data Dragon payloads of the patch of match_data that the tests read
+ddragon_items = {"data": {"1056": {"name": "Doran's Ring"}, "6653": {"name": "Liandry's Torment"},
+                          "3009": {"name": "Boots of Swiftness"}, "3340": {"name": "Stealth Ward"}}}
+ddragon_runes = [
+    {"id": 8200, "name": "Sorcery", "slots": [
+        {"runes": [{"id": 8229, "name": "Arcane Comet"}]},
+        {"runes": [{"id": 8226, "name": "Manaflow Band"}]},
+        {"runes": [{"id": 8210, "name": "Transcendence"}]},
+        {"runes": [{"id": 8236, "name": "Gathering Storm"}]}]},
+    {"id": 8300, "name": "Inspiration", "slots": [
+        {"runes": [{"id": 8345, "name": "Biscuit Delivery"}, {"id": 8304, "name": "Magical Footwear"}]}]},
+]
+ddragon_champions = {"data": {champion_id: {"id": champion_id, "name": name} for champion_id, name in [
+    ("Yorick", "Yorick"), ("LeeSin", "Lee Sin"), ("Yasuo", "Yasuo"), ("Sivir", "Sivir"), ("Ivern", "Ivern"),
+    ("Teemo", "Teemo"), ("Kaisa", "Kai'Sa"), ("KSante", "K'Sante"), ("Nunu", "Nunu & Willump"),
+]}}
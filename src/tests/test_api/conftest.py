@@ -0,0 +1,13 @@
+import pytest
+
+from api import league
+from api.ddragon import DataDragon
+from test_api.api_datasets import ddragon_items, ddragon_runes, ddragon_champions
+
+
+@pytest.fixture
+def ddragon(monkeypatch):
+    """Data Dragon of the patch of match_data, instead of the downloaded snapshot"""
+    ddragon = DataDragon.from_payloads("15.22.1", ddragon_items, ddragon_runes, ddragon_champions)
+    monkeypatch.setattr(league, "get_ddragon", lambda: ddragon)
+    return ddragon
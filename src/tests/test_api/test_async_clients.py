@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import pytest
+import requests
+
+aiohttp = pytest.importorskip("aiohttp")  # only installed with the asgi group
+
+import google_api
+from google_api import YoutubeClient, QuotaTracker
+from api import async_http, league, riot_client
+from api.riot_client import AsyncRiotClient, RateLimiter, MAX_RETRIES
+# google_api imports the sessions by their package path
+from lolstreamsearch.api import async_http as google_api_async_http
+from test_api.api_datasets import puuid
+
+
+class FakeAiohttpResponse:
+    def __init__(self, status=200, body=None, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.body = json.dumps(body).encode("utf-8") if body is not None else b""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def read(self):
+        return self.body
+
+    async def json(self):
+        return json.loads(self.body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientError(f"{self.status} error")
+
+
+class FakeAiohttpSession:
+    """returns the given responses in order, exceptions in the list are raised"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None):
+        self.calls.append((url, params))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    asyncio.sleep of the clients, the sleeps are recorded and advance the clock of the
+    rate limiter instead of being waited for
+    """
+    sleeps = []
+    clock = FakeClock()
+    sleep = asyncio.sleep
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+        await sleep(0)
+
+    monkeypatch.setattr(riot_client, "time", clock)
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return sleeps
+
+
+@pytest.fixture
+def riot_session(tmp_path, monkeypatch):
+    """the session of the async Riot client used by league, answers with the responses set on it"""
+    session = FakeAiohttpSession()
+    client = AsyncRiotClient(api_key="test", limiter=RateLimiter(state_file=tmp_path / "rate-limit.json"))
+    monkeypatch.setattr(client, "get_session", lambda: session)
+    monkeypatch.setattr(league, "get_async_riot_client", lambda: client)
+    monkeypatch.setattr(riot_client.random, "uniform", lambda a, b: 1.0 if a else 0.0)
+    return session
+
+
+class TestAsyncRiotClient:
+
+    def test_404_is_none(self, riot_session, sleeps):
+        riot_session.responses = [FakeAiohttpResponse(404)]
+        assert asyncio.run(league.afetch_summoner_puuid("Unknown", "EUW")) is None
+        assert len(riot_session.calls) == 1
+
+    def test_retries_server_errors(self, riot_session, sleeps):
+        riot_session.responses = [FakeAiohttpResponse(503), aiohttp.ClientConnectionError("reset"),
+                                  FakeAiohttpResponse(200, {"puuid": puuid})]
+        assert asyncio.run(league.afetch_summoner_puuid("Chamkin", "EUW")) == puuid
+        assert len(riot_session.calls) == 3
+        assert sleeps == [riot_client.BACKOFF_BASE, riot_client.BACKOFF_BASE * 2]
+
+    def test_429_waits_for_retry_after(self, riot_session, sleeps):
+        too_many_requests = FakeAiohttpResponse(429, headers={"Retry-After": "2", "X-Rate-Limit-Type": "method"})
+        riot_session.responses = [FakeAiohttpResponse(200, {"puuid": puuid}, {"X-Method-Rate-Limit": "100:1"}),
+                                  too_many_requests, FakeAiohttpResponse(200, {"puuid": puuid})]
+        assert asyncio.run(league.afetch_summoner_puuid("Chamkin", "EUW")) == puuid
+        assert asyncio.run(league.afetch_summoner_puuid("Chamkin", "EUW")) == puuid
+        # the blocked method limit is waited for, not slept away with a backoff
+        assert len(sleeps) == 1 and 1.5 < sleeps[0] <= 2.05
+
+    def test_gives_up_after_max_retries(self, riot_session, sleeps):
+        riot_session.responses = [FakeAiohttpResponse(500)] * (MAX_RETRIES + 1)
+        with pytest.raises(requests.HTTPError):
+            asyncio.run(league.afetch_summoner_puuid("Chamkin", "EUW"))
+        assert len(riot_session.calls) == MAX_RETRIES + 1
+
+
+@pytest.fixture
+def youtube_session(monkeypatch):
+    session = FakeAiohttpSession()
+    monkeypatch.setattr(google_api, "api_key", "test")
+    monkeypatch.setattr(google_api_async_http, "get_session", lambda *args, **kwargs: session)
+    return session
+
+
+def video(video_id):
+    return {"id": video_id, "snippet": {"title": f"title of {video_id}", "description": ""}}
+
+
+class TestAgetVideos:
+
+    def test_batches_and_caches(self, tmp_path, youtube_session, sleeps):
+        client = YoutubeClient(quota=QuotaTracker(state_file=tmp_path / "quota.json"))
+        youtube_session.responses = [FakeAiohttpResponse(200, {"items": [video("Kryc40r9wOg"), video("l_6I6LChDNk")]})]
+        videos = asyncio.run(client.aget_videos(["Kryc40r9wOg", "l_6I6LChDNk", "Kryc40r9wOg"]))
+        assert sorted(videos) == ["Kryc40r9wOg", "l_6I6LChDNk"]
+        assert youtube_session.calls[0][1]["id"] == "Kryc40r9wOg,l_6I6LChDNk"
+
+        # served from the cache
+        assert asyncio.run(client.aget_videos(["l_6I6LChDNk"]))["l_6I6LChDNk"] == videos["l_6I6LChDNk"]
+        assert len(youtube_session.calls) == 1
+        assert client.quota.spent == 1
+
+    def test_retries_server_errors(self, tmp_path, youtube_session, sleeps):
+        client = YoutubeClient(quota=QuotaTracker(state_file=tmp_path / "quota.json"))
+        youtube_session.responses = [FakeAiohttpResponse(503), FakeAiohttpResponse(200, {"items": [video("Kryc40r9wOg")]})]
+        assert "Kryc40r9wOg" in asyncio.run(client.aget_videos(["Kryc40r9wOg"]))
+        assert sleeps == [google_api.BACKOFF_FACTOR]
+        assert client.quota.spent == 2
+
+    def test_no_calls_without_quota(self, tmp_path, youtube_session, sleeps):
+        client = YoutubeClient(quota=QuotaTracker(daily_quota=100, reserve=100, state_file=tmp_path / "quota.json"))
+        assert asyncio.run(client.aget_videos(["Kryc40r9wOg"])) == {}
+        assert youtube_session.calls == []
+
+
+class TestLifespan:
+
+    def test_closes_sessions_on_shutdown(self, monkeypatch):
+        closed = []
+
+        async def close_sessions():
+            closed.append(True)
+
+        monkeypatch.setattr(async_http, "close_sessions", close_sessions)
+
+        async def application(scope, receive, send):
+            raise AssertionError("lifespan events are not passed to the application")
+
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(async_http.close_sessions_on_shutdown(application)({"type": "lifespan"}, receive, send))
+        assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        assert closed == [True]
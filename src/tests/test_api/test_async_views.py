@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import async_views
+from api.async_views import AsyncLeagueMatchOpggView, AsyncLeagueMatchFromYTVideoView, \
+    AsyncCheckDuplicateYtVideo, AsyncCheckDuplicateYtVideos
+from api.yt_es_documents import YtVideoDocument
+from test_api.api_datasets import match_data
+
+factory = APIRequestFactory()
+opgg_url = "https://op.gg/lol/summoners/euw/Chamkin-EUW/matches/KqFazGhft1WJ367iLRId1hqUYUZqfg9O20CuUS8cvCI%3D/1762466711000"
+duplicate = {"ytid": "Kryc40r9wOg", "timestamp": "1737"}
+
+
+@pytest.fixture(autouse=True)
+def no_throttling():
+    # the throttle history of the DRF views is kept in the default cache
+    cache.clear()
+
+
+def call(view_class, request, **kwargs):
+    """:return: (status, json body) of the async view"""
+    response = asyncio.run(view_class.as_view()(request, **kwargs))
+    return response.status_code, json.loads(response.content) if response.content else None
+
+
+def post(data, authenticated=True):
+    request = factory.post("/", data, format="json")
+    if authenticated:
+        force_authenticate(request, user=User(username="editor"))
+    return request
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """op.gg URLs passed to aextract_from_opgg, which finds the match of opgg_url only"""
+    urls = []
+
+    async def aextract_from_opgg(url):
+        urls.append(url)
+        if url != opgg_url:
+            return None
+        return {"riotIdGameName": "Chamkin", "gameId": match_data["info"]["gameId"]}
+
+    monkeypatch.setattr(async_views, "aextract_from_opgg", aextract_from_opgg)
+    return urls
+
+
+class TestAsyncLeagueMatchViews:
+
+    def test_opgg_url(self, extracted):
+        status, body = call(AsyncLeagueMatchOpggView, post({"opgg_url": opgg_url}))
+        assert status == 200
+        assert body["riotIdGameName"] == "Chamkin"
+
+    def test_yt_url(self, extracted, monkeypatch):
+        async def aextract_opgg_url_from_yt(yt_url):
+            return opgg_url
+
+        monkeypatch.setattr(async_views, "aextract_opgg_url_from_yt", aextract_opgg_url_from_yt)
+        status, body = call(AsyncLeagueMatchFromYTVideoView, post({"yt_url": "https://youtu.be/Kryc40r9wOg?t=1737"}))
+        assert status == 200
+        assert extracted == [opgg_url]
+
+    def test_errors(self, extracted, monkeypatch):
+        assert call(AsyncLeagueMatchOpggView, post({}))[0] == 400
+        assert call(AsyncLeagueMatchOpggView, post({"opgg_url": opgg_url.replace("Chamkin", "Unknown")}))[0] == 404
+
+        async def failing_extract(url):
+            raise RuntimeError("Riot API down")
+
+        monkeypatch.setattr(async_views, "aextract_from_opgg", failing_extract)
+        assert call(AsyncLeagueMatchOpggView, post({"opgg_url": opgg_url}))[0] == 500
+
+    def test_checks_of_the_drf_view(self, extracted):
+        assert call(AsyncLeagueMatchOpggView, post({"opgg_url": opgg_url}, authenticated=False))[0] == 401
+        assert extracted == []
+
+    def test_get_not_allowed(self):
+        assert call(AsyncLeagueMatchOpggView, factory.get("/"))[0] == 405
+
+
+@pytest.fixture
+def duplicates(monkeypatch):
+    """ytids searched with afind_duplicates, only Kryc40r9wOg is indexed"""
+    searched = []
+
+    async def afind_duplicates(ytids, timestamp=None):
+        searched.append((ytids, timestamp))
+        return {ytid: [duplicate] for ytid in ytids if ytid == duplicate["ytid"]}
+
+    monkeypatch.setattr(YtVideoDocument, "afind_duplicates", staticmethod(afind_duplicates))
+    return searched
+
+
+class TestAsyncCheckDuplicates:
+
+    def test_check_duplicate(self, duplicates):
+        status, body = call(AsyncCheckDuplicateYtVideo, factory.get("/", {"t": "1737"}), ytid="Kryc40r9wOg")
+        assert (status, body["hasDuplicates"], body["videos"]) == (200, True, [duplicate])
+        assert duplicates == [(["Kryc40r9wOg"], "1737")]
+
+        status, body = call(AsyncCheckDuplicateYtVideo, factory.get("/"), ytid="l_6I6LChDNk")
+        assert (status, body["hasDuplicates"]) == (200, False)
+
+    def test_check_duplicates(self, duplicates):
+        status, body = call(AsyncCheckDuplicateYtVideos, post({"ytids": ["Kryc40r9wOg", "l_6I6LChDNk"]}))
+        assert status == 200
+        assert body == {"hasDuplicates": True, "duplicates": {"Kryc40r9wOg": [duplicate]}}
+        assert call(AsyncCheckDuplicateYtVideos, post({"ytids": []}))[0] == 400
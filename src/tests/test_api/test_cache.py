@@ -0,0 +1,258 @@
+import asyncio
+import threading
+
+import pytest
+from django.conf import settings
+from django.db.models import F
+
+from api import cache
+from api.cache import ResultCache, VersionedCache, get_generation, bump_generation
+from lolstreamsearch.models import IndexGeneration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """generations read by this worker"""
+    generations = {}
+    monkeypatch.setattr(cache, "_generations", generations)
+    return generations
+
+
+def computed(value, calls):
+    def compute():
+        calls.append(value)
+        return value
+    return compute
+
+
+@pytest.mark.django_db
+class TestGeneration:
+
+    def test_bump(self, clock, generations):
+        assert get_generation("test") == 0
+        bump_generation("test")
+        # this worker sees its own bump right away
+        assert get_generation("test") == 1
+        bump_generation("test")
+        assert IndexGeneration.objects.get(name="test").generation == 2
+
+    def test_bump_of_another_worker(self, clock, generations):
+        bump_generation("test")
+        assert get_generation("test") == 1
+        IndexGeneration.objects.filter(name="test").update(generation=F("generation") + 1)
+        assert get_generation("test") == 1
+        clock.now += settings.YT_VIDEOS_GENERATION_TTL
+        assert get_generation("test") == 2
+
+
+@pytest.mark.django_db
+class TestVersionedCache:
+
+    def test_hits_and_misses(self, clock, generations):
+        versioned_cache = VersionedCache("test")
+        calls = []
+        assert versioned_cache.get_or_set("a", get_generation("test"), computed("a", calls)) == "a"
+        assert versioned_cache.get_or_set("a", get_generation("test"), computed("a", calls)) == "a"
+        assert versioned_cache.get_or_set("b", get_generation("test"), computed("b", calls)) == "b"
+        assert calls == ["a", "b"]
+        assert versioned_cache.stats() == {"name": "test", "size": 2, "hits": 1, "misses": 2, "hit_ratio": 1 / 3}
+
+    def test_miss_after_a_bump(self, clock, generations):
+        versioned_cache = VersionedCache("test")
+        calls = []
+        versioned_cache.get_or_set("a", get_generation("test"), computed("a0", calls))
+        bump_generation("test")
+        assert versioned_cache.get_or_set("a", get_generation("test"), computed("a1", calls)) == "a1"
+        assert versioned_cache.get_or_set("a", get_generation("test"), computed("a1", calls)) == "a1"
+        assert calls == ["a0", "a1"]
+        assert (versioned_cache.hits, versioned_cache.misses) == (1, 2)
+
+
+class TestResultCache:
+
+    def test_evicts_the_least_recently_used(self):
+        result_cache = ResultCache("test", max_size=2, ttl=60)
+        calls = []
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        result_cache.get_or_set("b", 1, computed("b", calls))
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        result_cache.get_or_set("c", 1, computed("c", calls))
+        assert calls == ["a", "b", "c"]
+
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        result_cache.get_or_set("b", 1, computed("b", calls))
+        assert calls == ["a", "b", "c", "b"]
+        assert result_cache.stats()["size"] == 2
+
+    def test_entries_expire(self, clock):
+        result_cache = ResultCache("test", max_size=10, ttl=60)
+        calls = []
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        clock.now += 60
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        assert calls == ["a"]
+        clock.now += 1
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        assert calls == ["a", "a"]
+
+    def test_entries_of_another_generation_are_dropped(self):
+        result_cache = ResultCache("test", max_size=10, ttl=60)
+        calls = []
+        result_cache.get_or_set("a", 1, computed("a1", calls))
+        assert result_cache.get_or_set("a", 2, computed("a2", calls)) == "a2"
+        assert result_cache.get_or_set("a", 2, computed("a2", calls)) == "a2"
+        assert calls == ["a1", "a2"]
+        assert result_cache.stats()["size"] == 1
+
+    def test_stats(self):
+        result_cache = ResultCache("test", max_size=1, ttl=60)
+        calls = []
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        result_cache.get_or_set("a", 1, computed("a", calls))
+        result_cache.get_or_set("b", 1, computed("b", calls))
+        assert result_cache.stats() == {"name": "test", "size": 1, "hits": 2, "misses": 2, "hit_ratio": 0.5,
+                                        "max_size": 1, "ttl": 60, "evictions": 1}
+
+
+def start(target, results):
+    def run():
+        try:
+            results.append(target())
+        except Exception as e:
+            results.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+class TestCoalescing:
+    """concurrent misses of one key, the first request (the leader) is held until released"""
+
+    def test_waiters_use_the_value_of_the_leader(self):
+        result_cache = ResultCache("test", max_size=10, ttl=5)
+        started, release, calls, results = threading.Event(), threading.Event(), [], []
+
+        def compute():
+            started.set()
+            release.wait()
+            calls.append("leader")
+            return "value"
+
+        threads = [start(lambda: result_cache.get_or_set("a", 1, compute), results)]
+        started.wait()
+        threads += [start(lambda: result_cache.get_or_set("a", 1, computed("waiter", calls)), results)
+                    for _ in range(3)]
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert calls == ["leader"]
+        assert results == ["value"] * 4
+
+    def test_a_waiter_computes_when_the_leader_raises(self):
+        result_cache = ResultCache("test", max_size=10, ttl=5)
+        started, release, calls, leader_results, waiter_results = threading.Event(), threading.Event(), [], [], []
+
+        def compute():
+            started.set()
+            release.wait()
+            raise RuntimeError("Elasticsearch down")
+
+        leader = start(lambda: result_cache.get_or_set("a", 1, compute), leader_results)
+        started.wait()
+        waiter = start(lambda: result_cache.get_or_set("a", 1, computed("waiter", calls)), waiter_results)
+        release.set()
+        leader.join()
+        waiter.join()
+        assert isinstance(leader_results[0], RuntimeError)
+        assert waiter_results == ["waiter"]
+        assert result_cache.get_or_set("a", 1, computed("again", calls)) == "waiter"
+
+    def test_a_waiter_stops_waiting_after_the_ttl(self):
+        result_cache = ResultCache("test", max_size=10, ttl=0.05)
+        started, release, calls, results = threading.Event(), threading.Event(), [], []
+
+        def compute():
+            started.set()
+            release.wait()
+            return "leader"
+
+        leader = start(lambda: result_cache.get_or_set("a", 1, compute), results)
+        started.wait()
+        assert result_cache.get_or_set("a", 1, computed("waiter", calls)) == "waiter"
+        release.set()
+        leader.join()
+        assert results == ["leader"]
+        assert result_cache.misses == 2
+
+
+class TestAsyncCoalescing:
+
+    @staticmethod
+    def run(result_cache, leader_compute, *waiter_computes):
+        """:return: results of the leader and the waiters, started once the leader computes"""
+        async def main():
+            leader = asyncio.create_task(result_cache.aget_or_set("a", 1, leader_compute))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(result_cache.aget_or_set("a", 1, compute)) for compute in waiter_computes]
+            return await asyncio.gather(leader, *waiters, return_exceptions=True)
+        return asyncio.run(main())
+
+    def test_waiters_use_the_value_of_the_leader(self):
+        result_cache = ResultCache("test", max_size=10, ttl=5)
+        calls = []
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            calls.append("leader")
+            return "value"
+
+        async def waiter():
+            calls.append("waiter")
+            return "waiter"
+
+        assert self.run(result_cache, compute, waiter, waiter, waiter) == ["value"] * 4
+        assert calls == ["leader"]
+        assert (result_cache.hits, result_cache.misses) == (3, 1)
+
+    def test_a_waiter_computes_when_the_leader_raises(self):
+        result_cache = ResultCache("test", max_size=10, ttl=5)
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("Elasticsearch down")
+
+        async def waiter():
+            return "waiter"
+
+        results = self.run(result_cache, compute, waiter)
+        assert isinstance(results[0], RuntimeError)
+        assert results[1:] == ["waiter"]
+
+    def test_a_waiter_stops_waiting_after_the_ttl(self):
+        result_cache = ResultCache("test", max_size=10, ttl=0.05)
+
+        async def compute():
+            await asyncio.sleep(0.2)
+            return "leader"
+
+        async def waiter():
+            return "waiter"
+
+        assert self.run(result_cache, compute, waiter) == ["leader", "waiter"]
+        assert result_cache.misses == 2
@@ -0,0 +1,65 @@
+from api.ddragon import DataDragon, write_snapshot, set_current_snapshot, load_snapshot
+
+items_json = {"data": {"1056": {"name": "Doran's Ring"}, "6653": {"name": "Liandry's Torment"}}}
+runes_json = [{
+    "id": 8200, "name": "Sorcery",
+    "slots": [{"runes": [{"id": 8229, "name": "Arcane Comet"}]},
+              {"runes": [{"id": 8226, "name": "Manaflow Band"}]}],
+}]
+champions_json = {"data": {
+    "KSante": {"id": "KSante", "name": "K'Sante"},
+    "Kaisa": {"id": "Kaisa", "name": "Kai'Sa"},
+    "Fiddlesticks": {"id": "Fiddlesticks", "name": "Fiddlesticks"},
+    "Nunu": {"id": "Nunu", "name": "Nunu & Willump"},
+}}
+
+
+class TestDataDragon:
+    ddragon = DataDragon.from_payloads("15.22.1", items_json, runes_json)
+
+    def test_item_names(self):
+        assert self.ddragon.get_item_name(1056) == "Doran's Ring"
+        assert self.ddragon.get_item_name(0) is None
+        assert self.ddragon.get_item_name(1) == "Unknown Item (1)"
+
+    def test_rune_names(self):
+        assert self.ddragon.get_rune_name(8229) == "Arcane Comet"
+        assert self.ddragon.get_rune_name(8200) == "Sorcery"
+        assert self.ddragon.get_rune_name(5008) == "Adaptive Force"
+        assert self.ddragon.get_rune_name(1) == "Unknown Rune (1)"
+
+    def test_champion_names(self):
+        ddragon = DataDragon.from_payloads("15.22.1", items_json, runes_json, champions_json)
+        assert ddragon.get_champion_name("KSante") == "K'Sante"
+        assert ddragon.get_champion_name("FiddleSticks") == "Fiddlesticks"
+        assert ddragon.get_champion_name("Nunu") == "Nunu Willump"
+        assert ddragon.get_champion_name("Zaahen") == "Zaahen"
+
+
+class TestSnapshot:
+
+    def test_snapshot_roundtrip(self, tmp_path):
+        payloads = {"items": items_json, "runes": runes_json, "champions": champions_json}
+        write_snapshot("15.21.1", payloads, ["15.21.1"], tmp_path)
+        set_current_snapshot("15.21.1", tmp_path)
+        write_snapshot("15.22.1", payloads, ["15.22.1", "15.21.1"], tmp_path)
+        assert load_snapshot(tmp_path).version == "15.21.1"
+
+        set_current_snapshot("15.22.1", tmp_path)
+        ddragon = load_snapshot(tmp_path)
+        assert ddragon.version == "15.22.1"
+        assert ddragon.get_item_name(6653) == "Liandry's Torment"
+        assert ddragon.get_champion_name("KaiSa") == "Kai'Sa"
+
+    def test_no_snapshot(self, tmp_path):
+        assert load_snapshot(tmp_path) is None
+
+    def test_current_is_not_a_link(self, tmp_path):
+        # a copied volume has a directory instead of the link
+        (tmp_path / "current").mkdir()
+        assert load_snapshot(tmp_path) is None
+
+        payloads = {"items": items_json, "runes": runes_json, "champions": champions_json}
+        write_snapshot("15.22.1", payloads, ["15.22.1"], tmp_path)
+        set_current_snapshot("15.22.1", tmp_path)
+        assert load_snapshot(tmp_path).version == "15.22.1"
@@ -1,16 +1,94 @@
+from datetime import timedelta
+
+import pytest
+from django.conf import settings
+from django.utils import timezone
+
 from api.league import get_summoner_puuid, get_match_info_for_player, \
     get_rune_information, get_matches_by_timestamp_range, \
     parse_opgg_match_url, get_match_by_id, extract_from_opgg
+from api import league
+from api.match_cache import MatchCache
+from lolstreamsearch.models import RiotAccount
 from test_api.api_datasets import match_data, puuid
 
 
+@pytest.fixture
+def fetched_riot_ids(monkeypatch):
+    """Riot IDs looked up at the Riot API, which only knows Chamkin#EUW"""
+    fetched = []
+
+    def fetch_summoner_puuid(game_name, tag_line):
+        fetched.append((game_name, tag_line))
+        return puuid if (game_name.lower(), tag_line.lower()) == ("chamkin", "euw") else None
+
+    monkeypatch.setattr(league, "fetch_summoner_puuid", fetch_summoner_puuid)
+    return fetched
+
+
+class FakeRiotResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeRiotClient:
+    """answers the Riot API methods with the given data and records the calls"""
+
+    def __init__(self, **data):
+        self.data = data
+        self.calls = []
+
+    def get(self, url, method, params=None):
+        self.calls.append((url, method, params))
+        return FakeRiotResponse(self.data[method])
+
+
+@pytest.fixture
+def riot_client(monkeypatch):
+    client = FakeRiotClient(**{"match-ids-by-puuid": ["EUW1_7594636490"]})
+    monkeypatch.setattr(league, "get_riot_client", lambda: client)
+    return client
+
+
+@pytest.mark.django_db
+class TestSummonerPuuid:
+
+    def test_cached_in_database(self, fetched_riot_ids):
+        assert get_summoner_puuid("Chamkin", "EUW") == puuid
+        # Riot IDs are case-insensitive
+        assert get_summoner_puuid("chamkin", "euw") == puuid
+        assert fetched_riot_ids == [("Chamkin", "EUW")]
+
+    def test_not_found_is_cached(self, fetched_riot_ids):
+        assert get_summoner_puuid("Unknown", "EUW") is None
+        assert get_summoner_puuid("Unknown", "EUW") is None
+        assert fetched_riot_ids == [("Unknown", "EUW")]
+        assert RiotAccount.objects.get(game_name="unknown", tag_line="euw").puuid is None
+
+    def test_fetched_again_after_ttl(self, fetched_riot_ids):
+        get_summoner_puuid("Chamkin", "EUW")
+        RiotAccount.objects.update(fetched_at=timezone.now() - settings.RIOT_ACCOUNT_TTL - timedelta(minutes=1))
+        assert get_summoner_puuid("Chamkin", "EUW") == puuid
+        assert len(fetched_riot_ids) == 2
+        assert RiotAccount.objects.count() == 1
+
+    def test_not_found_expires_sooner(self, fetched_riot_ids):
+        get_summoner_puuid("Unknown", "EUW")
+        RiotAccount.objects.update(fetched_at=timezone.now() - settings.RIOT_ACCOUNT_NOT_FOUND_TTL - timedelta(minutes=1))
+        get_summoner_puuid("Unknown", "EUW")
+        assert len(fetched_riot_ids) == 2
+
+
 class TestLeagueApi:
     opgg_url = "https://op.gg/lol/summoners/euw/Chamkin-EUW/matches/KqFazGhft1WJ367iLRId1hqUYUZqfg9O20CuUS8cvCI%3D/1762466711000"
 
-    def test_get_summoner_name(self):
-        name = get_summoner_puuid("Chamkin", "EUW")
-        assert name == puuid
-
     def test_parse_opgg_match_url(self):
         parsed_url_data = parse_opgg_match_url(self.opgg_url)
         assert parsed_url_data['platform'] == "euw"
@@ -18,25 +96,33 @@ class TestLeagueApi:
         assert parsed_url_data['game_name'] == "Chamkin"
         assert parsed_url_data['timestamp'] == 1762466711000
 
-    def test_get_matches_by_timestamp_range(self):
+    def test_get_matches_by_timestamp_range(self, riot_client):
         start_time = 1762466711
         end_time = 1762466711
         matches = get_matches_by_timestamp_range(puuid, start_time, end_time + 300)
         assert len(matches) == 1
         assert matches[0] == 'EUW1_7594636490'
+        url, _, params = riot_client.calls[0]
+        assert url.endswith(f"/lol/match/v5/matches/by-puuid/{puuid}/ids")
+        assert params == {'startTime': start_time, 'endTime': end_time + 300, 'count': 100}
+
+    def test_get_match_by_id(self, tmp_path, monkeypatch):
+        # served from a seeded match cache, no Riot API call
+        match_cache = MatchCache(path=tmp_path / "matches.sqlite3")
+        match_cache.put("EUW1_7594636490", match_data)
+        monkeypatch.setattr(league, "get_match_cache", lambda: match_cache)
 
-    def test_get_match_by_id(self):
         match_id = "EUW1_7594636490"
         current_match_data = get_match_by_id(match_id)
         assert 'info' in current_match_data
 
-    def test_get_rune_information(self):
+    def test_get_rune_information(self, ddragon):
         runes = get_rune_information(match_data['info']['participants'][0])
         assert runes['primary_runes'] == ['Arcane Comet', 'Manaflow Band', 'Transcendence',
                                           'Gathering Storm']
         assert runes['secondary_runes'] == ['Biscuit Delivery', 'Magical Footwear']
 
-    def test_get_match_info_for_player(self):
+    def test_get_match_info_for_player(self, ddragon):
         player_info = get_match_info_for_player(match_data, puuid)
         assert player_info is not None
         assert player_info['riotIdGameName'] == "Chamkin"
@@ -62,7 +148,7 @@ class TestLeagueApi:
             'enemyTeamMembers': [
                 {'championName': 'Kai\'Sa', 'lane': 'JUNGLE', 'individualPosition': 'Jungle', 'teamId': 200},
                 {'championName': 'K\'Sante', 'lane': 'TOP', 'individualPosition': 'Mid', 'teamId': 200},
-                {'championName': 'NunuWillump', 'lane': 'BOTTOM', 'individualPosition': 'ADC', 'teamId': 200},
+                {'championName': 'Nunu Willump', 'lane': 'BOTTOM', 'individualPosition': 'ADC', 'teamId': 200},
                 {'championName': 'Zaahen', 'lane': 'BOTTOM', 'individualPosition': 'Support', 'teamId': 200},
             ],
             'opponent': [
@@ -70,7 +156,14 @@ class TestLeagueApi:
             ]
         }
 
-    def test_extract_from_opgg(self):
+    def test_extract_from_opgg(self, riot_client, ddragon, tmp_path, monkeypatch):
+        # the Riot ID and the match are already cached, the match ids come from the fake client,
+        # Data Dragon from the ddragon fixture
+        match_cache = MatchCache(path=tmp_path / "matches.sqlite3")
+        match_cache.put("EUW1_7594636490", match_data)
+        monkeypatch.setattr(league, "get_match_cache", lambda: match_cache)
+        monkeypatch.setattr(league, "get_summoner_puuid", lambda game_name, tag_line: puuid)
+
         player_match_data = extract_from_opgg(self.opgg_url)
         assert player_match_data is not None
         assert player_match_data['riotIdGameName'] == "Chamkin"
@@ -80,8 +173,8 @@ class TestLeagueApi:
         assert player_match_data['championName'] == "Yorick"
         # if jungle, lane is None, if support lane is BOTTOM
         assert player_match_data['lane'] == "TOP"
-        # TOP, JUNGLE, MIDDLE + UTILITY
-        assert player_match_data['individualPosition'] == "TOP"
+        # TOP, JUNGLE, MIDDLE, BOTTOM, UTILITY mapped to Top, Jungle, Mid, ADC, Support
+        assert player_match_data['individualPosition'] == "Top"
         assert player_match_data['item0'] == "Doran's Ring"
         assert player_match_data['item1'] == "Liandry's Torment"
         assert player_match_data['item5'] is None
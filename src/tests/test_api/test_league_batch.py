@@ -0,0 +1,47 @@
+from api import league_batch
+from api.league_batch import resolve_league_matches
+from api.riot_client import RateLimitExceeded
+from test_api.api_datasets import match_data, puuid
+
+
+class TestLeagueBatch:
+    opgg_url = "https://op.gg/lol/summoners/euw/Chamkin-EUW/matches/KqFazGhft1WJ367iLRId1hqUYUZqfg9O20CuUS8cvCI%3D/1762466711000"
+
+    def test_resolves_every_lookup_once(self, ddragon, monkeypatch):
+        calls = []
+
+        def get_puuid(game_name, tag_line):
+            calls.append(("puuid", game_name, tag_line))
+            return puuid
+
+        def get_matches(match_puuid, start_time, end_time):
+            calls.append(("matches", start_time))
+            return ["EUW1_7594636490"]
+
+        def get_match(match_id):
+            calls.append(("match", match_id))
+            return match_data
+
+        monkeypatch.setattr(league_batch, "_get_summoner_puuid", get_puuid)
+        monkeypatch.setattr(league_batch, "get_matches_by_timestamp_range", get_matches)
+        monkeypatch.setattr(league_batch, "get_match_by_id", get_match)
+
+        same_game = self.opgg_url.replace("Chamkin-EUW", "chamkin-euw")
+        results = resolve_league_matches([self.opgg_url, same_game, "not a url"])
+
+        assert [result["status"] for result in results] == [200, 200, 400]
+        assert results[0]["data"]["riotIdGameName"] == "Chamkin"
+        assert results[2]["url"] == "not a url"
+        assert sorted(call[0] for call in calls) == ["match", "matches", "puuid"]
+
+    def test_errors_per_url(self, monkeypatch):
+        def get_puuid(game_name, tag_line):
+            if game_name == "Unknown":
+                return None
+            raise RateLimitExceeded("exhausted")
+
+        monkeypatch.setattr(league_batch, "_get_summoner_puuid", get_puuid)
+
+        unknown = self.opgg_url.replace("Chamkin-EUW", "Unknown-EUW")
+        results = resolve_league_matches([unknown, self.opgg_url])
+        assert [result["status"] for result in results] == [404, 429]
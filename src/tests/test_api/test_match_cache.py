@@ -0,0 +1,36 @@
+from api.match_cache import MatchCache
+from test_api.api_datasets import match_data
+
+
+class TestMatchCache:
+
+    def test_roundtrip(self, tmp_path):
+        cache = MatchCache(path=tmp_path / "matches.sqlite3")
+        assert cache.get("EUW1_7594636490") is None
+        cache.put("EUW1_7594636490", match_data)
+        assert cache.get("EUW1_7594636490") == match_data
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["matches"]) == (1, 1, 1)
+        assert stats["size"] < len(str(match_data))
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = MatchCache(path=tmp_path / "matches.sqlite3", max_bytes=10 ** 9)
+        for match_id in ("EUW1_1", "EUW1_2", "EUW1_3"):
+            cache.put(match_id, match_data)
+        cache.get("EUW1_1")
+        cache.max_bytes = cache.stats()["size"]
+        cache.put("EUW1_4", match_data)
+        assert cache.get("EUW1_2") is None
+        assert cache.get("EUW1_1") == match_data
+        assert cache.get("EUW1_4") == match_data
+        assert cache.stats()["evictions"] >= 1
+
+    def test_stats_shared_by_workers(self, tmp_path):
+        worker = MatchCache(path=tmp_path / "matches.sqlite3")
+        other_worker = MatchCache(path=tmp_path / "matches.sqlite3")
+        worker.put("EUW1_7594636490", match_data)
+        worker.get("EUW1_7594636490")
+        other_worker.get("EUW1_7594636490")
+        other_worker.get("EUW1_1")
+        stats = worker.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (2, 1, 2 / 3)
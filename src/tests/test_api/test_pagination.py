@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api.pagination import encode_cursor, decode_cursor, SearchAfterPagination
+
+
+class TestSearchAfterCursor:
+
+    def test_cursor_roundtrip(self):
+        sort_values = [1729526434000, "bUrhrgpg9KE_0"]
+        cursor = encode_cursor(sort_values)
+        assert decode_cursor(cursor) == sort_values
+
+    @pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor([])[:-1], "e30="])
+    def test_invalid_cursor(self, cursor):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+class FakeHit:
+    def __init__(self, position):
+        self.meta = SimpleNamespace(sort=[1729526434000 - position, f"video{position}_0"])
+        self.position = position
+
+    def serialize(self):
+        return {"id": f"video{self.position}_0"}
+
+
+class FakeResponse(list):
+    def __init__(self, hit_count, total):
+        super().__init__(FakeHit(position) for position in range(hit_count))
+        self.hits = SimpleNamespace(total=SimpleNamespace(value=min(total, 1000),
+                                                          relation="eq" if total <= 1000 else "gte"))
+
+
+class FakeSearch:
+    aggs = SimpleNamespace(to_dict=dict)
+
+    def to_dict(self):
+        return {}
+
+
+class TestGetPage:
+
+    def test_next_cursor_of_a_full_page(self):
+        # the paginator asks for one hit more than the page size
+        page = SearchAfterPagination.get_page(FakeSearch(), FakeResponse(3, total=5), page_size=2)
+        assert [video["id"] for video in page["results"]] == ["video0_0", "video1_0"]
+        assert decode_cursor(page["next_cursor"]) == [1729526434000 - 1, "video1_0"]
+
+    def test_no_next_cursor_on_the_last_page(self):
+        page = SearchAfterPagination.get_page(FakeSearch(), FakeResponse(2, total=2), page_size=2)
+        assert len(page["results"]) == 2
+        assert page["next_cursor"] is None
+
+    def test_capped_count(self):
+        page = SearchAfterPagination.get_page(FakeSearch(), FakeResponse(3, total=5000), page_size=2)
+        assert (page["count"], page["count_relation"]) == (1000, "gte")
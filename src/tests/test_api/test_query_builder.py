@@ -0,0 +1,40 @@
+from elasticsearch_dsl import Search
+
+from api.query_builder import parse_query_params, build_search, PROJECTIONS
+
+
+class TestQueryBuilder:
+
+    def test_equivalent_params_share_cache_key(self):
+        query = parse_query_params({"team_champions": "Neeko,Ezreal", "lane": "Jungle", "cursor": "abc"})
+        same_query = parse_query_params({"lane": " Jungle", "team_champions": "Ezreal,Neeko,Ezreal,"})
+        assert query == same_query
+        assert query.cache_key == same_query.cache_key
+
+    def test_unknown_params_and_invalid_values_are_dropped(self):
+        query = parse_query_params({"opponent_champion": "Volibear", "is_active": "yes", "champion": ""})
+        assert query.filters == {}
+        assert query.cache_key == parse_query_params({}).cache_key
+
+    def test_normalized_form(self):
+        query = parse_query_params({"q": "  faker   ahri ", "is_active": "1", "facets": "lane,champion,foo"})
+        assert query.canonical() == {
+            "filters": {"is_active": ["true"]},
+            "q": "faker ahri",
+            "fields": PROJECTIONS["card"],
+            "facets": ["champion", "lane"],
+        }
+
+    def test_typed_filters(self):
+        query = parse_query_params({"streamer": "b,a", "runes": "Conqueror,Triumph", "lane": "Jungle"})
+        body = build_search(Search(), query).to_dict()
+        assert body["query"]["bool"]["filter"] == [
+            {"term": {"lane": "Jungle"}},
+            {"bool": {"filter": [{"term": {"runes.keyword": "Conqueror"}},
+                                 {"term": {"runes.keyword": "Triumph"}}]}},
+            {"terms": {"streamer": ["a", "b"]}},
+        ]
+
+    def test_active_only_skips_is_active_filter(self):
+        query = parse_query_params({"is_active": "true"})
+        assert "query" not in build_search(Search(), query, active_only=True).to_dict()
@@ -0,0 +1,125 @@
+import pytest
+import requests
+
+from api import riot_client
+from api.riot_client import RateLimiter, RiotClient, RateLimitExceeded, MAX_RETRIES
+
+URL = "https://europe.api.riotgames.com/riot/account/v1/accounts/by-riot-id/Chamkin/EUW"
+APP_KEY, METHOD_KEY = RiotClient.get_rate_limit_keys(URL, "account")
+
+
+class FakeClock:
+    """time.time and time.sleep of the riot client, sleeping advances the clock"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """returns the given responses in order, exceptions in the list are raised"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(riot_client, "time", clock)
+    monkeypatch.setattr(riot_client.random, "uniform", lambda a, b: 1.0 if a else 0.0)
+    return clock
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return RateLimiter(state_file=tmp_path / "rate-limit.json", default_app_limit="2:1")
+
+
+def riot_client_with(limiter, *responses) -> RiotClient:
+    client = RiotClient(api_key="test", limiter=limiter)
+    client.session = FakeSession(*responses)
+    return client
+
+
+class TestRateLimiter:
+
+    def test_reserve_waits_for_a_refill(self, clock, limiter):
+        assert limiter.reserve(APP_KEY) == 0
+        assert limiter.reserve(APP_KEY) == 0
+        assert limiter.reserve(APP_KEY) == pytest.approx(0.5)
+        clock.now += 0.5
+        assert limiter.reserve(APP_KEY) == 0
+
+    def test_update_takes_the_counted_tokens(self, clock, limiter):
+        limiter.update(METHOD_KEY, "10:10", "9:10")
+        assert limiter.reserve(APP_KEY, METHOD_KEY) == 0
+        assert limiter.reserve(APP_KEY, METHOD_KEY) == pytest.approx(1.0)
+
+    def test_update_replaces_changed_limits(self, clock, limiter):
+        limiter.update(APP_KEY, "1:1,5:60", "1:1,1:60")
+        assert limiter.reserve(APP_KEY) == pytest.approx(1.0)
+        clock.now += 1
+        assert limiter.reserve(APP_KEY) == 0
+
+    def test_block(self, clock, limiter):
+        limiter.reserve(APP_KEY)
+        limiter.block(APP_KEY, 5)
+        assert limiter.reserve(APP_KEY) == pytest.approx(5)
+        clock.now += 5
+        assert limiter.reserve(APP_KEY) == 0
+
+
+class TestRiotClient:
+
+    def test_404_is_returned(self, clock, limiter):
+        client = riot_client_with(limiter, FakeResponse(404))
+        assert client.get(URL, "account").status_code == 404
+        assert client.session.calls == 1
+
+    def test_retries_server_errors(self, clock, limiter):
+        client = riot_client_with(limiter, FakeResponse(503), requests.ConnectionError("reset"), FakeResponse(200))
+        assert client.get(URL, "account").status_code == 200
+        assert client.session.calls == 3
+        assert clock.sleeps[:2] == [riot_client.BACKOFF_BASE, riot_client.BACKOFF_BASE * 2]
+
+    def test_429_waits_for_retry_after(self, clock, limiter):
+        too_many_requests = FakeResponse(429, {"Retry-After": "3", "X-Rate-Limit-Type": "application",
+                                               "X-App-Rate-Limit": "100:1", "X-App-Rate-Limit-Count": "100:1"})
+        client = riot_client_with(limiter, too_many_requests, FakeResponse(200))
+        assert client.get(URL, "account").status_code == 200
+        assert sum(clock.sleeps) >= 3
+
+    def test_gives_up_after_max_retries(self, clock, limiter):
+        client = riot_client_with(limiter, *[FakeResponse(500)] * (MAX_RETRIES + 1))
+        assert client.get(URL, "account").status_code == 500
+        assert client.session.calls == MAX_RETRIES + 1
+
+    def test_rate_limit_exceeded(self, clock, limiter, monkeypatch):
+        monkeypatch.setattr(riot_client, "MAX_RATE_LIMIT_WAIT", 1)
+        limiter.reserve(APP_KEY)
+        limiter.block(APP_KEY, 30)
+        client = riot_client_with(limiter)
+        with pytest.raises(RateLimitExceeded):
+            client.get(URL, "account")
@@ -0,0 +1,100 @@
+import pytest
+
+import google_api
+from google_api import YoutubeClient, QuotaTracker, MAX_IDS_PER_REQUEST, PART_CACHE_TTL
+
+
+class FakeClock:
+    """time.monotonic and time.sleep of google_api, sleeping advances the clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeVideos:
+    """videos() of the YouTube connection, answers every videos.list with the requested videos"""
+
+    def __init__(self):
+        self.calls = []
+
+    def list(self, part, id, maxResults):
+        self.calls.append((part, id.split(",")))
+        items = [{"id": video_id, **{name: {"of": video_id} for name in part.split(",")}}
+                 for video_id in id.split(",")]
+        return FakeRequest({"items": items})
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeConnection:
+    def __init__(self):
+        self.fake_videos = FakeVideos()
+
+    def videos(self):
+        return self.fake_videos
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(google_api, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def videos(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(google_api, "get_yt_connection", lambda: connection)
+    return connection.fake_videos
+
+
+@pytest.fixture
+def client(tmp_path):
+    return YoutubeClient(quota=QuotaTracker(state_file=tmp_path / "quota.json"))
+
+
+class TestGetVideos:
+
+    def test_chunks_the_ids(self, clock, videos, client):
+        video_ids = [f"video{i:04}" for i in range(MAX_IDS_PER_REQUEST * 2 + 1)]
+        result = client.get_videos(video_ids + video_ids[:3])
+        assert sorted(result) == video_ids
+        assert [len(ids) for part, ids in videos.calls] == [MAX_IDS_PER_REQUEST, MAX_IDS_PER_REQUEST, 1]
+        assert client.quota.spent == 3
+
+    def test_caches_each_part(self, clock, videos, client):
+        client.get_videos(["Kryc40r9wOg"], parts=("snippet", "statistics"))
+        assert client.get_videos(["Kryc40r9wOg"], parts=("snippet",))["Kryc40r9wOg"]["snippet"] == {"of": "Kryc40r9wOg"}
+        assert len(videos.calls) == 1
+
+        # the statistics expire before the snippet
+        clock.now += PART_CACHE_TTL["statistics"] + 1
+        client.get_videos(["Kryc40r9wOg"], parts=("snippet",))
+        assert len(videos.calls) == 1
+        client.get_videos(["Kryc40r9wOg"], parts=("statistics",))
+        assert videos.calls[1] == ("statistics", ["Kryc40r9wOg"])
+
+    def test_serves_the_cache_without_quota(self, clock, videos, tmp_path):
+        client = YoutubeClient(quota=QuotaTracker(daily_quota=3, reserve=1, state_file=tmp_path / "quota.json"))
+        client.get_videos(["Kryc40r9wOg", "l_6I6LChDNk"], parts=("statistics",))
+        client.get_videos(["l_6I6LChDNk"], parts=("snippet",))
+        assert client.quota.spent == 2
+
+        # outdated statistics are served once only the reserve is left
+        clock.now += PART_CACHE_TTL["statistics"] + 1
+        result = client.get_videos(["Kryc40r9wOg", "l_6I6LChDNk", "3hGLxZMyKRI"], parts=("statistics",))
+        assert sorted(result) == ["Kryc40r9wOg", "l_6I6LChDNk"]
+        assert len(videos.calls) == 2
+        assert client.get_videos(["Kryc40r9wOg"], parts=("snippet",)) == {}
@@ -0,0 +1,13 @@
+from api.yt_es_documents import YtVideoDocument
+
+
+class TestFindDuplicates:
+
+    def test_merge_keeps_all_timestamps_once(self):
+        at_timestamp = ("Kryc40r9wOg_1737", {"ytid": "Kryc40r9wOg", "timestamp": "1737"})
+        other_timestamp = ("Kryc40r9wOg_0", {"ytid": "Kryc40r9wOg", "timestamp": "0"})
+        other_video = ("l_6I6LChDNk_0", {"ytid": "l_6I6LChDNk", "timestamp": "0"})
+
+        duplicates = YtVideoDocument._merge_duplicates([at_timestamp], [other_timestamp, at_timestamp, other_video])
+        assert [video["timestamp"] for video in duplicates["Kryc40r9wOg"]] == ["1737", "0"]
+        assert len(duplicates["l_6I6LChDNk"]) == 1
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from django.core.management import call_command
+
+# the refresh_yt_stats command imports the module by its package path
+from lolstreamsearch.api import yt_stats
+from google_api import MAX_IDS_PER_REQUEST
+
+
+def hit(number, ytid=None):
+    return SimpleNamespace(meta=SimpleNamespace(id=f"doc{number}", index="ytvideos"),
+                           ytid=ytid or f"video{number:04}")
+
+
+class FakeSearch:
+    def __init__(self, hits):
+        self.hits = hits
+        self.filters = []
+
+    def source(self, fields):
+        return self
+
+    def filter(self, query):
+        self.filters.append(query.to_dict())
+        return self
+
+    def scan(self):
+        return iter(self.hits)
+
+
+@pytest.fixture
+def index(monkeypatch):
+    """the indexed videos, their statistics on YouTube and the calls to YouTube and bulk"""
+    index = SimpleNamespace(search=FakeSearch([]), statistics={}, requested=[], actions=[])
+
+    def get_yt_video_statistics(video_ids):
+        index.requested.append(video_ids)
+        return {video_id: index.statistics[video_id] for video_id in video_ids if video_id in index.statistics}
+
+    def bulk(connection, actions, raise_on_error=True):
+        index.actions += actions
+        return len(actions), []
+
+    monkeypatch.setattr(yt_stats.YtVideoDocument, "search", lambda: index.search)
+    monkeypatch.setattr(yt_stats.YtVideoDocument, "_get_connection", lambda: None)
+    monkeypatch.setattr(yt_stats, "get_yt_video_statistics", get_yt_video_statistics)
+    monkeypatch.setattr(yt_stats, "bulk", bulk)
+    return index
+
+
+class TestRefreshVideoStatistics:
+
+    def test_batches(self, index):
+        index.search.hits = [hit(i) for i in range(MAX_IDS_PER_REQUEST + 1)]
+        index.statistics = {h.ytid: {"views": 10, "likes": 1} for h in index.search.hits}
+        assert yt_stats.refresh_video_statistics() == MAX_IDS_PER_REQUEST + 1
+        assert [len(ids) for ids in index.requested] == [MAX_IDS_PER_REQUEST, 1]
+        assert index.search.filters == []
+
+    def test_update_actions(self, index):
+        index.search.hits = [hit(1), hit(2), hit(3, ytid="deleted")]
+        index.statistics = {"video0001": {"views": 10, "likes": 1}, "video0002": {"views": 20, "likes": 2}}
+        assert yt_stats.refresh_video_statistics() == 3
+        actions = {action["_id"]: action for action in index.actions}
+        assert actions["doc1"]["_op_type"] == "update"
+        assert actions["doc1"]["_index"] == "ytvideos"
+        assert actions["doc2"]["doc"]["views"] == 20 and actions["doc2"]["doc"]["likes"] == 2
+        # the deleted video keeps its counts and isn't scanned again before the max age
+        assert set(actions["doc3"]["doc"]) == {"stats_updated_at"}
+
+    def test_nothing_is_stamped_without_an_answer(self, index):
+        index.search.hits = [hit(1), hit(2)]
+        assert yt_stats.refresh_video_statistics() == 0
+        assert index.actions == []
+
+    def test_max_age(self, index):
+        yt_stats.refresh_video_statistics(max_age=timedelta(hours=6))
+        should = index.search.filters[0]["bool"]["should"]
+        assert {"bool": {"must_not": [{"exists": {"field": "stats_updated_at"}}]}} in should
+        updated_before = next(query["range"]["stats_updated_at"]["lt"] for query in should if "range" in query)
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(updated_before)
+        assert timedelta(hours=6) <= age < timedelta(hours=6, minutes=1)
+
+
+class TestRefreshYtStatsCommand:
+
+    def test_max_age_hours(self, index):
+        index.search.hits = [hit(1)]
+        index.statistics = {"video0001": {"views": 10, "likes": 1}}
+        call_command("refresh_yt_stats", "--max-age-hours", "6")
+        assert index.requested == [["video0001"]]
+        assert len(index.search.filters) == 1
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the helpers are standalone scripts that import each other by module name (from fill_db import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "lolstreamsearch" / "helper"))
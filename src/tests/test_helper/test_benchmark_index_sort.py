@@ -0,0 +1,9 @@
+from helper.benchmark_index_sort import synthetic_documents
+from helper.fill_db import prepare_document
+
+
+class TestBenchmarkIndexSort:
+
+    def test_synthetic_documents_can_be_indexed(self):
+        doc_ids = [prepare_document(document)[0] for document in synthetic_documents(1000)]
+        assert len(set(doc_ids)) == 1000
@@ -0,0 +1,25 @@
+import json
+
+from helper.fill_db import iter_batches, prepare_document
+
+
+class TestFillDb:
+
+    def test_prepare_document(self):
+        doc_id, source = prepare_document({"video_url": "https://youtu.be/Kryc40r9wOg?t=1737"})
+        assert doc_id == "Kryc40r9wOg_1737"
+        assert source["ytid"] == "Kryc40r9wOg"
+        assert source["id"] == doc_id
+
+    def test_bad_rows_are_skipped(self):
+        documents = [
+            {"video_url": "https://www.youtube.com/watch?v=Kryc40r9wOg&t=1737s"},
+            {"video_url": "https://www.youtube.com/watch?v=short"},
+            {"title": "no url"},
+            {"video_url": "https://youtu.be/l_6I6LChDNk"},
+        ]
+        skipped = []
+        batches = list(iter_batches(iter(documents), "videos", batch_size=500, skipped=skipped))
+        assert len(skipped) == 2
+        ids = [json.loads(line.split("\n")[0])["index"]["_id"] for line in batches[0]]
+        assert ids == ["Kryc40r9wOg_1737", "l_6I6LChDNk_0"]
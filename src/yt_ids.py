@@ -0,0 +1,56 @@
+"""
+YouTube video ids and document ids, without dependencies, so the standalone helpers
+(fill_db, the benchmark) can use them without Django or the Google API client.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_yt_url(url):
+    """
+    handles youtube video URL and returns the YouTube ID and timestamp
+    two possible formats: https://youtu.be/Kryc40r9wOg?feature=shared&t=1737
+    or:                   https://www.youtube.com/watch?v=Kryc40r9wOg&t=1737s
+
+    :return: (video id, timestamp)
+    :raises ValueError: if the URL has no valid video id
+    """
+    logger.debug("Getting YouTube ID and timestamp from url: %s", url)
+    timestamp = 0
+    video_id = None
+
+    try:
+        if "youtu.be" in url:
+            # Handle short format
+            path = url.split("youtu.be/")[1]
+            video_id = path
+            if "?" in path:
+                video_id = path.split("?")[0]
+                query_params = path.split("?")[1]
+                for param in query_params.split("&"):
+                    if param.startswith("t="):
+                        timestamp = param.split("=")[1].rstrip("s")
+        else:
+            # Handle long format
+            query_params = url.split("?", 1)[1]
+            for param in query_params.split("&"):
+                if param.startswith("v="):
+                    video_id = param.split("=")[1]
+                elif param.startswith("t="):
+                    timestamp = param.split("=")[1].rstrip("s")
+
+        if not video_id or len(video_id) != 11:
+            raise ValueError("Invalid YouTube video ID")
+
+        return video_id, timestamp
+    except (IndexError, KeyError, TypeError):
+        raise ValueError("Invalid YouTube URL structure")
+
+
+def get_yt_document_id(ytid: str, timestamp) -> str:
+    """
+    deterministic Elasticsearch document id of a video at a timestamp,
+    e.g. Kryc40r9wOg_1737, so the same video and timestamp is never indexed twice
+    """
+    return f"{ytid}_{timestamp or 0}"